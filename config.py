@@ -44,6 +44,12 @@ DEBUG = bool(strtobool(env('APP_DEBUG', 'False')))
 # update the template code in the browser.
 TEMPLATES_AUTO_RELOAD = True if DEBUG is True else False
 
+# Web Processes
+#
+# Number of uwsgi processes serving the application (see entrypoint.sh), each
+# one serves a single request at a time.
+PROCESSES = int(env('APP_PROCESSES', 8))
+
 # Default Database Connection
 #
 # Here is the database connection is specified, currently the application
@@ -85,13 +91,33 @@ else:
 # - REMOTE : Remote repository url
 # - PATH : Where the meta repository is cloned (if development is local)
 # - DEPLOYMENT : mode of deployment (local, sidecar)
+# - WATCH : in local deployments, watch ELECDIR and reload the elections
+#   edited in place (previewing an election)
+# - ATOMIC : check every revision out in its own directory and flip PATH
+#   (a symlink) to it once complete, instead of pulling in place. A plain
+#   clone already at PATH is moved to PATH.plain on the first pull
+# - SHALLOW : clone and fetch only the tip of BRANCH, without the history and
+#   the blobs, and check out nothing but ELECDIR (large meta repositories)
+# - SKIPDIRS : directories of ELECDIR (names or relative paths) never searched
+#   for elections, ie: archives or asset folders
+# - STORE : where the meta is read from (fs: the working tree, git: the git
+#   objects of REVISION - default BRANCH - without a checkout)
+# - SNAPSHOT : where the sync writes the compiled meta shared by all the
+#   workers, the workers parse the meta themselves when it is not set
 META = {
     'REMOTE': env('META_REPO'),
     'ELECDIR': env('ELECTION_DIR'),
+    'SKIPDIRS': [d.strip() for d in env('ELECTION_SKIP_DIRS', '').split(',') if d.strip()],
     'PATH': env('META_PATH', 'meta'),
     'DEPLOYMENT': env('META_DEPLOYMENT', 'local'),
+    'WATCH': bool(strtobool(env('META_WATCH', 'False'))),
     'BRANCH': env('META_BRANCH', 'main'),
-    'SECRET': env('META_SECRET')
+    'SECRET': env('META_SECRET'),
+    'ATOMIC': bool(strtobool(env('META_ATOMIC', 'False'))),
+    'SHALLOW': bool(strtobool(env('META_SHALLOW', 'False'))),
+    'STORE': env('META_STORE', 'fs'),
+    'REVISION': env('META_REVISION'),
+    'SNAPSHOT': env('META_SNAPSHOT'),
 }
 
 # Third Party Integrations
@@ -105,4 +131,48 @@ GITHUB = {
     'scope': 'user:login,name',
 }
 
-PASSCODE_LENGTH = env('MIN_PASSCODE_LENGTH', 6)
\ No newline at end of file
+PASSCODE_LENGTH = env('MIN_PASSCODE_LENGTH', 6)
+
+# Authentication
+#
+# The session carries the authenticated user (id, token fingerprint and
+# expiry), the user's token is checked against the database only every
+# AUTH_REVALIDATE minutes and on the sensitive requests (votes, edits and
+# admin pages). 0 checks the token on every request.
+AUTH_REVALIDATE = int(env('AUTH_REVALIDATE', 5))
+
+# Ballot encryption
+#
+# At most KDF_WORKERS Argon2 key derivations of the ballots run at once on
+# the host, whatever the number of web workers, with at most KDF_QUEUE more
+# waiting for them. The ones beyond are answered with a 503 asking the
+# voter to retry after KDF_RETRY_AFTER seconds. Keeps the cheap pages
+# responsive during spikes. The processes share the lock files of KDF_LOCKS.
+#
+# KDF_WORKERS + KDF_QUEUE must stay below APP_PROCESSES, a waiting
+# derivation holds its web process too. The pool caps them to leave at
+# least one process free, by default they take half of the processes.
+KDF_WORKERS = int(env('KDF_WORKERS', 2))
+KDF_QUEUE = int(env('KDF_QUEUE', max(PROCESSES // 2 - KDF_WORKERS, 0)))
+KDF_RETRY_AFTER = int(env('KDF_RETRY_AFTER', 5))
+KDF_LOCKS = env('KDF_LOCKS')  # default: elekto-kdf in the temporary directory
+
+# Argon2i limits of the ballot keys, an election.yaml may set its own with
+# kdf_opslimit and kdf_memlimit. The limits are stored with every vote, so
+# they can change without breaking the votes already cast. Recommended
+# values for the host are given by `./console --calibrate`.
+KDF_OPSLIMIT = int(env('KDF_OPSLIMIT', 4))
+KDF_MEMLIMIT = int(env('KDF_MEMLIMIT', 33554432))
+
+# Rate limits
+#
+# Token buckets of the requests deriving a ballot key, by user and route,
+# '<requests>/<seconds>' (empty or 0 to not limit). The buckets are kept in
+# the process (memory) or in the database so they hold across the uwsgi
+# processes (database). Throttled requests are answered with a 429.
+RATE_LIMIT = {
+    'STORE': env('RATE_LIMIT_STORE', 'memory'),
+    'VOTE': env('RATE_LIMIT_VOTE', '5/60'),
+    'VIEW': env('RATE_LIMIT_VIEW', '10/60'),
+    'EDIT': env('RATE_LIMIT_EDIT', '5/60'),
+}
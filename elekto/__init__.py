@@ -17,15 +17,21 @@
 import flask as F
 from flask_wtf.csrf import CSRFProtect
 
+from elekto.core import encryption
 from elekto.models import sql
 
 APP = F.Flask(__name__)
 APP.config.from_object('config')
 csrf = CSRFProtect(APP)
 SESSION = sql.create_session(APP.config.get('DATABASE_URL'))  # database
+encryption.configure(APP.config['KDF_WORKERS'], APP.config['KDF_QUEUE'], APP.config['KDF_LOCKS'],
+                     APP.config['PROCESSES'])
 
 from elekto.models import meta  # noqa - imports SESSION from here
 from elekto import utils  # noqa - imports SESSION from here
+from elekto.models.watcher import MetaWatcher  # noqa
+
+WATCHER = MetaWatcher()  # reloads a local meta edited in place
 
 
 @APP.before_request
@@ -39,6 +45,9 @@ def before_request():
     if APP.config.get('DEBUG') or 'localhost' in F.request.host_url:
         APP.jinja_env.cache = {}
 
+    if MetaWatcher.enabled(APP.config['META']):
+        WATCHER.start()
+
     # Set Session
     utils.set_session(APP)
 
@@ -17,6 +17,7 @@
 # Application's CSRF Security
 CSRF_STATE = 'state'
 AUTH_STATE = 'authentication'
+AUTH_CLAIM = 'claim'
 
 # Github Endpoints
 GITHUB_AUTHORIZE = 'https://github.com/login/oauth/authorize'
@@ -28,6 +29,7 @@ GITHUB_PROFILE = 'https://api.github.com/user'
 ELEC_STAT_COMPLETED = 'completed'
 ELEC_STAT_RUNNING = 'running'
 ELEC_STAT_UPCOMING = 'upcoming'
+ELEC_PER_PAGE = 20  # elections per page of the listings
 
 # Candidates attribiutes related constants
 CAND_START_DEL = '--n'
@@ -23,6 +23,7 @@ from authlib.integrations.requests_client import OAuth2Session
 from elekto import constants, APP, SESSION
 from elekto.models.sql import User
 from elekto.middlewares.auth import authenticated, csrf_guard, auth_guard
+from elekto.utils import forget_user
 
 
 def oauth_session(vendor):
@@ -56,9 +57,11 @@ def render_login_page():
 @auth_guard
 def logout():
     # Remove the authentication token from user
-    F.g.user.token = None
-    F.g.user.token_expires_at = None
+    user = SESSION.query(User).get(F.g.user.id)
+    user.token = None
+    user.token_expires_at = None
     SESSION.commit()
+    forget_user(user.id)
 
     # Remove the authentication token from current session
     F.session.pop(constants.AUTH_STATE)
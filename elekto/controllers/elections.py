@@ -24,51 +24,93 @@ import string
 import flask as F
 
 from nacl import utils, pwhash
+from sqlalchemy.exc import IntegrityError
 
 from elekto import constants, APP, SESSION
 from elekto.models import meta
+from elekto.models.utils import listing
+from elekto.models.voting import has_voted, cast_ballots, ballot_of, revoke_ballots, voted_count, eligible_count, last_voted_at, not_voted
+from elekto.utils import forget_past_elections, meta_election, sql_election
 from elekto.core.election import Election as CoreElection
-from elekto.models.sql import Election, Ballot, Voter, Request
+from elekto.models.sql import Election, Voter, Request
 from elekto.middlewares.auth import auth_guard, len_guard
-from elekto.core.encryption import encrypt, decrypt
+from elekto.middlewares.limit import rate_guard
+from elekto.core.encryption import Busy, OPSLIMIT, MEMLIMIT, encrypt, decrypt
 from elekto.middlewares.election import *  # noqa
 
 
 @APP.route("/app")
 @auth_guard
 def app():
-    running = meta.Election.where("status", constants.ELEC_STAT_RUNNING)
+    running = (
+        SESSION.query(Election)
+        .filter(Election.with_status(constants.ELEC_STAT_RUNNING))
+        .order_by(Election.start_datetime.desc())
+        .all()
+    )
+
+    pending = [e for e in eligible_elections(F.g.user)
+               if e["status"] == constants.ELEC_STAT_RUNNING and not e["voted"]]
+
+    return F.render_template("views/dashboard.html", running=[e.listing() for e in running], pending=pending)
+
+
+@APP.route("/app/eligible")  # Elections the user is eligible for (JSON)
+@auth_guard
+def elections_eligible():
+    return F.jsonify({
+        "username": F.g.user.username,
+        "elections": eligible_elections(F.g.user),
+    })
+
+
+def eligible_elections(user):
+    """
+    List the elections the user is eligible for, from the eligibility index
+    built by the sync
 
-    return F.render_template("views/dashboard.html", running=running)
+    Args:
+        user (User): the user
+
+    Returns:
+        list: elections as listed, with whether the user has voted
+    """
+    keys = meta.Election.eligible_for(user.username)
+    if not keys:
+        return []
+
+    voted = {eid for (eid,) in SESSION.query(Voter.election_id).filter(Voter.user_id == user.id)}
+    query = SESSION.query(Election).filter(Election.key.in_(keys)).order_by(Election.start_datetime.desc())
+
+    return [dict(e.listing(), voted=e.id in voted) for e in query]
 
 
 @APP.route("/app/elections")  # Election listing
 @auth_guard
 def elections():
     status = F.request.args.get("status")
-    res = (
-        meta.Election.all() if status is None else meta.Election.where("status", status)
-    )
-    res.sort(key=lambda e: e["start_datetime"], reverse=True)
+    page = F.request.args.get("page", 1, type=int)
+    res, page, pages = listing(SESSION, status, page)
 
-    return F.render_template("views/elections/index.html", elections=res, status=status)
+    return F.render_template("views/elections/index.html", elections=res, status=status,
+                             page=page, pages=pages)
 
 
 @APP.route("/app/elections/<eid>")  # Particular Election
 @auth_guard
 def elections_single(eid):
     try:
-        election = meta.Election(eid)
+        election = meta_election(eid)
         candidates = election.candidates()
         voters = election.voters()
-        e = SESSION.query(Election).filter_by(key=eid).first()
+        e = sql_election(eid)
 
         return F.render_template(
             "views/elections/single.html",
             election=election.get(),
             candidates=candidates,
             voters=voters,
-            voted=[v.user_id for v in e.voters],
+            voted=has_voted(SESSION, F.g.user, e),
         )
     except Exception as err:
         return F.render_template(
@@ -81,7 +123,7 @@ def elections_single(eid):
 @APP.route("/app/elections/<eid>/candidates/<cid>")  # Particular Candidate
 @auth_guard
 def elections_candidate(eid, cid):
-    election = meta.Election(eid)
+    election = meta_election(eid)
     candidate = election.candidate(cid)
 
     return F.render_template(
@@ -91,24 +133,27 @@ def elections_candidate(eid, cid):
 
 @APP.route("/app/elections/<eid>/vote", methods=["GET", "POST"])
 @auth_guard
+@rate_guard('VOTE')
 @voter_guard
 @len_guard
 def elections_voting_page(eid):
-    election = meta.Election(eid)
+    election = meta_election(eid)
     candidates = election.candidates()
     voters = election.voters()
-    e = SESSION.query(Election).filter_by(key=eid).first()
+    e = sql_election(eid)
 
-    # Redirect to thankyou page if already voted
-    if F.g.user.id in [v.user_id for v in e.voters]:
-        return F.render_template(
-            "errors/message.html",
-            title="You have already voted",
-            message="To re-cast your vote, please visit\
-                                 the election page.",
-        )
+    # Redirect to thankyou page if already voted, a vote being cast is
+    # checked by the unique (election_id, user_id) of the voters instead
+    if F.request.method != "POST" and has_voted(SESSION, F.g.user, e):
+        return already_voted()
 
     if F.request.method == "POST":
+        try:
+            ranks = {k.split("@")[-1]: int(v) for k, v in F.request.form.items()
+                     if k.split("@")[0] == "candidate"}
+        except ValueError:
+            return F.abort(400)
+
         passcode = "".join(secrets.choice(string.digits) for i in range(6))
         if len(F.request.form["password"]):
             passcode = F.request.form["password"]
@@ -116,20 +161,22 @@ def elections_voting_page(eid):
         # encrypt ballot.voter with passcode
         salt = utils.random(pwhash.argon2i.SALTBYTES)
         ballot_voter = str(uuid.uuid4())
-        ballot_id = encrypt(salt, passcode, ballot_voter)
-
-        voter = Voter(user_id=F.g.user.id, salt=salt, ballot_id=ballot_id)
-
-        for k in F.request.form.keys():
-            if k.split("@")[0] == "candidate":
-                candidate = k.split("@")[-1]
-                rank = F.request.form[k]
-                ballot = Ballot(rank=rank, candidate=candidate, voter=ballot_voter)
-                e.ballots.append(ballot)
-
-        # Add user to the voted list
-        e.voters.append(voter)
+        opslimit, memlimit = election.kdf()
+        ballot_id = encrypt(salt, passcode, ballot_voter, opslimit, memlimit)
+
+        # Add user to the voted list, fails if the user has already voted
+        # (or another request of the user is casting a vote right now)
+        SESSION.add(Voter(election_id=e.id, user_id=F.g.user.id, salt=salt, ballot_id=ballot_id,
+                          kdf_opslimit=opslimit, kdf_memlimit=memlimit))
+        try:
+            SESSION.flush()
+        except IntegrityError:
+            SESSION.rollback()
+            return already_voted(), 409
+
+        cast_ballots(SESSION, e, ballot_voter, ranks)
         SESSION.commit()
+        forget_past_elections()
         return F.redirect(F.url_for("elections_confirmation_page", eid=eid))
 
     return F.render_template(
@@ -141,23 +188,45 @@ def elections_voting_page(eid):
     )
 
 
+def voter_kdf(voter):
+    """
+    Argon2i limits the voter's ballot id was encrypted with, the votes cast
+    before they were stored used the interactive limits
+    """
+    return (voter.kdf_opslimit or OPSLIMIT, voter.kdf_memlimit or MEMLIMIT)
+
+
+def already_voted():
+    return F.render_template(
+        "errors/message.html",
+        title="You have already voted",
+        message="To re-cast your vote, please visit\
+                             the election page.",
+    )
+
+
 @APP.route("/app/elections/<eid>/vote/view", methods=["POST"])
 @auth_guard
+@rate_guard('VIEW')
 @voter_guard
 @has_voted_condition
 def elections_view(eid):
-    election = meta.Election(eid)
+    election = meta_election(eid)
     voters = election.voters()
-    e = SESSION.query(Election).filter_by(key=eid).first()
+    e = sql_election(eid)
     voter = SESSION.query(Voter).filter_by(user_id=F.g.user.id,election_id=e.id).first()
 
     passcode = F.request.form["password"]
 
     try:
         # decrypt ballot_id if passcode is correct
-        ballot_voter = decrypt(voter.salt, passcode, voter.ballot_id)
-        ballots = SESSION.query(Ballot).filter_by(voter=ballot_voter)
-        return F.render_template("views/elections/view_ballots.html", election=election.get(), voters=voters, voted=[v.user_id for v in e.voters], ballots=ballots)
+        ballot_voter = decrypt(voter.salt, passcode, voter.ballot_id, *voter_kdf(voter))
+        ballots = ballot_of(SESSION, e, ballot_voter, [c['key'] for c in election.candidates()])
+        return F.render_template("views/elections/view_ballots.html", election=election.get(), voters=voters, voted=True, ballots=ballots)
+
+    # the encryption queue is full, answered by the error handler
+    except Busy:
+        raise
 
     # if passcode is wrong
     except Exception:
@@ -170,26 +239,23 @@ def elections_view(eid):
 
 @APP.route("/app/elections/<eid>/vote/edit", methods=["POST"])
 @auth_guard
+@rate_guard('EDIT')
 @voter_guard
 @has_voted_condition
 def elections_edit(eid):
-    election = meta.Election(eid)
-    e = SESSION.query(Election).filter_by(key=eid).first()
+    election = meta_election(eid)
+    e = sql_election(eid)
     voter = SESSION.query(Voter).filter_by(user_id=F.g.user.id,election_id=e.id).first()
 
     passcode = F.request.form["password"]
 
     try:
         # decrypt ballot_id if passcode is correct
-        ballot_voter = decrypt(voter.salt, passcode, voter.ballot_id)
-        ballots = SESSION.query(Ballot).filter_by(voter=ballot_voter)
-        for b in ballots:
-            SESSION.delete(b)
+        ballot_voter = decrypt(voter.salt, passcode, voter.ballot_id, *voter_kdf(voter))
 
-        SESSION.delete(voter)
-        SESSION.commit()
-        F.flash("The old ballot is sucessfully deleted, please re-cast the ballot.")
-        return F.redirect(F.url_for("elections_single", eid=eid))
+    # the encryption queue is full, answered by the error handler
+    except Busy:
+        raise
 
     # if passcode is wrong
     except Exception:
@@ -199,14 +265,20 @@ def elections_edit(eid):
         )
         return F.redirect(F.url_for("elections_single", eid=eid))
 
+    revoke_ballots(SESSION, e, voter, ballot_voter)
+    SESSION.commit()
+    forget_past_elections()
+    F.flash("The old ballot is sucessfully deleted, please re-cast the ballot.")
+    return F.redirect(F.url_for("elections_single", eid=eid))
+
 
 @APP.route("/app/elections/<eid>/confirmation", methods=["GET"])
 @auth_guard
 def elections_confirmation_page(eid):
-    election = meta.Election(eid)
-    e = SESSION.query(Election).filter_by(key=eid).first()
+    election = meta_election(eid)
+    e = sql_election(eid)
 
-    if F.g.user.id in [v.user_id for v in e.voters]:
+    if has_voted(SESSION, F.g.user, e):
         return F.render_template(
             "views/elections/confirmation.html", election=election.get()
         )
@@ -218,7 +290,7 @@ def elections_confirmation_page(eid):
 @auth_guard
 @has_completed_condition
 def elections_results(eid):
-    election = meta.Election(eid)
+    election = meta_election(eid)
 
     return F.render_template("views/elections/results.html", election=election.get())
 
@@ -228,8 +300,8 @@ def elections_results(eid):
 @auth_guard
 @exception_guard
 def elections_exception(eid):
-    election = meta.Election(eid)
-    e = SESSION.query(Election).filter_by(key=eid).first()
+    election = meta_election(eid)
+    e = sql_election(eid)
     req = (
         SESSION.query(Request)
         .join(Request, Election.requests)
@@ -274,18 +346,25 @@ def elections_exception(eid):
 @auth_guard
 @admin_guard
 def elections_admin(eid):
-    election = meta.Election(eid)
-    e = SESSION.query(Election).filter_by(key=eid).first()
+    election = meta_election(eid)
+    e = sql_election(eid)
+
+    # turnout, from the eligible voters synced from the meta
+    voted = voted_count(SESSION, e)
+    eligible = eligible_count(SESSION, e)
+    pending = not_voted(SESSION, e) if eligible else []
 
-    return F.render_template("views/elections/admin.html", election=election.get(), e=e)
+    return F.render_template("views/elections/admin.html", election=election.get(), e=e,
+                             voted=voted, eligible=eligible, pending=pending,
+                             last_voted_at=last_voted_at(SESSION, e) if voted else None)
 
 
 @APP.route("/app/elections/<eid>/admin/exception/<rid>", methods=["GET", "POST"])
 @auth_guard  # Admin page for the reviewing exception
 @admin_guard
 def elections_admin_review(eid, rid):
-    election = meta.Election(eid)
-    e = SESSION.query(Election).filter_by(key=eid).first()
+    election = meta_election(eid)
+    e = sql_election(eid)
     req = (
         SESSION.query(Request)
         .join(Request, Election.requests)
@@ -309,9 +388,9 @@ def elections_admin_review(eid, rid):
 @admin_guard
 @has_completed_condition
 def elections_admin_results(eid):
-    election = meta.Election(eid)
+    election = meta_election(eid)
     candidates = election.candidates()
-    e = SESSION.query(Election).filter_by(key=eid).first()
+    e = sql_election(eid)
 
     result = CoreElection.build(candidates, e.ballots).schulze()
 
@@ -325,9 +404,9 @@ def elections_admin_results(eid):
 @admin_guard
 @has_completed_condition
 def elections_admin_download(eid):
-    election = meta.Election(eid)
+    election = meta_election(eid)
     candidates = election.candidates()
-    e = SESSION.query(Election).filter_by(key=eid).first()
+    e = sql_election(eid)
 
     # Generate a csv
     ballots = CoreElection.build(candidates, e.ballots).ballots
@@ -23,6 +23,7 @@ import flask as F
 from flask_wtf.csrf import CSRFError
 
 from elekto import APP
+from elekto.core.encryption import Busy
 
 
 @APP.errorhandler(404)
@@ -43,3 +44,25 @@ def server_error(e):
 @APP.errorhandler(CSRFError)
 def handle_csrf_error(e):
     return F.render_template('/errors/400.html', reason=e.description), 400
+
+
+@APP.errorhandler(Busy)
+def handle_kdf_busy(e):
+    # The ballot encryption queue is full, nothing has been stored yet
+    response = F.make_response(F.render_template(
+        'errors/message.html',
+        title='Too many voters right now',
+        message='Your ballot was not processed because too many ballots are \
+            being handled at the moment, please retry in a few seconds.'), 503)
+    response.headers['Retry-After'] = str(APP.config.get('KDF_RETRY_AFTER', 5))
+    return response
+
+
+@APP.errorhandler(429)
+def too_many_requests(e):
+    response = F.make_response(F.render_template(
+        'errors/message.html',
+        title='Too many requests',
+        message='You have made too many requests, please retry in {} seconds.'.format(e.retry_after)), 429)
+    response.headers['Retry-After'] = str(e.retry_after)
+    return response
@@ -21,8 +21,10 @@ not require authentication.
 
 import flask as F
 
-from elekto import APP
-from elekto.models import meta
+from elekto import APP, SESSION
+from elekto.core import encryption
+from elekto.models.utils import listing
+from elekto.utils import meta_election
 
 
 @APP.route('/')
@@ -33,17 +35,19 @@ def welcome():
 @APP.route('/elections')
 def public_elections():
     status = F.request.args.get('status')
-    res = meta.Election.all() if status is None else meta.Election.where('status', status)
-    res.sort(key=lambda e: e['start_datetime'], reverse=True)
+    page = F.request.args.get('page', 1, type=int)
+    res, page, pages = listing(SESSION, status, page)
 
     return F.render_template('views/public/elections_index.html',
                              elections=res,
-                             status=status)
+                             status=status,
+                             page=page,
+                             pages=pages)
 
 
 @APP.route('/elections/<eid>')
 def public_election(eid):
-    election = meta.Election(eid)
+    election = meta_election(eid)
     candidates = election.candidates()
 
     return F.render_template('views/public/elections_single.html',
@@ -54,3 +58,9 @@ def public_election(eid):
 def health_check():
     status_code = F.Response(status=200)
     return status_code
+
+
+@APP.route('/health/kdf')
+def health_kdf():
+    # queue wait and derivation time of the ballot encryption
+    return F.jsonify(encryption.POOL.stats())
@@ -14,22 +14,35 @@
 #
 # Author(s):         Manish Sahani <rec.manish.sahani@gmail.com>
 
-import os
+import flask as F
 
 from elekto import APP, SESSION, csrf
-from elekto.models import meta
-from elekto.models.utils import sync
+from elekto.models.sql import Sync
+from elekto.models.worker import SyncWorker
 from elekto.middlewares.webhook import webhook_guard
 
+# single sync worker of this process
+WORKER = SyncWorker()
+
 
 @APP.route('/v1/webhooks/meta/sync', methods=['POST'])
 @webhook_guard
 @csrf.exempt
 def webhook_sync():
-    backend = meta.Meta(APP.config['META'])
-    if not os.path.exists(backend.META) or not os.path.isdir(backend.META):
-        backend.clone()
-    else:
-        backend.pull()
-    # FIXME: sync(...) returns a string, not a response.
-    return sync(SESSION, meta.Election.all())
+    # pull and sync in the background, the pushes received meanwhile are
+    # coalesced into a single sync
+    WORKER.enqueue()
+    return F.jsonify({'status': 'queued'}), 202
+
+
+@APP.route('/v1/webhooks/meta/status', methods=['GET'])
+def webhook_status():
+    last = SESSION.query(Sync).order_by(Sync.id.desc()).first()
+    if last is None:
+        return F.jsonify({'commit': None, 'duration': None, 'synced_at': None})
+
+    return F.jsonify({
+        'commit': last.commit,
+        'duration': last.duration,
+        'synced_at': last.created_at.isoformat() if last.created_at else None,
+    })
@@ -14,30 +14,271 @@
 #
 # Author(s):         Vedant Raghuwanshi <raghuvedant00@gmail.com>
 
+import os
+import time
+import fcntl
+import tempfile
+import threading
 
+from concurrent.futures import ThreadPoolExecutor
 from nacl import secret, pwhash, exceptions
 
 
-def get_secret_box(salt, passcode):
-    kdf = pwhash.argon2i.kdf
-    key = kdf(secret.SecretBox.KEY_SIZE, passcode, salt)
+# Limits of the ballot keys encrypted before they were stored with the voters
+OPSLIMIT = pwhash.argon2i.OPSLIMIT_INTERACTIVE
+MEMLIMIT = pwhash.argon2i.MEMLIMIT_INTERACTIVE
+
+
+class Busy(Exception):
+    """
+    Raised when the key derivation queue is full, the request should be
+    retried later
+    """
+
+
+class KDFPool:
+    """
+    Admission control of the Argon2 key derivations of all the processes of
+    the host. A derivation runs while holding one of `workers` slot lock
+    files, and at most `queue` more derivations wait for a slot holding one
+    of the queue lock files. The ones beyond are refused with Busy instead
+    of piling up and holding every web worker of the application.
+
+    The locks are flock()s on files of `path`, shared by the uwsgi
+    processes and released by the kernel if a process dies holding one.
+    uwsgi serves one request per process, so the slots and the queue are
+    capped below the number of `processes`: the processes left over keep
+    serving the cheap pages while the derivations hold the others.
+
+    Attributes:
+        - workers: number of derivations running at once
+        - queue: number of derivations waiting for a slot
+        - path: directory of the lock files
+        - processes: number of web processes of the host (default: no cap)
+        - metrics: counters of the derivations of the process (see stats)
+    """
+
+    # seconds between two tries of a derivation waiting for a slot
+    POLL = 0.01
+
+    def __init__(self, workers=2, queue=2, path=None, processes=None):
+        if processes:
+            workers = min(workers, processes - 1)
+            queue = min(queue, processes - 1 - max(workers, 1))
+        self.workers = max(workers, 1)
+        self.queue = max(queue, 0)
+        self.path = path or os.path.join(tempfile.gettempdir(), 'elekto-kdf')
+        self.lock = threading.Lock()
+        self.metrics = {
+            'derived': 0, 'rejected': 0, 'pending': 0,
+            'wait_total': 0.0, 'wait_max': 0.0,
+            'kdf_total': 0.0, 'kdf_max': 0.0,
+        }
+
+    def derive(self, size, passcode, salt, opslimit=OPSLIMIT, memlimit=MEMLIMIT):
+        """
+        Derive the key with the Argon2i limits once a slot is free, blocks
+        until it is derived
+
+        Raises:
+            Busy: if the slots and the queue are taken
+        """
+        queued = time.monotonic()
+        slot = self.acquire()
+        try:
+            self.record(pending=1)
+            started = time.monotonic()
+            key = pwhash.argon2i.kdf(size, passcode, salt, opslimit=opslimit, memlimit=memlimit)
+            self.record(derived=1, wait=started - queued, kdf=time.monotonic() - started)
+            return key
+        finally:
+            self.record(pending=-1)
+            slot.close()  # releases the lock
+
+    def acquire(self):
+        """
+        Take a free slot, waiting in the queue when they are all taken
+
+        Returns:
+            file: the locked slot file, closing it frees the slot
+
+        Raises:
+            Busy: if the queue is full too
+        """
+        slot = self.take('slot', self.workers)
+        if slot is not None:
+            return slot
+
+        place = self.take('queue', self.queue)
+        if place is None:
+            self.record(rejected=1)
+            raise Busy("Too many ballots are being encrypted, please retry.")
+        try:
+            while slot is None:
+                time.sleep(KDFPool.POLL)
+                slot = self.take('slot', self.workers)
+            return slot
+        finally:
+            place.close()
+
+    def take(self, kind, count):
+        """
+        Lock the first free of the `count` lock files of the kind, without
+        waiting
+
+        Returns:
+            file: the locked file, None if they are all locked
+        """
+        os.makedirs(self.path, exist_ok=True)
+        for i in range(count):
+            f = open(os.path.join(self.path, '{}-{}.lock'.format(kind, i)), 'a')
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return f
+            except OSError:
+                f.close()
+        return None
+
+    def record(self, derived=0, rejected=0, pending=0, wait=None, kdf=None):
+        with self.lock:
+            m = self.metrics
+            m['derived'] += derived
+            m['rejected'] += rejected
+            m['pending'] += pending
+            if wait is not None:
+                m['wait_total'] += wait
+                m['wait_max'] = max(m['wait_max'], wait)
+            if kdf is not None:
+                m['kdf_total'] += kdf
+                m['kdf_max'] = max(m['kdf_max'], kdf)
+
+    def stats(self):
+        """
+        Snapshot of the metrics of the process, with the mean queue wait and
+        derivation time in seconds
+
+        Returns:
+            dict: metrics of the pool
+        """
+        with self.lock:
+            m = dict(self.metrics)
+        done = m['derived'] or 1
+        m.update(workers=self.workers, queue=self.queue,
+                 wait_mean=m['wait_total'] / done, kdf_mean=m['kdf_total'] / done)
+        return m
+
+
+POOL = KDFPool()
+
+
+def configure(workers, queue, path=None, processes=None):
+    """
+    Replace the pool with one of the given size, the app calls it once with
+    KDF_WORKERS, KDF_QUEUE, KDF_LOCKS and APP_PROCESSES from the config
+
+    Returns:
+        KDFPool: the new pool
+    """
+    global POOL
+    POOL = KDFPool(workers, queue, path, processes)
+    return POOL
+
+
+def check_limits(opslimit, memlimit):
+    """
+    Validate the Argon2i limits of an election or of the config
+
+    Raises:
+        ValueError: if a limit is not an integer in the bounds of Argon2i
+    """
+    bounds = {
+        'opslimit': (opslimit, pwhash.argon2i.OPSLIMIT_MIN, pwhash.argon2i.OPSLIMIT_MAX),
+        'memlimit': (memlimit, pwhash.argon2i.MEMLIMIT_MIN, pwhash.argon2i.MEMLIMIT_MAX),
+    }
+    for name, (value, low, high) in bounds.items():
+        if not isinstance(value, int) or isinstance(value, bool) or not low <= value <= high:
+            raise ValueError('kdf {} must be an integer between {} and {}'.format(name, low, high))
+
+
+def benchmark(opslimit, memlimit, concurrency=1):
+    """
+    Time `concurrency` key derivations running at once, the latency of a
+    vote when the pool's workers are all busy
+
+    Returns:
+        float: seconds until the last derivation is done
+    """
+    salt = os.urandom(pwhash.argon2i.SALTBYTES)
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        started = time.monotonic()
+        jobs = [executor.submit(pwhash.argon2i.kdf, secret.SecretBox.KEY_SIZE, b'calibration',
+                                salt, opslimit=opslimit, memlimit=memlimit)
+                for _ in range(concurrency)]
+        for job in jobs:
+            job.result()
+    return time.monotonic() - started
+
+
+def calibrate(latency, concurrency=1, memory=None):
+    """
+    Recommend the costliest Argon2i limits whose derivations fit in the
+    target latency when `concurrency` of them run at once on the host.
+    Memory is tried first, halving it from the memory budget until the
+    fewest passes fit, then the passes are raised with the time left (the
+    time of a derivation grows linearly with them)
+
+    Args:
+        latency (float): target seconds of a derivation under the concurrency
+        concurrency (int): derivations running at once, ie: KDF_WORKERS
+        memory (int): bytes the derivations may use together (default:
+            the sensitive limit of Argon2i per derivation)
+
+    Returns:
+        dict: the recommended opslimit and memlimit, the measured seconds
+            and the derivations per second of the host
+    """
+    memlimit = min(memory // concurrency if memory else pwhash.argon2i.MEMLIMIT_SENSITIVE,
+                   pwhash.argon2i.MEMLIMIT_SENSITIVE)
+    memlimit = 1 << (max(memlimit, pwhash.argon2i.MEMLIMIT_MIN).bit_length() - 1)
+    opslimit = pwhash.argon2i.OPSLIMIT_MIN
+
+    seconds = benchmark(opslimit, memlimit, concurrency)
+    while seconds > latency and memlimit // 2 >= pwhash.argon2i.MEMLIMIT_MIN:
+        memlimit //= 2
+        seconds = benchmark(opslimit, memlimit, concurrency)
+
+    passes = min(int(opslimit * latency / seconds), pwhash.argon2i.OPSLIMIT_SENSITIVE)
+    if passes > opslimit:
+        opslimit = passes
+        seconds = benchmark(opslimit, memlimit, concurrency)
+
+    return {
+        'opslimit': opslimit,
+        'memlimit': memlimit,
+        'seconds': seconds,
+        'throughput': concurrency / seconds,
+    }
+
+
+def get_secret_box(salt, passcode, opslimit=OPSLIMIT, memlimit=MEMLIMIT):
+    key = POOL.derive(secret.SecretBox.KEY_SIZE, passcode, salt, opslimit, memlimit)
     box = secret.SecretBox(key)
 
     return box
 
 
-def encrypt(salt, passcode, target):
+def encrypt(salt, passcode, target, opslimit=OPSLIMIT, memlimit=MEMLIMIT):
     passcode = passcode.encode("utf-8")
     target = target.encode("utf-8")
-    box = get_secret_box(salt, passcode)
+    box = get_secret_box(salt, passcode, opslimit, memlimit)
     encrypted = box.encrypt(target)
 
     return encrypted
 
 
-def decrypt(salt, passcode, encrypted):
+def decrypt(salt, passcode, encrypted, opslimit=OPSLIMIT, memlimit=MEMLIMIT):
     passcode = passcode.encode("utf-8")
-    box = get_secret_box(salt, passcode)
+    box = get_secret_box(salt, passcode, opslimit, memlimit)
     try:
         target = box.decrypt(encrypted).decode("utf-8")
 
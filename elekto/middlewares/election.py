@@ -18,8 +18,8 @@ import flask as F
 
 from functools import wraps
 from elekto import SESSION, constants
-from elekto.models.sql import Election
-from elekto.models import meta
+from elekto.models.voting import has_voted
+from elekto.utils import meta_election, sql_election
 from datetime import datetime
 
 
@@ -31,7 +31,7 @@ def admin_guard(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
         if 'eid' not in kwargs.keys() or F.g.user.username \
-                not in meta.Election(kwargs['eid']).get()['election_officers']:
+                not in meta_election(kwargs['eid']).get()['election_officers']:
             F.flash('You are not an Election officer')
             return F.abort(401)
         return f(*args, **kwargs)
@@ -48,10 +48,9 @@ def voter_guard(f):
         if 'eid' not in kwargs.keys():
             return F.abort(404)
 
-        election = meta.Election(kwargs['eid'])
-        voters = election.voters()
+        election = meta_election(kwargs['eid'])
 
-        if F.g.user.username not in voters['eligible_voters']:
+        if not election.eligible(F.g.user.username):
             return F.render_template('errors/not_eligible.html',
                                      election=election.get())
         return f(*args, **kwargs)
@@ -68,14 +67,13 @@ def exception_guard(f):
         if 'eid' not in kwargs.keys():
             return F.abort(404)
 
-        election = meta.Election(kwargs['eid'])
-        voters = election.voters()
+        election = meta_election(kwargs['eid'])
 
         if election.get()['exception_due'] < datetime.now():
             F.flash('Not accepting any exception request.')
             return F.redirect(F.url_for('elections_single', eid=kwargs['eid']))
 
-        if F.g.user.username in voters['eligible_voters']:
+        if election.eligible(F.g.user.username):
             F.flash('You are already eligible to vote in the election.')
             return F.redirect(F.url_for('elections_single', eid=kwargs['eid']))
 
@@ -92,7 +90,7 @@ def has_completed_condition(f):
         if 'eid' not in kwargs.keys():
             return F.abort(404)
 
-        election = meta.Election(kwargs['eid']).get()
+        election = meta_election(kwargs['eid']).get()
         if election['status'] != constants.ELEC_STAT_COMPLETED:
             return F.render_template('errors/message.html',
                                      title='The election is not completed yet',
@@ -111,9 +109,7 @@ def has_voted_condition(f):
     def decorated_function(*args, **kwargs):
         if 'eid' not in kwargs.keys():
             return F.abort(404)
-        e = SESSION.query(Election).filter_by(key=kwargs['eid']).first()
-
-        if F.g.user.id not in [v.user_id for v in e.voters]:
+        if not has_voted(SESSION, F.g.user, sql_election(kwargs['eid'])):
             F.flash('You have not voted yet')
             return F.redirect(F.url_for('elections_single', eid=kwargs['eid']))
 
@@ -0,0 +1,45 @@
+# Copyright 2026 The Elekto Authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import flask as F
+
+from functools import wraps
+from elekto import APP, SESSION
+from elekto.models.limits import Limit, MemoryStore, DatabaseStore
+
+STORES = {
+    'memory': MemoryStore(),
+    'database': DatabaseStore(SESSION),
+}
+
+
+def rate_guard(name):
+    """
+    Middleware (guard): limits the POST requests of the current user to the
+    route with the RATE_LIMIT[name] token bucket of the config, the ones
+    beyond are answered with a 429. Must come after the auth_guard.
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            config = APP.config['RATE_LIMIT']
+            limit = Limit.parse(config.get(name))
+            if F.request.method == 'POST' and limit is not None:
+                store = STORES[config.get('STORE', 'memory')]
+                allowed, retry = store.hit('{}:{}'.format(name, F.g.user.id), limit)
+                if not allowed:
+                    return F.abort(429, retry_after=retry)
+            return f(*args, **kwargs)
+        return decorated_function
+    return decorator
@@ -0,0 +1,165 @@
+# Copyright 2026 The Elekto Authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Token buckets of the rate limits, kept in the process for a single node or
+in the database so the limits hold across the uwsgi processes
+"""
+
+import math
+import time
+import threading
+
+import sqlalchemy as S
+from sqlalchemy.exc import IntegrityError
+
+from elekto.models.sql import RateLimit
+
+
+class Limit:
+    """
+    A bucket of `capacity` tokens refilled at `capacity` tokens every
+    `period` seconds, a request takes one token
+
+    Attributes:
+        - capacity: requests allowed in a burst
+        - period: seconds to refill an empty bucket
+    """
+
+    def __init__(self, capacity, period):
+        self.capacity = capacity
+        self.period = period
+
+    @staticmethod
+    def parse(value):
+        """
+        Parse a limit of the config, '<requests>/<seconds>'
+
+        Returns:
+            Limit: the limit, None if it is empty or 0 (not limited)
+        """
+        if not value:
+            return None
+        capacity, _, period = str(value).partition('/')
+        capacity, period = int(capacity), float(period or 60)
+        if capacity <= 0 or period <= 0:
+            return None
+        return Limit(capacity, period)
+
+    def take(self, tokens, stamp, now):
+        """
+        Refill the bucket since `stamp` and take a token from it
+
+        Args:
+            tokens (float): tokens of the bucket at stamp, None for a new one
+            stamp (float): time of the bucket's last request
+            now (float): time of the request
+
+        Returns:
+            tuple: (allowed, tokens left, seconds until a token is available)
+        """
+        if tokens is None:
+            tokens = self.capacity
+        else:
+            tokens = min(self.capacity, tokens + (now - stamp) * self.capacity / self.period)
+
+        if tokens >= 1:
+            return True, tokens - 1, 0
+        return False, tokens, math.ceil((1 - tokens) * self.period / self.capacity)
+
+    def idle(self, tokens, stamp, now):
+        """
+        Check if the bucket is full again, and can be forgotten
+        """
+        return tokens + (now - stamp) * self.capacity / self.period >= self.capacity
+
+
+class MemoryStore:
+    """
+    Buckets in the process, the limits are per uwsgi process
+    """
+
+    # buckets kept before the full ones are dropped
+    MAX = 10000
+
+    def __init__(self):
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def hit(self, key, limit, now=None):
+        """
+        Take a token from the bucket of the key
+
+        Returns:
+            tuple: (allowed, seconds until a token is available)
+        """
+        now = time.time() if now is None else now
+        with self.lock:
+            if len(self.buckets) >= MemoryStore.MAX:
+                self.prune(now)
+            tokens, stamp, _ = self.buckets.get(key, (None, now, limit))
+            allowed, tokens, retry = limit.take(tokens, stamp, now)
+            self.buckets[key] = (tokens, now, limit)
+        return allowed, retry
+
+    def prune(self, now):
+        self.buckets = {k: b for k, b in self.buckets.items() if not b[2].idle(b[0], b[1], now)}
+
+    def clear(self):
+        with self.lock:
+            self.buckets = {}
+
+
+class DatabaseStore:
+    """
+    Buckets in the rate_limit table, a bucket's row is locked while a token
+    is taken so the processes see the same buckets
+    """
+
+    def __init__(self, session):
+        self.session = session
+
+    def hit(self, key, limit, now=None):
+        """
+        Take a token from the bucket of the key, in its own transaction
+
+        Returns:
+            tuple: (allowed, seconds until a token is available)
+        """
+        now = time.time() if now is None else now
+        engine = self.session.get_bind()
+        table = RateLimit.__table__
+
+        for attempt in range(2):
+            try:
+                with engine.begin() as connection:
+                    row = connection.execute(
+                        S.select(table.c.tokens, table.c.stamp)
+                        .where(table.c.key == key).with_for_update()).first()
+                    if row is None:
+                        allowed, tokens, retry = limit.take(None, now, now)
+                        connection.execute(S.insert(table).values(key=key, tokens=tokens, stamp=now))
+                    else:
+                        allowed, tokens, retry = limit.take(row.tokens, row.stamp, now)
+                        connection.execute(S.update(table).where(table.c.key == key)
+                                           .values(tokens=tokens, stamp=now))
+                return allowed, retry
+            except IntegrityError:
+                # another process created the bucket meanwhile, take from it
+                if attempt:
+                    raise
+
+    def clear(self):
+        with self.session.get_bind().begin() as connection:
+            connection.execute(S.delete(RateLimit.__table__))
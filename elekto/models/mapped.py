@@ -0,0 +1,99 @@
+# Copyright 2026 The Elekto Authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Files written by the sync and memory mapped (read-only) by all the
+application's processes, so the pages are shared through the OS page cache.
+A file is swapped atomically, the readers keep their mapping until they
+notice the new file.
+"""
+
+import os
+import mmap
+import contextlib
+
+
+class MappedFile:
+    """
+    Base of the mapped files, a subclass defines its MAGIC, its own OPEN
+    cache and loads its layout in `load`
+    """
+
+    MAGIC = b''
+    KIND = 'mapped file'
+
+    # Files mapped by this process, keyed by path
+    OPEN = {}
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self.stamp = MappedFile.stamp_of(os.fstat(f.fileno()))
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if self.data[:len(self.MAGIC)] != self.MAGIC:
+            raise ValueError('{} is not a {}'.format(path, self.KIND))
+        self.load()
+
+    def load(self):
+        pass
+
+    @staticmethod
+    def stamp_of(st):
+        return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+    @classmethod
+    def open(cls, path):
+        """
+        Get the file at the path, mapped again whenever it has been replaced
+        by a sync.
+
+        Returns:
+            MappedFile: the mapped file, None if there is no file at the path
+        """
+        if not path:
+            return None
+
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return None
+
+        mapped = cls.OPEN.get(path)
+        if mapped is None or mapped.stamp != MappedFile.stamp_of(st):
+            mapped = cls(path)
+            cls.OPEN[path] = mapped
+        return mapped
+
+    @staticmethod
+    @contextlib.contextmanager
+    def replace(path):
+        """
+        Write a file next to the path, and swap it in once it is complete and
+        synced to disk
+
+        Yields:
+            file: the temporary file, opened for binary writing
+        """
+        tmp = '{}.{}.tmp'.format(path, os.getpid())
+        try:
+            with open(tmp, 'wb') as f:
+                yield f
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
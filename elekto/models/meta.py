@@ -15,14 +15,21 @@
 # Author(s):         Manish Sahani <rec.manish.sahani@gmail.com>
 
 import os
+import time
 import random
 import subprocess
 import flask as F
 
 from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
 
 from elekto import APP, constants
+from elekto.core.encryption import check_limits
 from elekto.models import utils
+from elekto.models.sql import Sync
+from elekto.models.snapshot import Snapshot
+from elekto.models.voters import VoterIndex
+from elekto.models.storage import FileStore, GitStore
 
 
 class Meta:
@@ -33,19 +40,337 @@ class Meta:
     """
 
     def __init__(self, config):
-        self.META = os.path.abspath(config['PATH'])
+        self.PATH = os.path.abspath(config['PATH'])
+        # resolved once, so a reader keeps reading the same checkout even if a
+        # sync flips the meta path meanwhile
+        self.META = os.path.realpath(self.PATH)
         self.ELECDIR = config['ELECDIR']
         self.REMOTE = config['REMOTE']
         self.BRANCH = config['BRANCH']
         self.SECRET = config['SECRET']
+        self.SNAPSHOT = os.path.abspath(config['SNAPSHOT']) if config.get('SNAPSHOT') else None
+        # indexes of the eligible voters, referenced by the snapshot
+        self.VOTERS = self.SNAPSHOT + '.voters' if self.SNAPSHOT else None
+        # inverted index of the eligible voters, username to election keys
+        self.ELIGIBILITY = self.PATH.rstrip(os.sep) + '.eligibility'
+        # atomic deployments keep a bare repository and check every revision
+        # out in its own directory, the meta path is a symlink to the latest
+        self.ATOMIC = config.get('ATOMIC', False)
+        self.REPO = self.PATH + '.repo'
+        # shallow deployments fetch only the tip of the branch, without the
+        # blobs, and check out nothing but the election directory
+        self.SHALLOW = config.get('SHALLOW', False)
+        self.CHECKOUTS = self.PATH + '.checkouts'
         self.git = '/usr/bin/git'
 
+        # where the meta is read from, the working tree or the git objects of
+        # a revision (default: the branch) without a checkout
+        if config.get('STORE') == 'git':
+            # the git directory of the meta is resolved on the first read, it
+            # does not exist before the first clone
+            gitdir = self.REPO if self.ATOMIC else None
+            self.storage = GitStore(gitdir, self.META, config.get('REVISION') or self.BRANCH, self.git)
+        else:
+            self.storage = FileStore()
+
+    def shallow(self):
+        """
+        Options limiting a clone or a fetch to the tip of the branch, blobs
+        are fetched on demand (checkout) from the remote.
+        """
+        return ['--depth', '1', '--filter=blob:none'] if self.SHALLOW else []
+
     def clone(self):
-        subprocess.run([self.git, 'clone', '-b', self.BRANCH, '--', self.REMOTE, self.META], check=True)
+        try:
+            self._clone()
+        finally:
+            self.refresh()
 
     def pull(self):
+        try:
+            self._pull()
+        finally:
+            self.refresh()
+
+    def refresh(self):
+        """
+        Read the meta from the cloned or pulled repository, under the
+        checkout the meta path points to
+        """
+        if isinstance(self.storage, GitStore):
+            self.storage.reset(self.META)
+
+    def _clone(self):
+        if self.ATOMIC:
+            if not os.path.isdir(self.REPO):
+                subprocess.run([self.git, 'clone', '--bare', *self.shallow(), '-b', self.BRANCH, '--',
+                                self.REMOTE, self.REPO], check=True)
+            return self._pull()
+
+        if self.SHALLOW:
+            subprocess.run([self.git, 'clone', *self.shallow(), '--sparse', '-b', self.BRANCH, '--',
+                            self.REMOTE, self.META], check=True)
+            subprocess.run([self.git, '-C', self.META, 'sparse-checkout', 'set', '--', self.ELECDIR], check=True)
+            return
+
+        subprocess.run([self.git, 'clone', '-b', self.BRANCH, '--', self.REMOTE, self.META], check=True)
+
+    def _pull(self):
+        if self.ATOMIC:
+            if not os.path.isdir(self.REPO):
+                # a plain clone turned atomic, the bare repository is created
+                return self._clone()
+            subprocess.run([self.git, '--git-dir', self.REPO, 'fetch', *self.shallow(), 'origin',
+                            '+refs/heads/{0}:refs/heads/{0}'.format(self.BRANCH)], check=True)
+            return self.checkout()
+
+        if self.SHALLOW:
+            # a shallow history can not prove a fast forward, the branch is
+            # moved to the fetched tip instead
+            subprocess.run([self.git, '-C', self.META, 'fetch', *self.shallow(), 'origin', self.BRANCH], check=True)
+            subprocess.run([self.git, '-C', self.META, 'reset', '-q', '--hard', 'FETCH_HEAD'], check=True)
+            return
+
         subprocess.run([self.git, '--git-dir', '{}/.git'.format(self.META),'--work-tree', self.META, 'pull', '--ff-only', 'origin', self.BRANCH], check=True)
 
+    def checkout(self):
+        """
+        Check the fetched branch out into a fresh directory and atomically
+        flip the meta path to it, readers never observe a half pulled tree.
+        The previous checkout is kept for the readers still using it, a plain
+        clone at the meta path is moved to `<PATH>.plain`.
+        """
+        res = subprocess.run([self.git, '--git-dir', self.REPO, 'rev-parse', self.BRANCH],
+                             check=True, capture_output=True, text=True)
+        commit = res.stdout.strip()
+        target = os.path.join(self.CHECKOUTS, commit)
+
+        if not os.path.isdir(target):
+            # check out next to the target and move it in place once complete
+            staging = target + '.new'
+            if os.path.exists(staging):
+                subprocess.run([self.git, '--git-dir', self.REPO, 'worktree', 'remove', '--force', staging])
+            if self.SHALLOW:
+                subprocess.run([self.git, '--git-dir', self.REPO, 'worktree', 'add', '--no-checkout', '--detach',
+                                staging, commit], check=True)
+                subprocess.run([self.git, '-C', staging, 'sparse-checkout', 'set', '--', self.ELECDIR], check=True)
+                subprocess.run([self.git, '-C', staging, 'reset', '-q', '--hard'], check=True)
+            else:
+                subprocess.run([self.git, '--git-dir', self.REPO, 'worktree', 'add', '--detach', staging, commit],
+                               check=True)
+            subprocess.run([self.git, '--git-dir', self.REPO, 'worktree', 'move', staging, target], check=True)
+
+        if os.path.isdir(self.PATH) and not os.path.islink(self.PATH):
+            # the plain clone of a deployment turned atomic, a directory can
+            # not be replaced by the symlink
+            aside = self.PATH + '.plain'
+            if os.path.lexists(aside):
+                raise RuntimeError('{} is a directory and {} already exists, remove one of them to check the '
+                                   'meta out atomically'.format(self.PATH, aside))
+            os.rename(self.PATH, aside)
+
+        previous = os.path.realpath(self.PATH)
+        if previous != target:
+            link = '{}.{}.tmp'.format(self.PATH, os.getpid())
+            if os.path.lexists(link):
+                os.remove(link)
+            os.symlink(target, link)
+            os.replace(link, self.PATH)
+
+        self.META = target
+
+        for name in os.listdir(self.CHECKOUTS):
+            path = os.path.join(self.CHECKOUTS, name)
+            if path not in (target, previous):
+                subprocess.run([self.git, '--git-dir', self.REPO, 'worktree', 'remove', '--force', path])
+        subprocess.run([self.git, '--git-dir', self.REPO, 'worktree', 'prune'])
+
+    def head(self):
+        """
+        Get the commit currently checked out in the meta repository, or the
+        commit the meta is read from
+
+        Returns:
+            string: commit sha
+        """
+        if isinstance(self.storage, GitStore):
+            return self.storage.commit
+
+        res = subprocess.run([self.git, '-C', self.META, 'rev-parse', 'HEAD'],
+                             check=True, capture_output=True, text=True)
+        return res.stdout.strip()
+
+    def changes(self, since, until='HEAD'):
+        """
+        List the files of the election directory changed between two commits
+
+        Args:
+            since (string): commit to compare from (the last synced commit)
+            until (string): commit to compare to
+
+        Returns:
+            list: changed paths relative to the election directory, None if
+                the commits can not be compared and a full sync is required
+        """
+        if not since:
+            return None
+
+        res = subprocess.run([self.git, '-C', self.META, 'diff', '--name-only', '--no-renames', '-z',
+                              since, until, '--', self.ELECDIR], capture_output=True, text=True)
+        if res.returncode != 0:
+            return None
+
+        return [os.path.relpath(p, self.ELECDIR) for p in res.stdout.split('\0') if p]
+
+    def sync(self, session, workers=1):
+        """
+        Sync the database with the elections changed since the last synced
+        commit, only the changed elections are parsed again. Falls back to a
+        full sync on the first run or when the history can not be compared.
+
+        Args:
+            session (object): database session
+            workers (int): number of processes parsing the elections
+
+        Returns:
+            SyncDiff: what the sync changed, its str() is the sync log
+        """
+        start = time.time()
+        commit = self.head()
+        last = session.query(Sync).order_by(Sync.id.desc()).first()
+        paths = self.changes(last.commit if last else None, commit)
+        store = os.path.join(self.META, self.ELECDIR)
+
+        if paths is None:
+            keys = None
+            Election.invalidate()
+            parse = Election.listelecdirs(store, self.storage)
+        else:
+            keys = Election.keys(paths)
+            Election.invalidate(keys)
+            parse = [k for k in keys
+                     if self.storage.exists(os.path.join(store, k.replace('---', '/'), Election.YML))]
+
+        records = self.records(parse, workers)
+        errors = {k: r['errors'] for k, r in records.items() if r['errors']}
+        valid = {k: r for k, r in records.items() if 'election' in r}
+        changed = set(valid) if paths is None else \
+            Election.keys([p for p in paths if os.path.basename(p) == Election.VOT])
+        voters = {k: (r['voters'] or {}).get('eligible_voters') or []
+                  for k, r in valid.items() if k in changed and 'voters' in r}
+        diff = utils.sync(session, [dict(r['election'], **r['counts']) for r in valid.values()],
+                          keys=keys, voters=voters, errors=errors)
+
+        if self.SNAPSHOT:
+            self.snapshot(commit, keys, records)
+        self.eligibility(keys, records, workers)
+
+        session.add(Sync(commit=commit, duration=time.time() - start))
+        session.commit()
+
+        return diff
+
+    def records(self, keys, workers=1):
+        """
+        Compile the elections (see Election.compile), fanned out to a pool of
+        processes when more than one worker is given.
+
+        Args:
+            keys (list): keys of the elections to parse
+            workers (int): number of processes parsing the elections
+
+        Returns:
+            dict: election key to its record, only {'errors': ...} for the
+                elections that failed to compile
+        """
+        keys = list(keys)
+
+        if workers <= 1 or len(keys) <= 1:
+            return {k: record(k) for k in keys}
+
+        workers = min(workers, len(keys))
+        with ProcessPoolExecutor(max_workers=workers, initializer=configure,
+                                 initargs=(dict(APP.config['META']),)) as pool:
+            chunksize = max(1, len(keys) // (workers * 4))
+            return dict(zip(keys, pool.map(record, keys, chunksize=chunksize)))
+
+    def eligibility(self, keys, records, workers=1):
+        """
+        Update the inverted index of the eligible voters, from a username to
+        the keys of the elections the user is eligible for. The entries of
+        the elections outside of `keys`, or whose voters failed to compile,
+        are kept from the previous index, every election is compiled when
+        there is no previous index (ie: a fresh checkout of the meta synced
+        incrementally).
+
+        Args:
+            keys (set): keys of the changed elections (default: all)
+            records (dict): records of the parsed elections
+            workers (int): number of processes parsing the other elections
+        """
+        previous = VoterIndex.open(self.ELIGIBILITY) if keys is not None else None
+        table = {}
+
+        if keys is not None and previous is None:
+            store = os.path.join(self.META, self.ELECDIR)
+            others = [k for k in Election.listelecdirs(store, self.storage) if k not in records]
+            records = dict(self.records(others, workers), **records)
+
+        if previous is not None:
+            # an election that fails to compile, or whose voters.yaml does,
+            # keeps its entries as it keeps its voters in the snapshot
+            failed = {k for k, r in records.items() if 'voters' not in r}
+            for username, elections in previous.items():
+                kept = [k for k in elections if k not in keys or k in failed]
+                if kept:
+                    table[username] = set(kept)
+
+        for k, r in records.items():
+            for username in (r.get('voters') or {}).get('eligible_voters') or []:
+                table.setdefault(username, set()).add(k)
+
+        VoterIndex.write(self.ELIGIBILITY, table)
+
+    def snapshot(self, version, keys=None, compiled=None):
+        """
+        Compile the elections into the meta snapshot shared by all the
+        application's processes, the records of the elections outside of
+        `keys` are copied from the previous snapshot as they are. An election
+        that fails to compile keeps its record of the previous snapshot, one
+        whose voters.yaml fails to parse keeps its previous voters.
+
+        Args:
+            version (string): version of the snapshot (meta commit)
+            keys (set): keys of the changed elections (default: all)
+            compiled (dict): records already compiled by the sync
+        """
+        current = Snapshot.open(self.SNAPSHOT)
+        previous = current if keys is not None else None
+        compiled = compiled or {}
+        records = {}
+
+        for k in Election.listelecdirs(os.path.join(self.META, self.ELECDIR), self.storage):
+            if k not in compiled and previous is not None and k not in keys and k in previous:
+                records[k] = previous.raw(k)
+                continue
+
+            compiled_record = compiled[k] if k in compiled else record(k)
+            if 'election' in compiled_record:
+                if 'voters' not in compiled_record:
+                    previous_record = current.get(k) if current is not None else None
+                    compiled_record = dict(compiled_record, voters=(previous_record or {}).get('voters'))
+                records[k] = compiled_record
+            elif current is not None and k in current:
+                records[k] = current.raw(k)
+
+        Snapshot.write(self.SNAPSHOT, version, records)
+
+        # drop the voters indexes of the elections removed from the meta
+        if os.path.isdir(self.VOTERS):
+            for name in os.listdir(self.VOTERS):
+                if name.endswith('.idx') and name[:-len('.idx')] not in records:
+                    os.remove(os.path.join(self.VOTERS, name))
+
 
 class Election(Meta):
     DES = 'election_desc.md'
@@ -53,67 +378,346 @@ class Election(Meta):
     YML = 'election.yaml'
     VOT = 'voters.yaml'
 
-    def __init__(self, key):
+    # fields every election.yaml must define
+    REQUIRED = ('name', 'start_datetime', 'end_datetime')
+
+    # Parsed elections of this process, keyed by the election's key and
+    # validated against the stamp of the election's files.
+    CACHE = {}
+
+    # Set while a watcher (see watcher.MetaWatcher) invalidates the changed
+    # elections, the cached elections are trusted without checking stamps.
+    WATCHED = False
+
+    # Discovered election directories, keyed by the election directory and
+    # validated against the stamps of the directories walked.
+    DISCOVERY = {}
+
+    def __init__(self, key, snapshot=True, index=False):
         Meta.__init__(self, APP.config['META'])
         self.store = os.path.join(self.META, self.ELECDIR)
         self.path = os.path.join(self.store, key.replace('---','/'))
         self.key = key
         self.election = {}
 
-        if not os.path.exists(self.path):
+        # stream the eligible voters into the voters index when compiled
+        self.indexing = index
+
+        # the compiled record of the election, from the snapshot or the cache
+        self.record = None
+        current = Snapshot.open(self.SNAPSHOT) if snapshot else None
+
+        if current is not None:
+            self.record = current.get(key)
+            if self.record is None:
+                F.abort(404)
+            else:
+                self.build()
+        elif not self.storage.exists(self.path):
             F.abort(404)
         else:
             self.build()
 
     @staticmethod
-    def all():
+    def all(snapshot=True):
         """
         Get all elections in the repository
 
+        Args:
+            snapshot (bool): serve the elections from the meta snapshot, if
+                there is one
+
         Returns:
             list: list of all the elections
         """
         meta = Meta(APP.config['META'])
-        path = os.path.join(meta.META, meta.ELECDIR)
-        keys = Election.listelecdirs(path)
+        current = Snapshot.open(meta.SNAPSHOT) if snapshot else None
+
+        if current is not None:
+            keys = current.keys()
+        else:
+            keys = Election.listelecdirs(os.path.join(meta.META, meta.ELECDIR), meta.storage)
+
+        return [Election(k, snapshot).get() for k in keys]
+
+    @staticmethod
+    def keys(paths):
+        """
+        Map the paths (relative to the election directory) to the keys of the
+        elections they belong to, a removed election is matched by its
+        election.yaml
+
+        Args:
+            paths (list): changed paths in the election directory
+
+        Returns:
+            set: keys of the affected elections
+        """
+        meta = Meta(APP.config['META'])
+        store = os.path.join(meta.META, meta.ELECDIR)
+        keys = set()
+
+        for p in paths:
+            parts = os.path.dirname(p).split('/')
+            for i in range(len(parts), 0, -1):
+                curdir = '/'.join(parts[:i])
+                if curdir and meta.storage.exists(os.path.join(store, curdir, Election.YML)):
+                    keys.add(curdir.replace('/', '---'))
+                    break
+            else:
+                if os.path.dirname(p) and os.path.basename(p) == Election.YML:
+                    keys.add(os.path.dirname(p).replace('/', '---'))
 
-        return [Election(k).get() for k in keys]
+        return keys
+
+    @staticmethod
+    def invalidate(keys=None):
+        """
+        Drop the cached elections of the given keys, or the whole cache
+        """
+        if keys is None:
+            Election.CACHE.clear()
+            Election.DISCOVERY.clear()
+            return
+
+        for k in keys:
+            Election.CACHE.pop(k, None)
 
     @staticmethod
     def where(key, value):
         return [r for r in Election.all() if r[key] == value]
 
     @staticmethod
-    def listelecdirs(path):
-        """Return the set of election directories"""
-        elecdirs = []
-        for root, dirs, files in os.walk(path, topdown=True):
-           for name in dirs:
-               if os.path.exists(os.path.join(root, name, Election.YML)):
-                   """append each election directory to the list of directories
-                   and make nested dirs url-safe"""
-                   curdir = os.path.relpath(os.path.join(root, name),path)
-                   safedir = curdir.replace('/','---')
-                   elecdirs.append(safedir)
-
-        return elecdirs
+    def listelecdirs(path, storage=None, skip=None):
+        """
+        Return the election directories (url-safe keys) under the path, the
+        walk does not descend into an election directory once found nor into
+        the skipped directories.
+
+        The result is cached and reused as long as none of the directories
+        walked changed, which costs a stat per directory instead of a walk.
+
+        Args:
+            path (string): election directory of the meta
+            storage (object): storage backend the meta is read from
+            skip (list): names, or paths relative to `path`, of directories
+                to skip (default: the configured SKIPDIRS)
+
+        Returns:
+            list: list of election keys
+        """
+        storage = storage or FileStore()
+        if skip is None:
+            skip = APP.config['META'].get('SKIPDIRS') or []
+        skip = frozenset(skip)
+
+        cached = Election.DISCOVERY.get((path, skip))
+        if cached is not None and all(storage.dirstamp(d) == s for d, s in cached[0]):
+            return list(cached[1])
+
+        stamps, elecdirs = [], []
+        pending = [path]
+        while pending:
+            curdir = pending.pop()
+            stamp = storage.dirstamp(curdir)
+            entries = storage.entries(curdir)
+            if entries is None:
+                continue
+            stamps.append((curdir, stamp))
+
+            rel = os.path.relpath(curdir, path)
+            if curdir != path and entries.get(Election.YML) is False:
+                elecdirs.append(rel.replace(os.sep, '---'))
+                continue
+
+            for name in sorted(entries, reverse=True):
+                if entries[name] and name not in skip and os.path.normpath(os.path.join(rel, name)) not in skip:
+                    pending.append(os.path.join(curdir, name))
+
+        Election.DISCOVERY[(path, skip)] = (stamps, elecdirs)
+        return list(elecdirs)
 
     def get(self):
-        if not os.path.exists(self.path) or not os.path.isdir(self.path):
-            return F.abort(404)
-        return self.build()
+        return self.election or self.build()
 
     def build(self):
-        self.election = utils.parse_yaml(os.path.join(self.path, Election.YML))
-        self.election['status'] = self.status()
-        self.election['key'] = self.key
-        self.election['description'] = self.description()
-        self.election['results'] = self.results()
+        if self.record is None:
+            self.record = self.load()
 
-        if 'exception_due' not in self.election.keys():
-            self.election['exception_due'] = self.election['start_datetime']
+        if 'election' not in self.record:
+            raise Exception('Invalid election {} : {}'.format(self.key, '; '.join(self.record['errors'])))
+
+        # status depends on the current time and is never compiled
+        self.election = dict(self.record['election'])
+        self.election['status'] = self.status()
         return self.election
 
+    def load(self):
+        """
+        Get the compiled record of the election, compiled once per process
+        and validated against the stamp of the election's files
+        """
+        cached = Election.CACHE.get(self.key)
+        if cached is not None and Election.WATCHED:
+            return cached[1]
+
+        stamp = self.stamp()
+        if cached is None or cached[0] != stamp:
+            cached = (stamp, self.compile())
+            Election.CACHE[self.key] = cached
+        return cached[1]
+
+    def parse(self):
+        election = self.yaml(Election.YML)
+        if not isinstance(election, dict):
+            raise Exception('{} is missing or is not a mapping'.format(Election.YML))
+
+        missing = [f for f in Election.REQUIRED if f not in election]
+        if missing:
+            raise Exception('{} is missing {}'.format(Election.YML, ', '.join(missing)))
+        for f in ('start_datetime', 'end_datetime', 'exception_due'):
+            if f in election and not isinstance(election[f], datetime):
+                raise Exception('{} of {} is not a datetime'.format(f, Election.YML))
+        if 'kdf_opslimit' in election or 'kdf_memlimit' in election:
+            try:
+                check_limits(election.get('kdf_opslimit', APP.config['KDF_OPSLIMIT']),
+                             election.get('kdf_memlimit', APP.config['KDF_MEMLIMIT']))
+            except ValueError as err:
+                raise Exception('{} of {}'.format(err, Election.YML))
+
+        election['key'] = self.key
+        election['description'] = self.description()
+        election['results'] = self.results()
+
+        if 'exception_due' not in election.keys():
+            election['exception_due'] = election['start_datetime']
+        return election
+
+    def compile(self):
+        """
+        Parse and validate everything the views need from the election's
+        files, the record served to the requests and stored in the meta
+        snapshot. Invalid voters and candidate files are left out of the
+        record and reported in its errors (the sync keeps the previous voters
+        of a record without voters), the record of an invalid election.yaml
+        only has the errors.
+
+        Returns:
+            dict: {'election', 'voters', 'candidates', 'profiles', 'errors'}
+        """
+        try:
+            election = self.parse()
+        except Exception as err:
+            return {'errors': ['{}'.format(err)]}
+
+        errors, record = [], {}
+        try:
+            indexed = bool(self.indexing and self.VOTERS)
+            voters = self.index() if indexed else self.yaml(Election.VOT)
+            if voters is not None and not isinstance(voters, dict):
+                raise Exception('is not a mapping')
+            if voters and not indexed:
+                voters['eligible_voters'] = frozenset(voters.get('eligible_voters') or [])
+            record['voters'] = voters
+        except Exception as err:
+            errors.append('{} : {}'.format(Election.VOT, err))
+
+        profiles = {}
+        fields = election.get('show_candidate_fields') or []
+        for cid in self.cids():
+            name = 'candidate-{}.md'.format(cid)
+            try:
+                profiles[cid] = self.profile(self.storage.read(os.path.join(self.path, name)), cid, fields)
+            except Exception as err:
+                errors.append('{} : {}'.format(name, err))
+
+        candidates = []
+        for profile in profiles.values():
+            candidate = {k: v for k, v in profile.items() if k not in ('description', 'fields')}
+            candidate['key'] = candidate['ID']
+            candidates.append(candidate)
+
+        record.update({
+            'election': election,
+            'candidates': candidates,
+            'profiles': profiles,
+            'errors': errors,
+        })
+        return record
+
+    @staticmethod
+    def profile(md, cid, fields):
+        """
+        Build the ready to render record of a candidate file
+
+        Args:
+            md (string): content of the candidate-<cid>.md file
+            cid (string): id of the candidate, from the file's name
+            fields (list): show_candidate_fields of the election
+
+        Returns:
+            dict: candidate info, extracted fields and rendered description
+        """
+        candidate = utils.extract_candidate_info(md)
+        if not isinstance(candidate, dict) or not candidate.get('ID'):
+            raise Exception('invalid candidate info, an ID is required')
+
+        info = candidate.get('info') or []
+        if not isinstance(info, list) or not all(isinstance(i, dict) and i for i in info):
+            raise Exception('info must be a list of fields')
+
+        candidate['key'] = cid
+        candidate['description'] = utils.parse_md(utils.extract_candidate_description(md), False)
+        # only the candidate optional fields that are listed in show_candidate_fields,
+        # unfilled fields are '' so the label still displays
+        candidate['fields'] = dict.fromkeys(fields, '')
+        for i in info:
+            field = list(i.keys())[0]
+            if field in candidate['fields']:
+                candidate['fields'][field] = i[field]
+        return candidate
+
+    def index(self):
+        """
+        Stream the eligible voters of voters.yaml into the election's voters
+        index, next to the snapshot
+
+        Returns:
+            dict: voters with the index as the eligible voters, None if the
+                election has no voters.yaml
+        """
+        stream = self.storage.open(os.path.join(self.path, Election.VOT))
+        if stream is None:
+            return None
+
+        os.makedirs(self.VOTERS, exist_ok=True)
+        with stream:
+            index = VoterIndex.write(os.path.join(self.VOTERS, self.key + '.idx'), VoterIndex.parse(stream))
+        return {'eligible_voters': index}
+
+    def cids(self):
+        """
+        Ids of the election's candidates, from the candidate files' names
+        """
+        return [f[len('candidate-'):-len('.md')] for f in self.storage.listdir(self.path)
+                if f.startswith('candidate-') and f.endswith('.md')]
+
+    def stamp(self):
+        """
+        Path and storage stamp of the election's files, changes whenever the
+        election is checked out somewhere else or one of its files is added,
+        removed or modified.
+        """
+        return (self.path, self.storage.stamp(self.path))
+
+    def yaml(self, name):
+        content = self.storage.read(os.path.join(self.path, name))
+        return None if content is None else utils.parse_yaml_from_string(content)
+
+    def markdown(self, name):
+        content = self.storage.read(os.path.join(self.path, name))
+        return None if content is None else utils.parse_md(content, False)
+
     def status(self):
         start = self.election['start_datetime']
         end = self.election['end_datetime']
@@ -127,33 +731,56 @@ class Election(Meta):
             return constants.ELEC_STAT_RUNNING
 
     def description(self):
-        return utils.parse_md(os.path.join(self.path, Election.DES))
+        return self.markdown(Election.DES)
 
     def results(self):
-        return utils.parse_md(os.path.join(self.path, Election.RES))
+        return self.markdown(Election.RES)
 
     def voters(self):
-        return utils.parse_yaml(os.path.join(self.path, Election.VOT))
-        
+        return self.record.get('voters')
+
+    @staticmethod
+    def eligible_for(username):
+        """
+        Keys of the elections the user is eligible for, from the index built
+        by the sync
+
+        Returns:
+            list: election keys, empty until the meta has been synced
+        """
+        index = VoterIndex.open(Meta(APP.config['META']).ELIGIBILITY)
+        return index.values(username) if index is not None else []
+
+    def eligible(self, username):
+        """
+        Check if the user is an eligible voter of the election, a lookup in
+        the voters index when the election is served from the snapshot
+        """
+        voters = self.voters()
+        return bool(voters) and username in (voters.get('eligible_voters') or [])
+
+    def kdf(self):
+        """
+        Argon2i limits of the election's ballot keys, kdf_opslimit and
+        kdf_memlimit of election.yaml or the KDF_OPSLIMIT and KDF_MEMLIMIT
+        of the config
+
+        Returns:
+            tuple: (opslimit, memlimit)
+        """
+        election = self.get()
+        return (election.get('kdf_opslimit') or APP.config['KDF_OPSLIMIT'],
+                election.get('kdf_memlimit') or APP.config['KDF_MEMLIMIT'])
+
     def showfields(self):
-        # FIXME: show_candidate_fields could be None (as is the case in the name_the_app example meta), leading to an
-        #  error if showfields() is called. See: https://github.com/elekto-io/elekto/issues/98
-        return dict.fromkeys(self.election['show_candidate_fields'], '')
+        # show_candidate_fields could be None (as is the case in the name_the_app example meta)
+        return dict.fromkeys(self.election.get('show_candidate_fields') or [], '')
 
     def candidates(self):
         """
-        Build candidates and a list of candidates in random order
+        List of the valid candidates in random order
         """
-        files = [k for k in os.listdir(self.path) if k.startswith('candidate')]
-        candidates = []
-        for f in files:
-            md = open(os.path.join(self.path, f)).read()
-            try:
-                c = utils.extract_candidate_info(md)
-                c['key'] = c['ID']
-                candidates.append(c)
-            except:
-                raise Exception("Invalid candidate file : {}".format(f))
+        candidates = [dict(c) for c in self.record['candidates']]
 
         # As per the specifications the candidates must!! be in random order
         random.shuffle(candidates)
@@ -161,20 +788,40 @@ class Election(Meta):
         return candidates
 
     def candidate(self, cid):
-        path = os.path.join(self.path, 'candidate-{}.md'.format(cid))
-        if not os.path.exists(path) or not os.path.isfile(path):
+        if cid not in self.record['profiles']:
             return F.abort(404)
+        return dict(self.record['profiles'][cid])
 
-        md = open(path).read()
-        candidate = utils.extract_candidate_info(md)
-        candidate['key'] = cid
-        candidate['description'] = utils.parse_md(
-            utils.extract_candidate_description(md), False)
-        # return only the candidate optional fields that are listed in show_candidate_fields
-        # unfilled fields are returned as '' so the label still displays
-        candidate['fields'] = self.showfields()
-        for info in candidate['info']:
-            field = list(info.keys())[0]
-            if field in candidate['fields']:
-                candidate['fields'][field] = info[field]
-        return candidate
+
+def configure(config):
+    """
+    Initializer of the sync's worker processes, the workers read the meta
+    the parent is syncing
+    """
+    APP.config['META'] = config
+
+
+def record(key):
+    """
+    Compile an election, in the sync's process or in one of its workers. The
+    errors are returned in the record instead of aborting the sync.
+
+    Args:
+        key (string): key of the election
+
+    Returns:
+        dict: compiled record of the election (see Election.compile)
+    """
+    Election.invalidate([key])
+    try:
+        record = dict(Election(key, snapshot=False, index=True).record)
+    except Exception as err:
+        # the compiled errors of an invalid election.yaml, or why it could not be read
+        cached = Election.CACHE.get(key)
+        return {'errors': cached[1]['errors'] if cached else ['{}'.format(err)]}
+
+    # stored in the database along with the election
+    record['counts'] = {'candidate_count': len(record['profiles'])}
+    if 'voters' in record:
+        record['counts']['voter_count'] = len((record['voters'] or {}).get('eligible_voters') or [])
+    return record
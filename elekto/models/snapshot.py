@@ -0,0 +1,93 @@
+# Copyright 2026 The Elekto Authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Compiled meta snapshot - a single file holding every parsed election, written
+by the sync and memory mapped (read-only) by all the application's processes,
+so the pages are shared through the OS page cache.
+
+Layout:
+    MAGIC | offset of the header (8 bytes) | records... | header
+
+The header is a pickled dict with the version (meta commit) of the snapshot
+and the index {key: (offset, length)} of the pickled election records.
+"""
+
+import pickle
+import struct
+
+from elekto.models.mapped import MappedFile
+
+MAGIC = b'ELEKTO-SNAPSHOT-1\n'
+OFFSET = struct.Struct('<Q')
+
+
+class Snapshot(MappedFile):
+
+    MAGIC = MAGIC
+    KIND = 'meta snapshot'
+
+    # Snapshots mapped by this process, keyed by path
+    OPEN = {}
+
+    def load(self):
+        (offset,) = OFFSET.unpack_from(self.data, len(MAGIC))
+        header = pickle.loads(self.data[offset:])
+        self.version = header['version']
+        self.index = header['index']
+
+    def keys(self):
+        return list(self.index.keys())
+
+    def __contains__(self, key):
+        return key in self.index
+
+    def raw(self, key):
+        start, length = self.index[key]
+        return self.data[start:start + length]
+
+    def get(self, key):
+        """
+        Get the record of the election, None if the snapshot does not have it
+        """
+        if key not in self.index:
+            return None
+        return pickle.loads(self.raw(key))
+
+    @staticmethod
+    def write(path, version, records):
+        """
+        Write a snapshot and swap it in place of the one at the path
+
+        Args:
+            path (string): location of the snapshot
+            version (string): version of the snapshot (meta commit)
+            records (dict): election key to the record, or to the already
+                pickled record taken from the previous snapshot
+        """
+        index = {}
+
+        with MappedFile.replace(path) as f:
+            f.write(MAGIC)
+            f.write(OFFSET.pack(0))
+            for key, record in records.items():
+                if not isinstance(record, bytes):
+                    record = pickle.dumps(record, protocol=pickle.HIGHEST_PROTOCOL)
+                index[key] = (f.tell(), len(record))
+                f.write(record)
+
+            offset = f.tell()
+            f.write(pickle.dumps({'version': version, 'index': index}, protocol=pickle.HIGHEST_PROTOCOL))
+            f.seek(len(MAGIC))
+            f.write(OFFSET.pack(offset))
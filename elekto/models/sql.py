@@ -17,10 +17,13 @@
 import uuid
 import sqlalchemy as S
 
+from datetime import datetime
+
 from sqlalchemy.orm import sessionmaker, scoped_session, declarative_base
 from sqlalchemy.types import TypeDecorator, CHAR
 from sqlalchemy import event
 
+from elekto import constants
 
 BASE = declarative_base()
 
@@ -28,7 +31,7 @@ BASE = declarative_base()
 schema version, remember to update this
 whenever you make changes to the schema
 """
-schema_version = 2
+schema_version = 9
 
 
 def create_session(url):
@@ -103,6 +106,34 @@ def update_schema(engine, schema_version):
         if db_version < 2:
             db_version = update_schema_2(engine)
             continue
+
+        if db_version < 3:
+            db_version = update_schema_3(engine)
+            continue
+
+        if db_version < 4:
+            db_version = update_schema_4(engine)
+            continue
+
+        if db_version < 5:
+            db_version = update_schema_5(engine)
+            continue
+
+        if db_version < 6:
+            db_version = update_schema_6(engine)
+            continue
+
+        if db_version < 7:
+            db_version = update_schema_7(engine)
+            continue
+
+        if db_version < 8:
+            db_version = update_schema_8(engine)
+            continue
+
+        if db_version < 9:
+            db_version = update_schema_9(engine)
+            continue
             
     return db_version
 
@@ -131,6 +162,128 @@ def update_schema_2(engine):
     
     return 2
 
+def update_schema_3(engine):
+    """
+    update from schema version 2 to schema version 3, the election table
+    stores the fields the listings filter and sort on
+    currently only works for PostgreSQL
+    """
+    has_sync = S.inspect(engine).has_table('sync')
+    session = scoped_session(sessionmaker(bind=engine))
+
+    session.execute('ALTER TABLE election ADD COLUMN organization VARCHAR(255), '
+                    'ADD COLUMN start_datetime TIMESTAMP, ADD COLUMN end_datetime TIMESTAMP, '
+                    'ADD COLUMN exception_due TIMESTAMP, ADD COLUMN officers JSON, '
+                    'ADD COLUMN candidate_count INT, ADD COLUMN voter_count INT;')
+    session.execute('CREATE INDEX ix_election_organization ON election(organization);')
+    session.execute('CREATE INDEX ix_election_start_datetime ON election(start_datetime);')
+    session.execute('CREATE INDEX ix_election_end_datetime ON election(end_datetime);')
+    session.execute('CREATE INDEX ix_election_exception_due ON election(exception_due);')
+    if has_sync:
+        # the next sync is a full one, filling the new columns
+        session.execute('DELETE FROM sync;')
+    session.execute('UPDATE schema_version SET version = 3;')
+    session.commit()
+
+    return 3
+
+
+def update_schema_4(engine):
+    """
+    update from schema version 3 to schema version 4, the users are looked
+    up by their token
+    currently only works for PostgreSQL
+    """
+    session = scoped_session(sessionmaker(bind=engine))
+
+    session.execute('CREATE INDEX ix_user_token ON "user"(token);')
+    session.execute('UPDATE schema_version SET version = 4;')
+    session.commit()
+
+    return 4
+
+
+def update_schema_5(engine):
+    """
+    update from schema version 4 to schema version 5, whether a user has
+    voted is looked up by (election_id, user_id)
+    currently only works for PostgreSQL
+    """
+    session = scoped_session(sessionmaker(bind=engine))
+
+    session.execute('CREATE INDEX ix_voter_election_user ON voter(election_id, user_id);')
+    session.execute('UPDATE schema_version SET version = 5;')
+    session.commit()
+
+    return 5
+
+
+def update_schema_6(engine):
+    """
+    update from schema version 5 to schema version 6, a user votes once per
+    election: the (election_id, user_id) index of the voters is unique.
+    Fails if a user has voted twice in an election, the duplicates must be
+    reviewed and removed by hand first
+    currently only works for PostgreSQL
+    """
+    session = scoped_session(sessionmaker(bind=engine))
+
+    session.execute('DROP INDEX ix_voter_election_user;')
+    session.execute('CREATE UNIQUE INDEX ix_voter_election_user ON voter(election_id, user_id);')
+    session.execute('UPDATE schema_version SET version = 6;')
+    session.commit()
+
+    return 6
+
+
+def update_schema_7(engine):
+    """
+    update from schema version 6 to schema version 7, the voters record the
+    Argon2i limits their ballot id was encrypted with. The votes already
+    cast used the interactive limits
+    currently only works for PostgreSQL
+    """
+    session = scoped_session(sessionmaker(bind=engine))
+
+    session.execute('ALTER TABLE voter ADD COLUMN kdf_opslimit INTEGER;')
+    session.execute('ALTER TABLE voter ADD COLUMN kdf_memlimit BIGINT;')
+    session.execute('UPDATE voter SET kdf_opslimit = 4, kdf_memlimit = 33554432;')
+    session.execute('UPDATE schema_version SET version = 7;')
+    session.commit()
+
+    return 7
+
+
+def update_schema_8(engine):
+    """
+    update from schema version 7 to schema version 8, index the ballots by
+    (election_id, voter) for the ballots of a voter revoked or viewed
+    currently only works for PostgreSQL
+    """
+    session = scoped_session(sessionmaker(bind=engine))
+
+    session.execute('CREATE INDEX ix_ballot_election_voter ON ballot(election_id, voter);')
+    session.execute('UPDATE schema_version SET version = 8;')
+    session.commit()
+
+    return 8
+
+
+def update_schema_9(engine):
+    """
+    update from schema version 8 to schema version 9, index the voters by
+    user for the version of the user's past elections
+    currently only works for PostgreSQL
+    """
+    session = scoped_session(sessionmaker(bind=engine))
+
+    session.execute('CREATE INDEX ix_voter_user_id ON voter(user_id);')
+    session.execute('UPDATE schema_version SET version = 9;')
+    session.commit()
+
+    return 9
+
+
 def drop_all(url: str):
     engine = S.create_engine(url)
     BASE.metadata.drop_all(bind=engine)
@@ -191,7 +344,7 @@ class User(BASE):
     id = S.Column(S.Integer, primary_key=True)
     username = S.Column(S.String(255), unique=True)
     name = S.Column(S.String(255), nullable=True)
-    token = S.Column(S.String(255), nullable=True)
+    token = S.Column(S.String(255), nullable=True, index=True)
     token_expires_at = S.Column(S.DateTime, nullable=True)
     created_at = S.Column(S.DateTime, default=S.func.now())
     updated_at = S.Column(S.DateTime, default=S.func.now())
@@ -218,11 +371,16 @@ class Election(BASE):
         - key: slugified directory name from election meta.
         - name: name of the election synced from election meta.
         - created_at: descriptive attributes
+        - organization, start_datetime, end_datetime, exception_due,
+          officers: synced from the election meta, for SQL-side listing
+        - candidate_count, voter_count: number of candidates and of
+          eligible voters in the election meta
 
     Relationships:
         - ballots: Election has many Ballot
         - voters: Election has many Voter (that have voted)
         - requests: Election has many Request
+        - eligible_voters: Election has many EligibleVoter
     """
 
     __tablename__ = "election"
@@ -233,6 +391,13 @@ class Election(BASE):
     name = S.Column(S.String(255), nullable=True)
     created_at = S.Column(S.DateTime, default=S.func.now())
     updated_at = S.Column(S.DateTime, default=S.func.now())
+    organization = S.Column(S.String(255), nullable=True, index=True)
+    start_datetime = S.Column(S.DateTime, nullable=True, index=True)
+    end_datetime = S.Column(S.DateTime, nullable=True, index=True)
+    exception_due = S.Column(S.DateTime, nullable=True, index=True)
+    officers = S.Column(S.JSON, nullable=True)
+    candidate_count = S.Column(S.Integer, nullable=True)
+    voter_count = S.Column(S.Integer, nullable=True)
 
     # Relationships
     ballots = S.orm.relationship(
@@ -247,12 +412,66 @@ class Election(BASE):
         back_populates="election",
         passive_deletes=True,
     )
+    eligible_voters = S.orm.relationship(
+        "EligibleVoter", cascade="all, delete", back_populates="election", passive_deletes=True
+    )
 
     def __repr__(self):
         return "<Election(election_id={}, key={}, name={})>".format(
             self.id, self.key, self.name
         )
 
+    @staticmethod
+    def with_status(status, now=None):
+        """
+        SQL condition matching the elections of a status, the same as the
+        status computed from the meta (see meta.Election.status)
+
+        Args:
+            status (string): upcoming, running or completed
+            now (datetime): time the status is evaluated at
+
+        Returns:
+            SQL expression to filter the elections with
+        """
+        now = now or datetime.now()
+        if status == constants.ELEC_STAT_UPCOMING:
+            return Election.start_datetime > now
+        if status == constants.ELEC_STAT_COMPLETED:
+            return Election.end_datetime < now
+        if status == constants.ELEC_STAT_RUNNING:
+            return S.and_(Election.start_datetime <= now, Election.end_datetime >= now)
+        return S.false()
+
+    def status(self, now=None):
+        if self.start_datetime is None or self.end_datetime is None:
+            return None  # not synced since the dates are stored
+
+        now = now or datetime.now()
+        if now < self.start_datetime:
+            return constants.ELEC_STAT_UPCOMING
+        elif self.end_datetime < now:
+            return constants.ELEC_STAT_COMPLETED
+        else:
+            return constants.ELEC_STAT_RUNNING
+
+    def listing(self):
+        """
+        The election as listed by the views, without reading the meta
+        """
+        return {
+            'key': self.key,
+            'name': self.name,
+            'organization': self.organization,
+            'start_datetime': self.start_datetime,
+            'end_datetime': self.end_datetime,
+            'exception_due': self.exception_due,
+            'election_officers': self.officers or [],
+            'candidate_count': self.candidate_count,
+            'voter_count': self.voter_count,
+            'status': self.status(),
+        }
+
 
 class Voter(BASE):
     """
@@ -261,6 +480,7 @@ class Voter(BASE):
     Attributes:
         - salt: byte string for encryption
         - ballot_id: byte string obtained after encrypting ballot.voter
+        - kdf_opslimit, kdf_memlimit: Argon2i limits of the encryption
 
     Relationships:
         - election_id: inverse of the (Election has many Voter) relation
@@ -268,14 +488,17 @@ class Voter(BASE):
     """
 
     __tablename__ = "voter"
+    __table_args__ = (S.Index("ix_voter_election_user", "election_id", "user_id", unique=True),)
 
     id = S.Column(S.Integer, primary_key=True)
-    user_id = S.Column(S.Integer, S.ForeignKey("user.id", ondelete="CASCADE"))
+    user_id = S.Column(S.Integer, S.ForeignKey("user.id", ondelete="CASCADE"), index=True)
     election_id = S.Column(S.Integer, S.ForeignKey("election.id", ondelete="CASCADE"), index=True)
     created_at = S.Column(S.DateTime, default=S.func.now())
     updated_at = S.Column(S.DateTime, default=S.func.now())
     salt = S.Column(S.LargeBinary)
     ballot_id = S.Column(S.LargeBinary)  # encrypted
+    kdf_opslimit = S.Column(S.Integer, nullable=True)
+    kdf_memlimit = S.Column(S.BigInteger, nullable=True)
 
     # Relationships
 
@@ -288,6 +511,34 @@ class Voter(BASE):
         )
 
 
+class EligibleVoter(BASE):
+    """
+    EligibleVoter Schema - eligible voters of the election, synced from the
+    election's voters.yaml.
+
+    Attributes:
+        - username: github username of the eligible voter
+
+    Relationships:
+        - election_id: inverse of the (Election has many EligibleVoter) relation
+    """
+
+    __tablename__ = "eligible_voter"
+    __table_args__ = (S.UniqueConstraint("election_id", "username"),)
+
+    id = S.Column(S.Integer, primary_key=True)
+    election_id = S.Column(S.Integer, S.ForeignKey("election.id", ondelete="CASCADE"), nullable=False)
+    username = S.Column(S.String(255), nullable=False, index=True)
+
+    # Relationships
+    election = S.orm.relationship("Election", back_populates="eligible_voters")
+
+    def __repr__(self):
+        return "<EligibleVoter(election_id={}, username={})>".format(
+            self.election_id, self.username
+        )
+
+
 class Ballot(BASE):
     """
     Ballot Schema - stores  the voter's choice, for a given election(E)
@@ -310,6 +561,7 @@ class Ballot(BASE):
     """
 
     __tablename__ = "ballot"
+    __table_args__ = (S.Index("ix_ballot_election_voter", "election_id", "voter"),)
 
     # Attributes
     id = S.Column(UUID(), primary_key=True, default=uuid.uuid4)
@@ -367,3 +619,46 @@ class Request(BASE):
         return "<Request election_id={}, user_id={}, name={}".format(
             self.election_id, self.user_id, self.name
         )
+
+
+class Sync(BASE):
+    """
+    Sync Schema - record of every sync of the database with the meta.
+
+    Attributes:
+        - commit: meta repository commit the database was synced to
+        - duration: time taken by the sync in seconds
+    """
+
+    __tablename__ = "sync"
+
+    # Attributes
+    id = S.Column(S.Integer, primary_key=True)
+    commit = S.Column(S.String(40), nullable=False)
+    duration = S.Column(S.Float, nullable=True)
+    created_at = S.Column(S.DateTime, default=S.func.now())
+
+    def __repr__(self):
+        return "<Sync(commit={}, duration={})>".format(self.commit, self.duration)
+
+
+class RateLimit(BASE):
+    """
+    RateLimit Schema - token buckets of the rate limits shared by the
+    processes (see models.limits.DatabaseStore).
+
+    Attributes:
+        - key: the limited route and user
+        - tokens: tokens left in the bucket at stamp
+        - stamp: time of the bucket's last request (unix time)
+    """
+
+    __tablename__ = "rate_limit"
+
+    # Attributes
+    key = S.Column(S.String(255), primary_key=True)
+    tokens = S.Column(S.Float, nullable=False)
+    stamp = S.Column(S.Float, nullable=False)
+
+    def __repr__(self):
+        return "<RateLimit(key={}, tokens={})>".format(self.key, self.tokens)
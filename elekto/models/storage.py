@@ -0,0 +1,267 @@
+# Copyright 2026 The Elekto Authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Storage backends the meta is read from - the working tree (default) or the
+git objects of a revision, without a checkout.
+"""
+
+import io
+import os
+import threading
+import subprocess
+
+
+class FileStore:
+    """
+    Reads the meta from the working tree
+    """
+
+    def exists(self, path):
+        return os.path.exists(path)
+
+    def isdir(self, path):
+        return os.path.isdir(path)
+
+    def isfile(self, path):
+        return os.path.isfile(path)
+
+    def listdir(self, path):
+        return os.listdir(path)
+
+    def walk(self, path):
+        return os.walk(path, topdown=True)
+
+    def entries(self, path):
+        """
+        List the entries of a directory as {name: is a directory}, None if the
+        path is not a directory
+        """
+        try:
+            with os.scandir(path) as it:
+                return {e.name: e.is_dir() for e in it}
+        except (FileNotFoundError, NotADirectoryError):
+            return None
+
+    def dirstamp(self, path):
+        """
+        Modification time of the directory, changes whenever an entry is
+        added to, removed from or renamed in it
+        """
+        try:
+            return os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def read(self, path):
+        """
+        Read the file, returns None if the file does not exist
+        """
+        try:
+            with open(path, 'r') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def open(self, path):
+        """
+        Open the file as a text stream, None if the file does not exist
+        """
+        try:
+            return open(path, 'r')
+        except FileNotFoundError:
+            return None
+
+    def stamp(self, path):
+        """
+        Name, modification time and size of the files of the directory,
+        changes whenever a file is added, removed or modified.
+        """
+        return tuple(sorted((f.name, f.stat().st_mtime_ns, f.stat().st_size)
+                            for f in os.scandir(path) if f.is_file()))
+
+
+class GitStore:
+    """
+    Reads the meta straight from the git objects of a revision through one
+    long-lived `git cat-file --batch` process per worker, the revision is
+    resolved to a commit once so a reader sees a single revision.
+
+    Paths are given as in the working tree (under `root`) and are looked up
+    relative to it in the revision's tree. Without a `gitdir`, the git
+    directory of the working tree at `root` (or the bare repository at
+    `root`) is used, resolved on the first read so the meta can be cloned
+    after the store is created.
+    """
+
+    # cat-file processes, keyed by (pid, gitdir) as workers must never share
+    # the process of the master they were forked from
+    PROCESSES = {}
+    LOCK = threading.Lock()
+
+    def __init__(self, gitdir, root, revision, git='/usr/bin/git'):
+        self.given = gitdir
+        self.root = root
+        self.revision = revision
+        self.git = git
+        self._gitdir = gitdir
+        self._commit = None
+
+    @property
+    def gitdir(self):
+        if self._gitdir is None:
+            dotgit = os.path.join(self.root, '.git')
+            self._gitdir = dotgit if os.path.isdir(dotgit) else self.root
+        return self._gitdir
+
+    def reset(self, root=None):
+        """
+        Forget the resolved git directory and commit, ie: after a clone or a
+        pull moved the branch
+
+        Args:
+            root (string): where the working tree is now (ie: the checkout an
+                atomic pull flipped the meta to), default: unchanged
+        """
+        if root is not None:
+            self.root = root
+        self._gitdir = self.given
+        self._commit = None
+
+    @property
+    def commit(self):
+        if self._commit is None:
+            obj = self.object('{}^{{commit}}'.format(self.revision))
+            if obj is None:
+                raise ValueError('Unknown revision {}'.format(self.revision))
+            self._commit = obj[0]
+        return self._commit
+
+    def process(self):
+        key = (os.getpid(), self.gitdir)
+        proc = GitStore.PROCESSES.get(key)
+        if proc is None or proc.poll() is not None:
+            proc = subprocess.Popen([self.git, '--git-dir', self.gitdir, 'cat-file', '--batch'],
+                                    stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+            GitStore.PROCESSES[key] = proc
+        return proc
+
+    def object(self, name):
+        """
+        Get an object from the batch process
+
+        Args:
+            name (string): object name, ie: <commit>:<path>
+
+        Returns:
+            tuple: (oid, type, content) of the object, None if it is missing
+        """
+        with GitStore.LOCK:
+            proc = self.process()
+            try:
+                proc.stdin.write(name.encode('utf-8') + b'\n')
+                proc.stdin.flush()
+                header = proc.stdout.readline().rstrip(b'\n')
+            except BrokenPipeError:
+                header = b''
+
+            if header.endswith(b' missing') or header.endswith(b' ambiguous'):
+                return None
+
+            if len(header.split(b' ')) != 3:
+                # the process exited, ie: the git directory is not a repository
+                GitStore.PROCESSES.pop((os.getpid(), self.gitdir), None)
+                raise RuntimeError('git cat-file --batch of {} failed reading {}: {}'.format(
+                    self.gitdir, name, header.decode('utf-8', 'replace') or 'no output'))
+
+            oid, kind, size = header.split(b' ')
+            content = proc.stdout.read(int(size))
+            proc.stdout.read(1)  # trailing newline
+
+        return oid.decode(), kind.decode(), content
+
+    def lookup(self, path):
+        rel = os.path.relpath(path, self.root)
+        if rel == '..' or rel.startswith('..' + os.sep):
+            return None
+        return self.object('{}:{}'.format(self.commit, '' if rel == '.' else rel))
+
+    def entries(self, path):
+        """
+        List the entries of a tree as {name: is a directory}, None if the
+        path is not a directory
+        """
+        obj = self.lookup(path)
+        if obj is None or obj[1] != 'tree':
+            return None
+
+        data, size = obj[2], len(self.commit) // 2
+        entries, i = {}, 0
+        while i < len(data):
+            space = data.index(b' ', i)
+            nul = data.index(b'\0', space)
+            entries[data[space + 1:nul].decode('utf-8')] = data[i:space] == b'40000'
+            i = nul + 1 + size
+
+        return entries
+
+    def exists(self, path):
+        return self.lookup(path) is not None
+
+    def isdir(self, path):
+        obj = self.lookup(path)
+        return obj is not None and obj[1] == 'tree'
+
+    def isfile(self, path):
+        obj = self.lookup(path)
+        return obj is not None and obj[1] == 'blob'
+
+    def listdir(self, path):
+        entries = self.entries(path)
+        if entries is None:
+            raise FileNotFoundError(path)
+        return list(entries.keys())
+
+    def walk(self, path):
+        entries = self.entries(path)
+        if entries is None:
+            return
+
+        dirs = [name for name, isdir in entries.items() if isdir]
+        files = [name for name, isdir in entries.items() if not isdir]
+        yield path, dirs, files
+
+        # like os.walk(topdown=True), the caller may prune dirs in place
+        for name in dirs:
+            yield from self.walk(os.path.join(path, name))
+
+    def read(self, path):
+        obj = self.lookup(path)
+        if obj is None or obj[1] != 'blob':
+            return None
+        return obj[2].decode('utf-8')
+
+    def open(self, path):
+        content = self.read(path)
+        return None if content is None else io.StringIO(content)
+
+    def stamp(self, path):
+        """
+        Id of the directory's tree, changes whenever a file in it changes
+        """
+        obj = self.lookup(path)
+        return obj[0] if obj is not None else None
+
+    # a tree's id covers its entries too
+    dirstamp = stamp
@@ -15,11 +15,16 @@
 # Author(s):         Manish Sahani <rec.manish.sahani@gmail.com>
 
 import os
+import math
 import yaml
 import markdown2 as markdown
 
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+
+from datetime import date, datetime
+
 from elekto import constants
-from elekto.models.sql import Election
+from elekto.models.sql import Election, EligibleVoter, Voter, Ballot, Request
 
 # to preserve the import consistency
 try:
@@ -91,48 +96,265 @@ def extract_candidate_description(md):
     return desc
 
 
-def sync(session, elections):
+class SyncDiff:
+    """
+    Structured result of a sync between the meta and the database, printed
+    as the sync log
+
+    Attributes:
+        - added: key to name of the elections added in the database
+        - updated: keys of the elections whose fields changed
+        - removed: keys of the elections deleted from the database
+        - renamed: (old key, new key) of the elections moved in the meta
+        - voters: key to the number of (added, removed) eligible voters
+        - errors: key to the errors of the election's meta files
+    """
+
+    def __init__(self):
+        self.added = {}
+        self.updated = []
+        self.removed = []
+        self.renamed = []
+        self.voters = {}
+        self.errors = {}
+
+    def __bool__(self):
+        return bool(self.added or self.updated or self.removed or self.renamed or self.voters)
+
+    def __str__(self):
+        lines = ["---------------------*=  Syncing started =*----------------------\n"]
+        for key, messages in self.errors.items():
+            lines += [" x {}: {}".format(key, m) for m in messages]
+        lines += [" - Deleted {} from the database.".format(k) for k in self.removed]
+        lines += [" > Renamed {} to {} in the database.".format(o, n) for o, n in self.renamed]
+        lines += [" + {} added in the database.".format(name) for name in self.added.values()]
+        lines += [" * Updated {} in the database.".format(k) for k in self.updated]
+        lines += [" ~ {}: {} eligible voters added, {} removed.".format(k, a, r)
+                  for k, (a, r) in self.voters.items()]
+        lines.append("\n\n---------------------*= Syncing completed *=--------------------")
+        return "\n".join(lines)
+
+
+# columns compared and written by the sync, see election_fields
+SYNCED = ('name', 'organization', 'start_datetime', 'end_datetime', 'exception_due',
+          'officers', 'candidate_count', 'voter_count')
+
+# columns counted by the sync
+COUNTS = ('candidate_count', 'voter_count')
+
+# rows per statement, databases cap the number of bound parameters
+CHUNK = 500
+
+
+def identity(fields):
+    """
+    What identifies an election moved to another key in the meta
+    """
+    return (fields['name'], fields['organization'], fields['start_datetime'])
+
+
+def chunks(items, size=CHUNK):
+    items = list(items)
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def sync(session, elections, keys=None, voters=None, errors=None):
     """
-    Sync db with the meta - add and delete old elections
+    Sync db with the meta in one transaction, the stored elections are
+    loaded in one query and the difference is applied with bulk statements
+
+    An election removed from the meta under one key and added under another
+    with the same name, organization and start is renamed in place, so its
+    voters and ballots are kept.
 
     Args:
         session (object): database session
         elections (dict): list of all the elections from the meta
+        keys (set): keys of the elections changed in the meta, elections
+            outside of it are left untouched (default: full sync)
+        voters (dict): eligible voters of the elections whose voters.yaml
+            changed, by election key
+        errors (dict): errors of the meta files, by election key. Elections
+            with errors that are not in `elections` failed to compile and
+            are left untouched
 
     Returns:
-        string: returns a log
+        SyncDiff: what the sync changed, its str() is the sync log
     """
-    meta_elections = {e['key']: e for e in elections}
-    log = "---------------------*=  Syncing started =*----------------------\n\n"
+    diff = SyncDiff()
+    diff.errors = dict(errors or {})
+    meta_elections = {e['key']: election_fields(e) for e in elections}
+    invalid = set(diff.errors) - set(meta_elections)
 
-    # Delete election from the database that are not in the meta anymore
     try:
-        elections = session.query(Election).all()
-        for election in elections:
-            if election.key not in meta_elections.keys():
-                log += " - Deleted {} from the database.\n".format(election.key)
-                session.delete(election)
-    except:
-        log += " x Error while querying to the database.\n"
-
-    # Add the new added elections from the meta in the database.
-    for e in meta_elections.keys():
-        try:
-            q = session.query(Election).filter_by(key=e).first()
-            if q:
-                q.name = meta_elections[e]['name']
-            else:
-                session.add(Election(key=e, name=meta_elections[e]['name']))
-                # Add the entry to the log
-                log += " + {} added in the database.\n".format(meta_elections[e]['name'])
-        except:
-            # Add error to the log
-            log += " x while adding {} in the database, application ran in to error.\n"
-
-    log += "\n\n---------------------*= Syncing completed *=--------------------"
-    session.commit()
-
-    return log
+        query = session.query(Election.id, Election.key, *[getattr(Election, c) for c in SYNCED])
+        if keys is not None:
+            query = query.filter(Election.key.in_(set(keys) | set(meta_elections)))
+        stored = {row.key: row for row in query}
+
+        removed = {k: stored[k] for k in stored
+                   if k not in meta_elections and k not in invalid and (keys is None or k in keys)}
+        added = [k for k in meta_elections if k not in stored]
+
+        # Match the removed and added elections that are the same election moved in the meta
+        moved = {}
+        for k, row in removed.items():
+            moved.setdefault(identity(row._mapping), []).append(k)
+        for k in list(added):
+            olds = moved.get(identity(meta_elections[k]))
+            if olds and len(olds) == 1:
+                old = olds.pop()
+                diff.renamed.append((old, k))
+                del removed[old]
+                added.remove(k)
+
+        ids = [row.id for row in removed.values()]
+        for chunk in chunks(ids):
+            for model in (Voter, Ballot, Request, EligibleVoter):
+                session.query(model).filter(model.election_id.in_(chunk)).delete(synchronize_session=False)
+            session.query(Election).filter(Election.id.in_(chunk)).delete(synchronize_session=False)
+        diff.removed = sorted(removed)
+
+        updates = [dict(meta_elections[new], id=stored[old].id, key=new) for old, new in diff.renamed]
+        for k, fields in meta_elections.items():
+            # a count the sync could not take (ie: of an invalid voters.yaml)
+            # keeps the stored one
+            fields = {c: v for c, v in fields.items() if v is not None or c not in COUNTS}
+            if k in stored and any(getattr(stored[k], c) != v for c, v in fields.items()):
+                updates.append(dict(fields, id=stored[k].id))
+                diff.updated.append(k)
+        session.bulk_update_mappings(Election, updates)
+
+        upsert(session, [dict(meta_elections[k], key=k) for k in added])
+        diff.added = {k: meta_elections[k]['name'] for k in added}
+
+        # Update the eligible voters of the elections whose voters.yaml changed
+        session.flush()
+        changed = {}
+        for chunk in chunks(voters or {}):
+            changed.update(session.query(Election.key, Election.id).filter(Election.key.in_(chunk)))
+        for e, usernames in (voters or {}).items():
+            if e in changed:
+                added_voters, removed_voters = sync_eligible_voters(session, changed[e], usernames)
+                if added_voters or removed_voters:
+                    diff.voters[e] = (added_voters, removed_voters)
+
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+
+    return diff
+
+
+def upsert(session, rows):
+    """
+    Insert the elections, updating the ones a concurrent sync inserted in
+    the meantime with the dialect's upsert where it has one
+
+    Args:
+        session (object): database session
+        rows (list): column to value of the elections, with their key
+    """
+    dialect = session.get_bind().dialect.name
+    for chunk in chunks(rows):
+        if dialect in ('postgresql', 'sqlite'):
+            insert = (postgresql if dialect == 'postgresql' else sqlite).insert(Election).values(chunk)
+            insert = insert.on_conflict_do_update(
+                index_elements=[Election.key], set_={c: insert.excluded[c] for c in SYNCED})
+        elif dialect == 'mysql':
+            insert = mysql.insert(Election).values(chunk)
+            insert = insert.on_duplicate_key_update({c: insert.inserted[c] for c in SYNCED})
+        else:
+            session.bulk_insert_mappings(Election, chunk)
+            continue
+        session.execute(insert)
+
+
+def sync_eligible_voters(session, election_id, usernames):
+    """
+    Apply the difference between the stored and the given eligible voters of
+    an election, unchanged rows are left alone
+
+    Args:
+        session (object): database session
+        election_id (int): id of the election
+        usernames (iterable): eligible voters from the election's voters.yaml
+
+    Returns:
+        tuple: number of (added, removed) eligible voters
+    """
+    current = {str(u) for u in usernames}
+    stored = {u for (u,) in session.query(EligibleVoter.username).filter_by(election_id=election_id)}
+    added, removed = current - stored, sorted(stored - current)
+
+    for chunk in chunks(removed):
+        session.query(EligibleVoter).filter(
+            EligibleVoter.election_id == election_id,
+            EligibleVoter.username.in_(chunk)).delete(synchronize_session=False)
+    session.bulk_insert_mappings(EligibleVoter, [{'election_id': election_id, 'username': u} for u in added])
+
+    return len(added), len(removed)
+
+
+def election_fields(election):
+    """
+    Normalize the fields of a meta election stored in the database, the
+    listings filter and sort on them without reading the meta
+
+    Args:
+        election (dict): election parsed from the meta, with the number of
+            candidates and eligible voters when the sync counted them
+
+    Returns:
+        dict: column to value
+    """
+    return {
+        'name': election['name'],
+        'organization': election.get('organization'),
+        'start_datetime': to_datetime(election.get('start_datetime')),
+        'end_datetime': to_datetime(election.get('end_datetime')),
+        'exception_due': to_datetime(election.get('exception_due')),
+        'officers': list(election.get('election_officers') or []),
+        'candidate_count': election.get('candidate_count'),
+        'voter_count': election.get('voter_count'),
+    }
+
+
+def to_datetime(value):
+    """
+    The yaml value as a datetime, a date is taken at midnight
+    """
+    if isinstance(value, datetime):
+        return value
+    if isinstance(value, date):
+        return datetime.combine(value, datetime.min.time())
+    return None
+
+
+def listing(session, status=None, page=1, per_page=constants.ELEC_PER_PAGE):
+    """
+    List the elections from the database, latest first
+
+    Args:
+        session (object): database session
+        status (string): only the elections of the status (default: all)
+        page (int): page of the listing, starting at 1
+        per_page (int): elections per page
+
+    Returns:
+        tuple: (elections of the page as dicts, page, number of pages)
+    """
+    query = session.query(Election)
+    if status is not None:
+        query = query.filter(Election.with_status(status))
+
+    pages = max(1, math.ceil(query.count() / per_page))
+    page = min(max(page, 1), pages)
+    query = query.order_by(Election.start_datetime.desc(), Election.id.desc())
+
+    return [e.listing() for e in query.limit(per_page).offset((page - 1) * per_page)], page, pages
+
 
 def parse_md(md, path=True):
     """
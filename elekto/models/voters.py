@@ -0,0 +1,181 @@
+# Copyright 2026 The Elekto Authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+On-disk index of the eligible voters of an election, built by the sync from
+a streamed voters.yaml and memory mapped (read-only) by the workers, so an
+eligibility check is a binary search instead of a list held by every worker.
+
+Layout:
+    MAGIC | count (4 bytes) | offsets (4 bytes, count + 1) | usernames...
+
+The usernames are utf-8 encoded and sorted, the i-th username spans from the
+i-th offset to the next one. An entry may carry values after the username,
+each one prefixed with a NUL byte (ie: the keys of the elections a user is
+eligible for, in the eligibility index).
+"""
+
+import struct
+import yaml
+
+# to preserve the import consistency
+try:
+    from yaml import CLoader as Loader
+except ImportError:
+    from yaml import Loader
+
+from elekto.models.mapped import MappedFile
+
+MAGIC = b'ELEKTO-VOTERS-1\n'
+COUNT = struct.Struct('<I')
+
+
+class VoterIndex(MappedFile):
+
+    MAGIC = MAGIC
+    KIND = 'voters index'
+
+    # Indexes mapped by this process, keyed by path
+    OPEN = {}
+
+    def load(self):
+        (self.count,) = COUNT.unpack_from(self.data, len(MAGIC))
+        self.offsets = len(MAGIC) + COUNT.size
+
+    def __reduce__(self):
+        # pickled (ie: in the meta snapshot) as a reference to the file
+        return VoterIndex.open, (self.path,)
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        for i in range(self.count):
+            yield self.entry(i).split(b'\0', 1)[0].decode('utf-8')
+
+    def __contains__(self, username):
+        return self.find(username) is not None
+
+    def entry(self, i):
+        start, end = struct.unpack_from('<II', self.data, self.offsets + i * 4)
+        return self.data[start:end]
+
+    def find(self, username):
+        """
+        Binary search of the username in the index
+
+        Returns:
+            int: position of the username's entry, None if it is missing
+        """
+        if not isinstance(username, str):
+            return None
+
+        needle = username.encode('utf-8')
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            current = self.entry(mid).split(b'\0', 1)[0]
+            if current == needle:
+                return mid
+            elif current < needle:
+                lo = mid + 1
+            else:
+                hi = mid
+
+        return None
+
+    def values(self, username):
+        """
+        Values of the username's entry
+
+        Returns:
+            list: the values, empty if the username is missing
+        """
+        i = self.find(username)
+        if i is None:
+            return []
+        return [v.decode('utf-8') for v in self.entry(i).split(b'\0')[1:]]
+
+    def items(self):
+        for i in range(self.count):
+            username, *values = self.entry(i).split(b'\0')
+            yield username.decode('utf-8'), [v.decode('utf-8') for v in values]
+
+    @staticmethod
+    def parse(stream):
+        """
+        Stream the eligible voters out of a voters.yaml, without loading the
+        whole document
+
+        Args:
+            stream (file): voters.yaml content
+
+        Returns:
+            generator: usernames of the eligible voters
+        """
+        depth, key, inside = 0, None, False
+
+        for event in yaml.parse(stream, Loader=Loader):
+            if inside:
+                if isinstance(event, yaml.ScalarEvent):
+                    yield event.value
+                elif isinstance(event, yaml.SequenceEndEvent):
+                    inside = False
+                continue
+
+            if isinstance(event, (yaml.MappingStartEvent, yaml.SequenceStartEvent)):
+                if depth == 1 and key == 'eligible_voters' and isinstance(event, yaml.SequenceStartEvent):
+                    inside = True
+                    key = None
+                    continue
+                depth += 1
+                key = None
+            elif isinstance(event, (yaml.MappingEndEvent, yaml.SequenceEndEvent)):
+                depth -= 1
+            elif isinstance(event, yaml.ScalarEvent) and depth == 1:
+                # scalars of the top level mapping alternate keys and values
+                key = event.value if key is None else None
+
+    @staticmethod
+    def write(path, usernames):
+        """
+        Write an index and swap it in place of the one at the path
+
+        Args:
+            path (string): location of the index
+            usernames (iterable): eligible voters, or a dict of usernames to
+                the values of their entries
+
+        Returns:
+            VoterIndex: the written index
+        """
+        if isinstance(usernames, dict):
+            # NUL sorts first, entries sort as their usernames do
+            names = sorted(b'\0'.join([str(u).encode('utf-8')] + [str(v).encode('utf-8') for v in sorted(values)])
+                           for u, values in usernames.items())
+        else:
+            names = sorted({str(u).encode('utf-8') for u in usernames})
+        start = len(MAGIC) + COUNT.size + (len(names) + 1) * 4
+        offsets = [start]
+        for name in names:
+            offsets.append(offsets[-1] + len(name))
+
+        with MappedFile.replace(path) as f:
+            f.write(MAGIC)
+            f.write(COUNT.pack(len(names)))
+            f.write(struct.pack('<{}I'.format(len(offsets)), *offsets))
+            for name in names:
+                f.write(name)
+
+        return VoterIndex.open(path)
@@ -0,0 +1,152 @@
+# Copyright 2026 The Elekto Authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Voting status of the users and the elections, answered by the database
+without loading the election's voters
+"""
+
+import sqlalchemy as S
+
+from elekto.core.election import Election as CoreElection
+from elekto.models.sql import Ballot, EligibleVoter, User, Voter
+
+
+def has_voted(session, user, election):
+    """
+    Check if the user has voted in the election, an EXISTS on the unique
+    (election_id, user_id) index of the voters
+
+    Args:
+        session (object): database session
+        user (User): the user
+        election (Election): the election's row
+
+    Returns:
+        bool: True if the user has voted
+    """
+    if election is None:
+        return False
+    return session.query(S.exists().where(Voter.election_id == election.id)
+                         .where(Voter.user_id == user.id)).scalar()
+
+
+def cast_ballots(session, election, voter, ranks):
+    """
+    Insert the ballots of a voter with one statement, without loading the
+    election's ballots. The "no opinion" ranks are not stored, the results
+    skip them anyway (see core.election.Election.build), except one for a
+    ballot of no opinion only: the voter is still counted in the ballots
+
+    Args:
+        session (object): database session
+        election (Election): the election's row
+        voter (string): the voter's ballot id (uuid)
+        ranks (dict): candidate to rank
+
+    Returns:
+        int: number of ballots stored
+    """
+    rows = [{'election_id': election.id, 'voter': voter, 'candidate': candidate, 'rank': rank}
+            for candidate, rank in ranks.items() if rank != CoreElection.MAX_RANK]
+    if not rows and ranks:
+        candidate = min(ranks)
+        rows = [{'election_id': election.id, 'voter': voter, 'candidate': candidate, 'rank': ranks[candidate]}]
+    if rows:
+        session.execute(S.insert(Ballot), rows)
+    return len(rows)
+
+
+def ballot_of(session, election, voter, candidates):
+    """
+    The ballot of a voter as cast, by rank, followed by the candidates the
+    voter has no opinion of (not stored, see cast_ballots)
+
+    Args:
+        session (object): database session
+        election (Election): the election's row
+        voter (string): the voter's ballot id (uuid), decrypted
+        candidates (list): keys of the election's candidates
+
+    Returns:
+        list: {'candidate', 'rank'} of every candidate, the rank is
+            "No opinion" for the unranked ones
+    """
+    ranks = {b.candidate: b.rank for b in session.query(Ballot).filter_by(election_id=election.id, voter=voter)
+             if b.rank != CoreElection.MAX_RANK}
+    ballot = [{'candidate': c, 'rank': r} for c, r in sorted(ranks.items(), key=lambda cr: cr[1])]
+    return ballot + [{'candidate': c, 'rank': CoreElection.NO_OPINION}
+                     for c in sorted(candidates) if c not in ranks]
+
+
+def revoke_ballots(session, election, voter, ballot_voter):
+    """
+    Delete the ballots of a voter and the voter, so the user can vote
+    again, with one statement each on the (election_id, voter) index of the
+    ballots. The caller commits, both are gone or none is
+
+    Args:
+        session (object): database session
+        election (Election): the election's row
+        voter (Voter): the user's voter row
+        ballot_voter (string): the voter's ballot id (uuid), decrypted
+
+    Returns:
+        int: number of ballots deleted
+    """
+    deleted = session.query(Ballot).filter(
+        Ballot.election_id == election.id,
+        Ballot.voter == ballot_voter).delete(synchronize_session=False)
+    session.query(Voter).filter(Voter.id == voter.id).delete(synchronize_session=False)
+    return deleted
+
+
+def voted_count(session, election):
+    """
+    Number of users who have voted in the election
+    """
+    return session.query(S.func.count(Voter.id)).filter(Voter.election_id == election.id).scalar()
+
+
+def eligible_count(session, election):
+    """
+    Number of eligible voters of the election, synced from the meta
+    """
+    return session.query(S.func.count(EligibleVoter.id)).filter(
+        EligibleVoter.election_id == election.id).scalar()
+
+
+def last_voted_at(session, election):
+    """
+    When the last vote of the election was cast, None if no one has voted
+    """
+    return session.query(S.func.max(Voter.created_at)).filter(Voter.election_id == election.id).scalar()
+
+
+def not_voted(session, election):
+    """
+    Usernames of the eligible voters who have not voted in the election yet
+
+    Returns:
+        list: sorted usernames
+    """
+    query = (
+        session.query(EligibleVoter.username)
+        .filter(EligibleVoter.election_id == election.id)
+        .filter(~S.exists().where(Voter.election_id == election.id)
+                .where(Voter.user_id == User.id)
+                .where(User.username == EligibleVoter.username))
+        .order_by(EligibleVoter.username)
+    )
+    return [username for (username,) in query]
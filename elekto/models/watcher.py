@@ -0,0 +1,143 @@
+# Copyright 2026 The Elekto Authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Change detector for local deployments, editing the meta in place invalidates
+the cached elections without a sync.
+"""
+
+import os
+import time
+import threading
+
+from elekto import APP
+from elekto.models.meta import Election
+
+
+class MetaWatcher:
+    """
+    Polls the election directory of a local meta and invalidates the cached
+    elections whose files changed. Editors often write a file several times,
+    so the changes are collected until the directory has been quiet for
+    `debounce` seconds and invalidated at once.
+
+    While the watcher runs, cached elections are served without checking the
+    stamp of their files on every request.
+    """
+
+    def __init__(self, interval=1.0, debounce=0.5):
+        self.interval = interval
+        self.debounce = debounce
+        self.mutex = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread = None
+        self.pid = None
+        self.files = {}  # path: (mtime, size) of the files of the last scan
+        self.pending = set()  # changed paths waiting for the debounce
+        self.changed = 0.0  # time of the latest change
+
+    @staticmethod
+    def enabled(config):
+        """
+        Watch only a working tree the application reads in place
+        """
+        return bool(config.get('WATCH')) and config.get('DEPLOYMENT') == 'local' \
+            and config.get('STORE', 'fs') == 'fs'
+
+    def start(self):
+        """
+        Start watching, once per process (the thread does not survive a fork)
+        """
+        with self.mutex:
+            if self.thread is not None and self.pid == os.getpid():
+                return
+            self.pid = os.getpid()
+            self.stopped.clear()
+            self.files = self.scan()
+            self.pending = set()
+            Election.WATCHED = True
+            self.thread = threading.Thread(target=self.run, name='meta-watch', daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        thread = self.thread
+        if thread is not None:
+            thread.join()
+
+    def run(self):
+        try:
+            while not self.stopped.wait(self.interval):
+                self.poll()
+        except Exception:
+            APP.logger.exception('meta watcher failed')
+        finally:
+            # the cached elections are validated against their stamps again
+            Election.WATCHED = False
+            Election.invalidate()
+            with self.mutex:
+                self.thread = None
+
+    def scan(self):
+        """
+        Modification time and size of every file of the election directory
+
+        Returns:
+            dict: path (relative to the election directory) to (mtime, size)
+        """
+        config = APP.config['META']
+        root = os.path.join(os.path.realpath(config['PATH']), config['ELECDIR'])
+        files = {}
+        pending = [root]
+
+        while pending:
+            try:
+                it = os.scandir(pending.pop())
+            except (FileNotFoundError, NotADirectoryError):
+                continue
+            with it:
+                for entry in it:
+                    if entry.is_dir():
+                        pending.append(entry.path)
+                    elif entry.is_file():
+                        st = entry.stat()
+                        files[os.path.relpath(entry.path, root)] = (st.st_mtime_ns, st.st_size)
+
+        return files
+
+    def poll(self, now=None):
+        """
+        Scan the election directory once, the elections changed are
+        invalidated once no change has been seen for `debounce` seconds
+
+        Returns:
+            set: keys of the invalidated elections, None if nothing was
+                invalidated
+        """
+        now = time.time() if now is None else now
+        files = self.scan()
+        changed = {p for p in files.keys() | self.files.keys() if files.get(p) != self.files.get(p)}
+        self.files = files
+
+        if changed:
+            self.pending |= changed
+            self.changed = now
+
+        if not self.pending or now - self.changed < self.debounce:
+            return None
+
+        keys = Election.keys(self.pending)
+        Election.invalidate(keys)
+        self.pending = set()
+        return keys
@@ -0,0 +1,99 @@
+# Copyright 2026 The Elekto Authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Background worker responsible for pulling the meta and syncing the database
+outside of the webhook's request.
+"""
+
+import os
+import time
+import fcntl
+import threading
+
+from elekto import APP, SESSION
+from elekto.models import meta
+
+
+class SyncWorker:
+    """
+    A single background thread per process that pulls the meta and syncs the
+    database. Requests received while a sync is running are coalesced into
+    one follow up sync, and a lock file next to the meta serializes the syncs
+    of all the processes sharing the same working tree.
+    """
+
+    def __init__(self):
+        self.mutex = threading.Lock()
+        self.thread = None
+        self.requested = 0.0  # time of the latest sync request
+        self.done = 0.0  # start time of the latest sync covering requests
+
+    def enqueue(self):
+        """
+        Request a sync, starts the background thread if it is not running
+        """
+        with self.mutex:
+            self.requested = time.time()
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name='meta-sync', daemon=True)
+                self.thread.start()
+
+    def run(self):
+        while True:
+            with self.mutex:
+                requested = self.requested
+                if requested <= self.done:
+                    self.thread = None
+                    return
+            self.work(requested)
+
+    def work(self, requested):
+        """
+        Sync once for all the requests made until `requested`, unless a sync
+        started after it (in this or in another process) already covered them.
+        """
+        started = 0.0
+        with open(self.lockfile(), 'a+') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                lock.seek(0)
+                started = float(lock.read() or 0)
+                if started < requested:
+                    started = time.time()
+                    self.sync()
+                    lock.seek(0)
+                    lock.truncate()
+                    lock.write(str(started))
+            except Exception:
+                APP.logger.exception('meta sync failed')
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+        self.done = max(self.done, started, requested)
+
+    def sync(self):
+        backend = meta.Meta(APP.config['META'])
+        try:
+            if not os.path.exists(backend.META) or not os.path.isdir(backend.META):
+                backend.clone()
+            else:
+                backend.pull()
+            APP.logger.info(backend.sync(SESSION))
+        finally:
+            SESSION.remove()
+
+    @staticmethod
+    def lockfile():
+        return os.path.abspath(APP.config['META']['PATH']).rstrip(os.sep) + '.lock'
@@ -18,32 +18,120 @@
 k8s.elections.utils include utils related to flask application
 """
 
+import time
+import hashlib
 import flask as F
+import sqlalchemy as S
 from datetime import datetime
+from werkzeug.exceptions import HTTPException
 
-from elekto import constants, SESSION
+from elekto import constants, APP, SESSION
 from elekto.models import meta
-from elekto.models.sql import User, Election, Voter
+from elekto.models.sql import User, Election, Sync, Voter
+
+
+# Snapshots of the users authenticated from the session, by user id, each
+# with the time it expires at (see authenticate)
+USERS = {}
+USERS_MAX = 10000
+
+# Keys of the elections the users have voted in, by user id, with the
+# version they were built from (see PastElections)
+PAST = {}
+
+
+class UserSnapshot:
+    """
+    Read only copy of a User, served to the requests authenticated from the
+    session without querying the database
+    """
+
+    def __init__(self, user):
+        self.id = user.id
+        self.username = user.username
+        self.name = user.name
+        self.token_expires_at = user.token_expires_at
+
+    def __repr__(self):
+        return "<UserSnapshot(id={}, username={})>".format(self.id, self.username)
+
+
+def fingerprint(token):
+    return hashlib.sha256(token.encode('utf-8')).hexdigest()[:32]
+
+
+def sensitive():
+    """
+    Requests that always check the user's token against the database: the
+    votes, the edits and the admin pages
+    """
+    return F.request.method not in ('GET', 'HEAD', 'OPTIONS') or '/admin' in F.request.path
+
+
+def authenticate(token):
+    """
+    Authenticate the user of the token. The session's signed claim (user id,
+    token fingerprint, expiry and when it was last checked) authenticates
+    the user from the in-process cache, the database is queried when the
+    claim is older than AUTH_REVALIDATE minutes or the request is sensitive.
+
+    Args:
+        token (string): the user's token from the session
+
+    Returns:
+        User or UserSnapshot: the authenticated user, None if the token is
+            unknown or expired
+    """
+    now = time.time()
+    interval = APP.config.get('AUTH_REVALIDATE', 0) * 60
+    claim = F.session.get(constants.AUTH_CLAIM)
+
+    if claim and not sensitive() and claim[1] == fingerprint(token) \
+            and claim[2] > now and now - claim[3] < interval:
+        cached = USERS.get(claim[0])
+        if cached is not None and cached[0] > now:
+            return cached[1]
+
+    user = SESSION.query(User).filter_by(token=token).first()
+    if not user or not user.token_expires_at or user.token_expires_at <= datetime.now():
+        F.session.pop(constants.AUTH_CLAIM, None)
+        return None
+
+    if interval:
+        if len(USERS) >= USERS_MAX:
+            for uid in [uid for uid, (expires, _) in USERS.items() if expires <= now] or list(USERS):
+                del USERS[uid]
+        USERS[user.id] = (now + interval, UserSnapshot(user))
+        F.session[constants.AUTH_CLAIM] = [user.id, fingerprint(token), user.token_expires_at.timestamp(), now]
+    return user
+
+
+def forget_user(user_id):
+    """
+    Drop the cached snapshot of the user and the claim of the session, when
+    the user logs out
+    """
+    USERS.pop(user_id, None)
+    F.session.pop(constants.AUTH_CLAIM, None)
 
 
 def set_session(app):
     F.session.permanent = True
+    # the elections shared by the guards and the view live for one request
+    F.g.meta_elections = {}
+    F.g.sql_elections = {}
     if str(F.request.path).find("static") == -1 and \
             constants.AUTH_STATE in F.session.keys() and \
             F.session[constants.AUTH_STATE] is not None:
         # Authenticate with every request if the user's token correct or not
-        token = F.session[constants.AUTH_STATE]
-        user = SESSION.query(User).filter_by(token=token).first()
+        user = authenticate(F.session[constants.AUTH_STATE])
 
         # if unable to fetch the user's info, set auth to False
-        if user and user.token_expires_at and user.token_expires_at > datetime.now():
+        if user:
             F.g.user = user
             F.g.auth = True
-            # Find all the user's past and all upcoming (meta only) elections
-            query = SESSION.query(Election).join(
-                Election, Voter.election).filter(Voter.user_id == user.id).all()
-
-            F.g.past_elections = [meta.Election(e.key).get() for e in query]
+            # Built only if the sidebar or the dashboard renders them
+            F.g.past_elections = PastElections(user)
         else:
             F.g.user = None
             F.g.auth = False
@@ -51,3 +139,104 @@ def set_session(app):
     else:
         F.g.user = None
         F.g.auth = False
+
+
+def meta_election(key):
+    """
+    The meta election of the key, built once per request and shared by the
+    guards and the view
+
+    Args:
+        key (string): key of the election
+
+    Returns:
+        meta.Election: the election (aborts with 404 if not in the meta)
+    """
+    elections = F.g.setdefault('meta_elections', {})
+    if key not in elections:
+        elections[key] = meta.Election(key)
+    return elections[key]
+
+
+def sql_election(key):
+    """
+    The database row of the election, queried once per request and shared
+    by the guards and the view
+
+    Args:
+        key (string): key of the election
+
+    Returns:
+        Election: the row, None if the election is not synced
+    """
+    rows = F.g.setdefault('sql_elections', {})
+    if key not in rows:
+        rows[key] = SESSION.query(Election).filter_by(key=key).first()
+    return rows[key]
+
+
+class PastElections:
+    """
+    Elections the user has voted in, for the sidebar and the dashboard.
+
+    Nothing is queried until the list is rendered, and it is built at most
+    once per request. The keys are cached in the process by user id with
+    the version of the user's votes and of the synced meta they were built
+    from, a vote or a revoke (from any process or browser) or a sync
+    changes the version and rebuilds them. The elections themselves are
+    served from the per-process cache of the meta.
+    """
+
+    def __init__(self, user):
+        self.user = user
+        self.elections = None
+
+    def version(self):
+        """
+        Version of the user's votes (count and latest) and of the meta (last
+        sync), answered from the (user_id) index of the voters
+        """
+        last_sync = SESSION.query(S.func.max(Sync.id)).scalar_subquery()
+        return tuple(SESSION.query(S.func.count(Voter.id), S.func.max(Voter.id), last_sync)
+                     .filter(Voter.user_id == self.user.id).one())
+
+    def keys(self):
+        version = self.version()
+        cached = PAST.get(self.user.id)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+
+        query = SESSION.query(Election.key).join(
+            Voter, Voter.election_id == Election.id).filter(Voter.user_id == self.user.id).order_by(
+            Election.start_datetime.desc())
+        keys = [k for (k,) in query]
+
+        if len(PAST) >= USERS_MAX:
+            PAST.clear()
+        PAST[self.user.id] = (version, keys)
+        return keys
+
+    def load(self):
+        if self.elections is None:
+            self.elections = []
+            for key in self.keys():
+                try:
+                    self.elections.append(meta.Election(key).get())
+                except HTTPException:
+                    continue  # no longer in the meta
+        return self.elections
+
+    def __iter__(self):
+        return iter(self.load())
+
+    def __len__(self):
+        return len(self.load())
+
+
+def forget_past_elections():
+    """
+    Drop the past elections of the user cached by the process and the
+    request, when the user votes or deletes a ballot
+    """
+    PAST.pop(F.g.user.id, None)
+    F.g.past_elections = PastElections(F.g.user)
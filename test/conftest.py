@@ -1,5 +1,6 @@
 import os
 import shutil
+import subprocess
 import zipfile
 
 import pytest
@@ -10,7 +11,9 @@ import pytest
 os.environ['DB_CONNECTION'] = 'sqlite'
 
 from elekto import APP, SESSION
+from elekto.middlewares.limit import STORES
 from elekto.models import meta
+from elekto.utils import PAST
 from elekto.models.sql import drop_all, migrate
 from elekto.models.utils import sync
 
@@ -29,6 +32,8 @@ def reset_db():
 def client():
     with APP.app_context():
         migrate(APP.config.get('DATABASE_URL'))
+        STORES['memory'].clear()  # the rate limits of the users of the previous test
+        PAST.clear()
         yield APP.test_client()
         SESSION.close()
         drop_all(APP.config.get('DATABASE_URL'))
@@ -85,3 +90,19 @@ def load_metadir(metadir):
         sync(SESSION, meta.Election.all())
 
     return metadir
+
+
+def git(path, *args):
+    subprocess.run(['git', '-C', str(path), '-c', 'user.name=elekto', '-c', 'user.email=elekto@example.com', *args],
+                   check=True, capture_output=True)
+
+
+@pytest.fixture()
+def metarepo(metadir):
+    """
+    Turn the temporary meta directory into a git repository, with the meta committed on the main branch.
+    """
+    git(metadir, 'init', '-q', '-b', 'main')
+    git(metadir, 'add', 'elections')
+    git(metadir, 'commit', '-q', '-m', 'initial')
+    return metadir
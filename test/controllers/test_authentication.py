@@ -1,11 +1,13 @@
 import base64
 import urllib.parse
+from datetime import datetime
 from unittest import mock
 
 from flask.testing import FlaskClient
 
-from elekto import APP, SESSION
+from elekto import APP, SESSION, constants
 from elekto.models.sql import User
+from elekto.utils import fingerprint
 
 from .mocks import MockUserResponse, MockTokenResponse
 from .utils import get_csrf_token, is_authenticated, provision_session, create_user, user_exists
@@ -51,6 +53,49 @@ def test_logout_flushes_session(client: FlaskClient):
     assert not is_authenticated(client)
 
 
+def test_session_claim_skips_token_lookup(client: FlaskClient):
+    provision_session(client, 'token')
+    assert is_authenticated(client)
+
+    with client.session_transaction() as session:
+        assert session[constants.AUTH_CLAIM][1] == fingerprint('token')
+
+    # The claim authenticates the next pages without querying the user
+    with mock.patch('elekto.utils.SESSION') as session_mock:
+        assert is_authenticated(client)
+        assert not session_mock.query.called
+
+
+def test_session_claim_revalidated(client: FlaskClient):
+    provision_session(client, 'token')
+    assert is_authenticated(client)
+
+    with APP.app_context():
+        user = SESSION.query(User).filter_by(username='carson').one()
+        user.token_expires_at = datetime.now()
+        SESSION.commit()
+
+    # Still served from the claim until it has to be checked again.
+    assert is_authenticated(client)
+
+    with client.session_transaction() as session:
+        session[constants.AUTH_CLAIM][3] -= APP.config['AUTH_REVALIDATE'] * 60
+    assert not is_authenticated(client)
+
+
+def test_session_claim_sensitive_requests(client: FlaskClient):
+    provision_session(client, 'token')
+    assert is_authenticated(client)
+
+    with APP.app_context():
+        SESSION.query(User).filter_by(username='carson').one().token = 'revoked'
+        SESSION.commit()
+
+    # Admin pages (and posts) always check the token against the database.
+    client.get('/app/elections/name_the_app/admin/')
+    assert not is_authenticated(client)
+
+
 @mock.patch('authlib.oauth2.client.generate_token')
 def test_github_login(token_mock, client: FlaskClient):
     oauth_token = 'fooBar42!'
@@ -6,10 +6,13 @@ import pytest
 from bs4 import BeautifulSoup
 from flask.testing import FlaskClient
 from freezegun import freeze_time
-from pytest_mock import MockerFixture
 
 from ..conftest import KDF_KEY_MOCK
+from elekto.core.encryption import Busy
 from elekto.models import meta
+from elekto.models.voters import VoterIndex
+from elekto.models.utils import sync_eligible_voters
+from elekto.utils import PAST
 from .utils import provision_session, vote, get_csrf_token, ENCRYPTED_MESSAGE, create_user
 from elekto import APP, SESSION, constants
 from elekto.models.sql import User, Election, Voter, Request
@@ -39,13 +42,18 @@ def test_unauthenticated_dashboard(client: FlaskClient):
     response = client.get("/app")
     assert response.status_code == 302
 
-def test_elections_running_dashboard(client: FlaskClient, mocker: MockerFixture):
-    mocker.patch("elekto.meta.Election.where", return_value=[{"name": "Demo Election", 
-                                                              "organization": "kubernetes", 
-                                                              "start_datetime": datetime.min, 
-                                                              "end_datetime": datetime.max}])
+def test_elections_running_dashboard(client: FlaskClient):
     token="token"
     with APP.app_context():
+        SESSION.add(Election(key="demo",
+                             name="Demo Election",
+                             organization="kubernetes",
+                             start_datetime=datetime.min,
+                             end_datetime=datetime.max))
+        SESSION.add(Election(key="done",
+                             name="Done Election",
+                             start_datetime=datetime.min,
+                             end_datetime=datetime(2000, 1, 1)))
         SESSION.add(User(username="carson",
                              name="Carson Weeks",
                              token=token,
@@ -56,9 +64,55 @@ def test_elections_running_dashboard(client: FlaskClient, mocker: MockerFixture)
     response = client.get("/app")
     assert response.status_code == 200
     assert b"Demo Election" in response.data 
+    assert b"Done Election" not in response.data
     assert not b"Sit back and Relax, there is not to do yet." in response.data
 
 
+@pytest.fixture
+def eligibility(client: FlaskClient, metadir):
+    """
+    Running elections name_the_app (pending) and 2021---GB (voted), and the finished 2021---TOC, carson being eligible
+    for all of them.
+    """
+    with APP.app_context():
+        for key, end in (('name_the_app', datetime.max), ('2021---GB', datetime.max),
+                         ('2021---TOC', datetime(2000, 1, 1))):
+            SESSION.add(Election(key=key, name=key, start_datetime=datetime.min, end_datetime=end))
+        SESSION.commit()
+
+    VoterIndex.write(meta.Meta(APP.config['META']).ELIGIBILITY, {'carson': ['name_the_app', '2021---GB', '2021---TOC']})
+    provision_session(client, token='token')
+    vote('carson', '2021---GB')
+
+
+def test_dashboard_pending_elections(client: FlaskClient, eligibility):
+    response = client.get('/app')
+    assert response.status_code == 200
+
+    soup = BeautifulSoup(response.data, 'html.parser')
+    assert 'Waiting for your vote' in soup.text
+    assert [a['href'] for a in soup.find_all('a', attrs={'class': 'color-primary'})][:1] == ['/app/elections/name_the_app']
+
+
+def test_elections_eligible(client: FlaskClient, eligibility):
+    response = client.get('/app/eligible')
+    assert response.status_code == 200
+
+    data = response.get_json()
+    assert data['username'] == 'carson'
+    assert {e['key']: (e['status'], e['voted']) for e in data['elections']} == {
+        'name_the_app': (constants.ELEC_STAT_RUNNING, False),
+        '2021---GB': (constants.ELEC_STAT_RUNNING, True),
+        '2021---TOC': (constants.ELEC_STAT_COMPLETED, False),
+    }
+
+
+def test_elections_eligible_not_synced(client: FlaskClient, metadir):
+    provision_session(client, token='token')
+    response = client.get('/app/eligible')
+    assert response.get_json() == {'username': 'carson', 'elections': []}
+
+
 # -------------------------------------------------------------------------------------------------------------------- #
 #                                                     /app/elections                                                   #
 # -------------------------------------------------------------------------------------------------------------------- #
@@ -281,6 +335,49 @@ def test_elections_voting_thankyou_redirect(client: FlaskClient, load_metadir):
     assert message_text == 'To re-cast your vote, please visit the election page.'
 
 
+@mock.patch('elekto.controllers.elections.encrypt')
+def test_elections_voting_post_already_voted(encrypt_mock, client: FlaskClient, load_metadir):
+    encrypt_mock.return_value = ENCRYPTED_MESSAGE
+    provision_session(client, token='...', username='kalkayan')
+    csrf_token = get_csrf_token(client, path='/app/elections/name_the_app/vote')
+
+    # A vote cast meanwhile, ie: by a double-click, conflicts on the insert.
+    vote('kalkayan', 'name_the_app')
+    with mock.patch('elekto.controllers.elections.has_voted') as has_voted_mock:
+        response = client.post('/app/elections/name_the_app/vote', data={
+            'csrf_token': csrf_token,
+            'password': '<PASSWORD>',
+            'candidate@e6n': 1,
+        })
+        assert not has_voted_mock.called
+
+    assert response.status_code == 409
+    assert b'You have already voted' in response.data
+
+    with APP.app_context():
+        election = SESSION.query(Election).filter_by(key='name_the_app').one()
+        assert SESSION.query(Voter).filter_by(election_id=election.id).count() == 1
+        assert election.ballots == []
+
+
+@mock.patch('elekto.controllers.elections.encrypt')
+def test_elections_voting_post_busy(encrypt_mock, client: FlaskClient, load_metadir):
+    encrypt_mock.side_effect = Busy
+    provision_session(client, token='...', username='kalkayan')
+
+    response = client.post('/app/elections/name_the_app/vote', data={
+        'csrf_token': get_csrf_token(client, path='/app/elections/name_the_app/vote'),
+        'password': '<PASSWORD>',
+        'candidate@e6n': 1,
+    })
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == str(APP.config['KDF_RETRY_AFTER'])
+    assert b'please retry' in response.data
+
+    with APP.app_context():
+        assert SESSION.query(Voter).count() == 0
+
+
 @mock.patch('elekto.controllers.elections.encrypt')
 def test_elections_voting_post(encrypt_mock, client: FlaskClient, load_metadir):
     encrypt_mock.return_value = ENCRYPTED_MESSAGE
@@ -302,22 +399,77 @@ def test_elections_voting_post(encrypt_mock, client: FlaskClient, load_metadir):
     assert response.status_code == 302
     assert response.headers['Location'] == '/app/elections/name_the_app/confirmation'
 
-    encrypt_mock.assert_called_once_with(mock.ANY, '<PASSWORD>', mock.ANY)
+    encrypt_mock.assert_called_once_with(mock.ANY, '<PASSWORD>', mock.ANY,
+                                         APP.config['KDF_OPSLIMIT'], APP.config['KDF_MEMLIMIT'])
 
     # Check if all expected data was written to the database.
     with APP.app_context():
         user_id = SESSION.query(User).filter_by(username='kalkayan').one().id
         voter = SESSION.query(Voter).filter_by(user_id=user_id).one()
         assert voter.ballot_id == ENCRYPTED_MESSAGE
+        assert (voter.kdf_opslimit, voter.kdf_memlimit) == (APP.config['KDF_OPSLIMIT'],
+                                                            APP.config['KDF_MEMLIMIT'])
 
         ballots = SESSION.query(Election).filter_by(key='name_the_app').one().ballots
 
-    assert len(ballots) == 5
+    # The "no opinion" rank of ribemont is not stored.
+    assert {b.candidate: b.rank for b in ballots} == {
+        k.split('@')[-1]: rank for k, rank in ballot_votes.items() if rank != 100000000
+    }
 
-    for i, k in enumerate(ballot_votes):
-        form_data_rank = ballot_votes[k]
-        stored_rank = ballots[i].rank
-        assert form_data_rank == stored_rank
+
+@mock.patch('elekto.controllers.elections.encrypt')
+def test_elections_voting_post_forgets_past_elections(encrypt_mock, client: FlaskClient, load_metadir):
+    encrypt_mock.return_value = ENCRYPTED_MESSAGE
+    provision_session(client, token='...', username='kalkayan')
+    user_id = SESSION.query(User).filter_by(username='kalkayan').one().id
+
+    # Rendering the dashboard caches the user's (no) past elections.
+    assert b'Previously Voted' not in client.get('/app').data
+    assert PAST[user_id][1] == []
+
+    csrf_token = get_csrf_token(client, path='/app/elections/name_the_app/vote')
+    with mock.patch('elekto.utils.PastElections.load') as load_mock:
+        client.post('/app/elections/name_the_app/vote', data={
+            'csrf_token': csrf_token,
+            'password': '<PASSWORD>',
+            'candidate@e6n': 1,
+        })
+        assert not load_mock.called  # a redirect renders no sidebar
+    assert user_id not in PAST
+
+    response = client.get('/app')
+    assert b'Previously Voted' in response.data
+    assert PAST[user_id][1] == ['name_the_app']
+
+
+def test_past_elections_follow_votes_of_other_processes(client: FlaskClient, load_metadir):
+    provision_session(client, token='...', username='kalkayan')
+    user_id = SESSION.query(User).filter_by(username='kalkayan').one().id
+    assert b'Previously Voted' not in client.get('/app').data
+
+    # A vote cast from another browser, served by another process.
+    vote('kalkayan', 'name_the_app')
+    assert b'Previously Voted' in client.get('/app').data
+    assert PAST[user_id][1] == ['name_the_app']
+
+    # and its revocation
+    with APP.app_context():
+        SESSION.query(Voter).delete()
+        SESSION.commit()
+    assert b'Previously Voted' not in client.get('/app').data
+
+
+def test_elections_voting_get_builds_election_once(client: FlaskClient, load_metadir):
+    provision_session(client, token='...', username='kalkayan')
+
+    # voter_guard and the view share the request's election
+    with mock.patch('elekto.utils.meta.Election', wraps=meta.Election) as election_mock, \
+            mock.patch('elekto.utils.SESSION.query', wraps=SESSION.query) as query_mock:
+        assert client.get('/app/elections/name_the_app/vote').status_code == 200
+
+    assert election_mock.call_args_list == [mock.call('name_the_app')]
+    assert len([c for c in query_mock.call_args_list if c.args[0] is Election]) == 1
 
 
 def test_elections_voting_get(client: FlaskClient, load_metadir):
@@ -378,8 +530,10 @@ def test_elections_view(kdf_mock, client: FlaskClient, load_metadir):  # Slow
     ballot_divs = soup.find_all('div', attrs={'class': 'boxed-hover row'})
     assert len(ballot_divs) == len(ballot_votes)
 
-    for k, rank in ballot_votes.items():
+    # by rank, the "no opinion" last
+    for k, rank in sorted(ballot_votes.items(), key=lambda kr: kr[1]):
         key = k.split('@')[-1]
+        rank = 'No opinion' if rank == 100000000 else rank
         h6s = ballot_divs.pop(0).find_all('h6')
         assert len(h6s) == 2
         assert h6s[0].text.strip() == key
@@ -399,6 +553,61 @@ def test_elections_view_error(decrypt_mock, client: FlaskClient, load_metadir):
     assert response.headers['Location'] == '/app/elections/name_the_app'
 
 
+@mock.patch('elekto.controllers.elections.decrypt', return_value='ballot')
+def test_elections_view_uses_voter_kdf(decrypt_mock, client: FlaskClient, load_metadir):
+    provision_session(client, token='...', username='kalkayan')
+    csrf_token = get_csrf_token(client, path='/app/elections/name_the_app/vote')
+    vote('kalkayan', 'name_the_app')
+
+    # the votes cast before the limits were stored used the interactive ones
+    client.post('/app/elections/name_the_app/vote/view', data={'csrf_token': csrf_token, 'password': '<PASSWORD>'})
+    assert decrypt_mock.call_args.args[3:] == (4, 33554432)
+
+    with APP.app_context():
+        SESSION.query(Voter).update({'kdf_opslimit': 6, 'kdf_memlimit': 67108864})
+        SESSION.commit()
+
+    client.post('/app/elections/name_the_app/vote/view', data={'csrf_token': csrf_token, 'password': '<PASSWORD>'})
+    assert decrypt_mock.call_args.args[3:] == (6, 67108864)
+
+
+@pytest.mark.parametrize('store', ['memory', 'database'])
+@mock.patch('elekto.controllers.elections.decrypt', side_effect=Exception)
+def test_elections_view_rate_limited(decrypt_mock, store, client: FlaskClient, load_metadir, monkeypatch):
+    monkeypatch.setitem(APP.config['RATE_LIMIT'], 'STORE', store)
+    monkeypatch.setitem(APP.config['RATE_LIMIT'], 'VIEW', '2/60')
+    provision_session(client, token='...', username='kalkayan')
+    csrf_token = get_csrf_token(client, path='/app/elections/name_the_app/vote')
+    vote('kalkayan', 'name_the_app')
+
+    data = {'csrf_token': csrf_token, 'password': 'wrong'}
+    assert [client.post('/app/elections/name_the_app/vote/view', data=data).status_code
+            for _ in range(2)] == [302, 302]
+
+    response = client.post('/app/elections/name_the_app/vote/view', data=data)
+    assert response.status_code == 429
+    assert response.headers['Retry-After'] == '30'
+    assert decrypt_mock.call_count == 2
+
+    # the other routes have their own buckets
+    assert client.post('/app/elections/name_the_app/vote/edit', data=data).status_code == 302
+
+
+@mock.patch('elekto.controllers.elections.decrypt')
+def test_elections_view_busy(decrypt_mock, client: FlaskClient, load_metadir):
+    decrypt_mock.side_effect = Busy
+    provision_session(client, token='...', username='kalkayan')
+    csrf_token = get_csrf_token(client, path='/app/elections/name_the_app/vote')
+    vote('kalkayan', 'name_the_app')
+
+    response = client.post('/app/elections/name_the_app/vote/view', data={
+        'csrf_token': csrf_token,
+        'password': '<PASSWORD>',
+    })
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == str(APP.config['KDF_RETRY_AFTER'])
+
+
 # -------------------------------------------------------------------------------------------------------------------- #
 #                                          /app/elections/<eid>/vote/edit                                              #
 # -------------------------------------------------------------------------------------------------------------------- #
@@ -425,7 +634,7 @@ def test_elections_edit(kdf_mock, client: FlaskClient, load_metadir):  # Slow
     with APP.app_context():
         user_id = SESSION.query(User).filter_by(username='kalkayan').one().id
         assert SESSION.query(Voter).filter_by(user_id=user_id).count() == 1
-        assert len(SESSION.query(Election).filter_by(key='name_the_app').one().ballots) == 5
+        assert len(SESSION.query(Election).filter_by(key='name_the_app').one().ballots) == 4
 
     # Once the voting has been done, navigate to the page to delete the user's vote/ballots.
     response = client.post('/app/elections/name_the_app/vote/edit', data={
@@ -575,6 +784,20 @@ def test_elections_admin(client: FlaskClient, load_metadir):
     assert title_text == 'Election Officer\'s Dashboard'
 
 
+def test_elections_admin_turnout(client: FlaskClient, load_metadir):
+    provision_session(client, token='...', username='kalkayan')
+    with APP.app_context():
+        election = SESSION.query(Election).filter_by(key='2021---GB').one()
+        sync_eligible_voters(SESSION, election.id, ['kalkayan', 'dims', 'nikhita', 'liggitt'])
+        SESSION.commit()
+    vote('kalkayan', '2021---GB')
+
+    response = client.get('/app/elections/2021---GB/admin/')
+    assert response.status_code == 200
+    assert b'Turnout - 1 of 4 eligible voters\n                    (25.0%)' in response.data
+    assert b'Not voted yet - dims, liggitt, nikhita' in response.data
+
+
 # -------------------------------------------------------------------------------------------------------------------- #
 #                                      /app/elections/<eid>/admin/exception/<rid>                                      #
 # -------------------------------------------------------------------------------------------------------------------- #
@@ -651,3 +874,26 @@ def test_elections_admin_download(client: FlaskClient, load_metadir):
     assert response.status_code == 200
     assert response.headers['Content-Type'] == 'text/csv; charset=utf-8'
     assert response.headers['Content-Disposition'] == 'attachment; filename=ballots.csv'
+
+
+@mock.patch('elekto.controllers.elections.encrypt', return_value=ENCRYPTED_MESSAGE)
+def test_elections_admin_download_counts_every_voter(encrypt_mock, client: FlaskClient, load_metadir):
+    candidates = ['delectus', 'e6n', 'elekto', 'notcivs', 'ribemont']
+    for username, ranks in (('kalkayan', [1, 2, 3, 4, 5]), ('jberkus', [100000000] * 5)):
+        provision_session(client, token=username, username=username)
+        client.post('/app/elections/name_the_app/vote', data={
+            'csrf_token': get_csrf_token(client, path='/app/elections/name_the_app/vote'),
+            'password': '<PASSWORD>',
+            **{f'candidate@{c}': rank for c, rank in zip(candidates, ranks)},
+        })
+
+    response = client.get('/app/elections/name_the_app/admin/download')
+    rows = response.data.decode('utf8').splitlines()
+
+    # one row per voter, the abstention included
+    with APP.app_context():
+        assert len(rows) - 1 == SESSION.query(Voter).count() == 2
+    header = rows[0].split(',')
+    ballots = [dict(zip(header, r.split(','))) for r in rows[1:]]
+    assert {c: str(rank) for c, rank in zip(candidates, [1, 2, 3, 4, 5])} in ballots
+    assert dict.fromkeys(candidates, 'No opinion') in ballots
@@ -3,7 +3,7 @@ from freezegun import freeze_time
 
 from flask.testing import FlaskClient
 
-from elekto import constants
+from elekto import APP, constants
 
 
 def test_welcome(client: FlaskClient):
@@ -48,3 +48,11 @@ def test_public_election(client: FlaskClient, load_metadir):
 def test_health_check(client: FlaskClient):
     response = client.get('/healthcheck')
     assert response.status_code == 200
+
+
+def test_health_kdf(client: FlaskClient):
+    response = client.get('/health/kdf')
+    assert response.status_code == 200
+    assert response.json['workers'] == APP.config['KDF_WORKERS']
+    assert response.json['queue'] == APP.config['KDF_QUEUE']
+    assert {'derived', 'rejected', 'wait_mean', 'kdf_mean'} <= set(response.json)
@@ -2,57 +2,40 @@ from unittest import mock
 
 from flask.testing import FlaskClient
 
-from elekto import APP
+from elekto import APP, SESSION
+from elekto.models.sql import Sync
 
 
 def perform_sync(client: FlaskClient):
     APP.config['DEBUG'] = True  # Skip X-Hub signature validation, which is tested in the webhook middleware tests.
     try:
-        client.post('/v1/webhooks/meta/sync')
-    except TypeError:
-        # At the moment, this endpoint doesn't return a string rather than a valid response type. This will cause a
-        # TypeError which is caught here. The below assertions are made to verify the endpoint's internals work OK.
-        ...
-
-    APP.config['DEBUG'] = False
-
-
-@mock.patch('elekto.controllers.webhook.os.path.exists')
-@mock.patch('elekto.controllers.webhook.meta.Meta.clone')
-@mock.patch('elekto.controllers.webhook.sync')
-def test_webhook_metadir_does_not_exist(sync_mock, clone_mock, path_exists_mock, client: FlaskClient):
-    path_exists_mock.return_value = False
-
-    perform_sync(client)
-    clone_mock.assert_called_once()
-    sync_mock.assert_called_once()
-
-
-@mock.patch('elekto.controllers.webhook.os.path.exists')
-@mock.patch('elekto.controllers.webhook.os.path.isdir')
-@mock.patch('elekto.controllers.webhook.meta.Meta.clone')
-@mock.patch('elekto.controllers.webhook.sync')
-@mock.patch('elekto.controllers.webhook.meta.Election.all')
-def test_webhook_metadir_is_not_a_dir(all_mock, sync_mock, clone_mock, path_isdir_mock, path_exists_mock, client: FlaskClient):
-    all_mock.return_value = []
-    path_exists_mock.return_value = True
-    path_isdir_mock.return_value = False
-
-    perform_sync(client)
-    clone_mock.assert_called_once()
-    sync_mock.assert_called_once()
-
-
-@mock.patch('elekto.controllers.webhook.os.path.exists')
-@mock.patch('elekto.controllers.webhook.os.path.isdir')
-@mock.patch('elekto.controllers.webhook.meta.Meta.pull')
-@mock.patch('elekto.controllers.webhook.sync')
-@mock.patch('elekto.controllers.webhook.meta.Election.all')
-def test_webhook_metadir_updates(all_mock, sync_mock, pull_mock, path_isdir_mock, path_exists_mock, client: FlaskClient):
-    all_mock.return_value = []
-    path_exists_mock.return_value = True
-    path_isdir_mock.return_value = True
-
-    perform_sync(client)
-    pull_mock.assert_called_once()
-    sync_mock.assert_called_once()
+        return client.post('/v1/webhooks/meta/sync')
+    finally:
+        APP.config['DEBUG'] = False
+
+
+@mock.patch('elekto.controllers.webhook.WORKER.enqueue')
+def test_webhook_enqueues_sync(enqueue_mock, client: FlaskClient):
+    response = perform_sync(client)
+    assert response.status_code == 202
+    assert response.json == {'status': 'queued'}
+    enqueue_mock.assert_called_once()
+
+
+def test_webhook_status_never_synced(client: FlaskClient):
+    response = client.get('/v1/webhooks/meta/status')
+    assert response.status_code == 200
+    assert response.json == {'commit': None, 'duration': None, 'synced_at': None}
+
+
+def test_webhook_status(client: FlaskClient):
+    with APP.app_context():
+        SESSION.add(Sync(commit='a' * 40, duration=1.5))
+        SESSION.add(Sync(commit='b' * 40, duration=0.25))
+        SESSION.commit()
+
+    response = client.get('/v1/webhooks/meta/status')
+    assert response.status_code == 200
+    assert response.json['commit'] == 'b' * 40
+    assert response.json['duration'] == 0.25
+    assert response.json['synced_at'] is not None
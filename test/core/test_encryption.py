@@ -1,8 +1,15 @@
+import multiprocessing
+import time
+
 import pytest
 from unittest import mock
 
 from ..conftest import KDF_KEY_MOCK
-from elekto.core.encryption import encrypt, decrypt
+from nacl import pwhash
+
+from elekto import APP
+from elekto.core import encryption
+from elekto.core.encryption import Busy, KDFPool, calibrate, check_limits, encrypt, decrypt
 
 
 @mock.patch('elekto.core.encryption.pwhash.argon2i.kdf', return_value=KDF_KEY_MOCK)
@@ -22,3 +29,95 @@ def test_decrypt_bad_passcode(salt) -> None:
     with pytest.raises(Exception) as e:
         decrypt(salt, 'bad passcode', encrypted)
         assert "Wrong passcode. Decryption Failed!" in str(e)
+
+
+def test_kdf_pool_rejects_when_full(salt, tmpdir) -> None:
+    # uwsgi runs one request per process, the processes share the slots
+    fork = multiprocessing.get_context('fork')
+    pool = KDFPool(workers=1, queue=1, path=str(tmpdir))
+    started, release = fork.Event(), fork.Event()
+
+    def slow_kdf(*args, **kwargs):
+        started.set()
+        release.wait(5)
+        return KDF_KEY_MOCK
+
+    with mock.patch('elekto.core.encryption.pwhash.argon2i.kdf', side_effect=slow_kdf):
+        running = fork.Process(target=pool.derive, args=(32, b'<PASSWORD>', salt))
+        running.start()
+        assert started.wait(5)
+
+        # the second derivation waits in the queue, the third one is refused
+        waiting = fork.Process(target=pool.derive, args=(32, b'<PASSWORD>', salt))
+        waiting.start()
+        deadline = time.monotonic() + 5
+        while (place := pool.take('queue', 1)) is not None:
+            place.close()
+            assert time.monotonic() < deadline
+            time.sleep(0.01)
+        with pytest.raises(Busy):
+            pool.derive(32, b'<PASSWORD>', salt)
+
+        release.set()
+        running.join(5)
+        waiting.join(5)
+        assert running.exitcode == waiting.exitcode == 0
+        assert pool.derive(32, b'<PASSWORD>', salt) == KDF_KEY_MOCK
+
+    stats = pool.stats()
+    assert stats['derived'] == 1
+    assert stats['rejected'] == 1
+    assert stats['pending'] == 0
+
+
+@pytest.mark.parametrize('workers, queue, processes, expected', [
+    (2, 2, 8, (2, 2)),
+    (2, 8, 8, (2, 5)),
+    (10, 8, 8, (7, 0)),
+    (2, 8, 1, (1, 0)),
+    (2, 8, None, (2, 8)),
+])
+def test_kdf_pool_leaves_processes_free(workers, queue, processes, expected) -> None:
+    pool = KDFPool(workers, queue, processes=processes)
+    assert (pool.workers, pool.queue) == expected
+
+
+def test_kdf_pool_default_config() -> None:
+    # the derivations admitted by default never hold every web process
+    assert APP.config['KDF_WORKERS'] + APP.config['KDF_QUEUE'] < APP.config['PROCESSES']
+    assert encryption.POOL.workers + encryption.POOL.queue < APP.config['PROCESSES']
+
+
+def test_decrypt_needs_the_same_limits(salt) -> None:
+    limits = (pwhash.argon2i.OPSLIMIT_MIN, pwhash.argon2i.MEMLIMIT_MIN)
+    encrypted = encrypt(salt, '<PASSWORD>', 'very secret', *limits)
+
+    assert decrypt(salt, '<PASSWORD>', encrypted, *limits) == 'very secret'
+    with pytest.raises(Exception):
+        decrypt(salt, '<PASSWORD>', encrypted, limits[0] + 1, limits[1])
+
+
+@pytest.mark.parametrize('opslimit, memlimit', [
+    (pwhash.argon2i.OPSLIMIT_MIN - 1, encryption.MEMLIMIT),
+    (encryption.OPSLIMIT, pwhash.argon2i.MEMLIMIT_MIN - 1),
+    ('4', encryption.MEMLIMIT),
+    (True, encryption.MEMLIMIT),
+])
+def test_check_limits_invalid(opslimit, memlimit) -> None:
+    with pytest.raises(ValueError):
+        check_limits(opslimit, memlimit)
+
+
+def test_calibrate() -> None:
+    # 1s for 1 GiB with the fewest passes, halving the memory halves the time
+    def benchmark(opslimit, memlimit, concurrency):
+        return opslimit / 3 * memlimit / 2 ** 30 * concurrency
+
+    with mock.patch('elekto.core.encryption.benchmark', side_effect=benchmark):
+        recommended = calibrate(latency=0.5, concurrency=2, memory=2 ** 31)
+
+    # 2 derivations of 1 GiB take 2s, of 256 MiB 0.5s
+    assert recommended['memlimit'] == 2 ** 28
+    assert recommended['opslimit'] == pwhash.argon2i.OPSLIMIT_MIN
+    assert recommended['seconds'] == 0.5
+    assert recommended['throughput'] == 4
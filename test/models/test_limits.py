@@ -0,0 +1,63 @@
+import pytest
+
+from elekto import SESSION
+from elekto.models.limits import Limit, MemoryStore, DatabaseStore
+from elekto.models.sql import RateLimit
+
+
+@pytest.mark.parametrize('value, expected', [
+    ('5/60', (5, 60)),
+    ('3', (3, 60)),
+    ('', None),
+    (None, None),
+    ('0/60', None),
+])
+def test_limit_parse(value, expected):
+    limit = Limit.parse(value)
+    assert (limit.capacity, limit.period) == expected if expected else limit is None
+
+
+def test_limit_take():
+    limit = Limit(2, 60)
+
+    assert limit.take(None, 0, 0) == (True, 1, 0)
+    assert limit.take(1, 0, 0) == (True, 0, 0)
+    assert limit.take(0, 0, 0) == (False, 0, 30)
+    # a token every 30s
+    assert limit.take(0, 0, 15) == (False, 0.5, 15)
+    assert limit.take(0, 0, 30) == (True, 0, 0)
+    # never more than the capacity
+    assert limit.take(0, 0, 600) == (True, 1, 0)
+
+
+def test_memory_store():
+    store, limit = MemoryStore(), Limit(2, 60)
+
+    assert [store.hit('view:1', limit, now=0) for _ in range(3)] == [(True, 0), (True, 0), (False, 30)]
+    assert store.hit('view:2', limit, now=0) == (True, 0)
+    assert store.hit('view:1', limit, now=30) == (True, 0)
+
+
+def test_memory_store_prunes_full_buckets(monkeypatch):
+    store, limit = MemoryStore(), Limit(1, 60)
+    monkeypatch.setattr(MemoryStore, 'MAX', 2)
+
+    store.hit('view:1', limit, now=0)
+    store.hit('view:2', limit, now=50)
+    store.hit('view:3', limit, now=70)
+
+    assert set(store.buckets) == {'view:2', 'view:3'}
+
+
+def test_database_store(client):
+    store, limit = DatabaseStore(SESSION), Limit(2, 60)
+
+    assert [store.hit('view:1', limit, now=0) for _ in range(3)] == [(True, 0), (True, 0), (False, 30)]
+    assert store.hit('view:2', limit, now=0) == (True, 0)
+    assert store.hit('view:1', limit, now=30) == (True, 0)
+
+    bucket = SESSION.query(RateLimit).filter_by(key='view:1').one()
+    assert (bucket.tokens, bucket.stamp) == (0, 30)
+
+    store.clear()
+    assert SESSION.query(RateLimit).count() == 0
@@ -1,13 +1,16 @@
 import os
+import subprocess
 from datetime import datetime
 from unittest import mock
 
 import pytest
 from freezegun import freeze_time
 
-from elekto import APP
+from elekto import APP, SESSION
 from elekto import constants
-from elekto.models.meta import Election
+from elekto.models import sql
+from elekto.models.meta import Election, Meta
+from ..conftest import git
 
 
 @pytest.fixture
@@ -128,13 +131,47 @@ def test_candidates_orders_differ(election):
     assert compare_candidates(candidates_a, candidates_b)
 
 
-@mock.patch('elekto.models.meta.open')
-def test_candidates_raises(open_mock, election):
-    open_mock.side_effect = IOError
+def edit(metadir, name, old, new, key='name_the_app'):
+    path = metadir / 'elections' / key.replace('---', '/') / name
+    path.write_text(path.read_text('utf8').replace(old, new), 'utf8')
 
+
+def test_candidates_skips_invalid_file(metadir):
+    edit(metadir, 'candidate-delectus.md', 'ID:', 'id:')
+    election = Election('name_the_app')
+
+    assert sorted(c['ID'] for c in election.candidates()) == ['e6n', 'elekto', 'notcivs', 'ribemont']
+    assert election.record['errors'] == ['candidate-delectus.md : invalid candidate info, an ID is required']
+
+
+@mock.patch('elekto.models.meta.F.abort')
+def test_candidate_invalid_file(abort, metadir):
+    edit(metadir, 'candidate-delectus.md', 'ID:', 'id:')
+    Election('name_the_app').candidate('delectus')
+    abort.assert_called_once_with(404)
+
+
+def test_election_invalid_yaml(metadir):
+    edit(metadir, 'election.yaml', 'end_datetime', 'ends')
     with pytest.raises(Exception) as e:
-        election.candidates()
-        assert 'Invalid candidate file: candidate-delectus.md' in str(e)
+        Election('name_the_app')
+    assert 'election.yaml is missing end_datetime' in str(e.value)
+
+
+def test_election_kdf_default(election):
+    assert election.kdf() == (APP.config['KDF_OPSLIMIT'], APP.config['KDF_MEMLIMIT'])
+
+
+def test_election_kdf(metadir):
+    edit(metadir, 'election.yaml', 'end_datetime', 'kdf_opslimit: 6\nkdf_memlimit: 67108864\nend_datetime')
+    assert Election('name_the_app').kdf() == (6, 67108864)
+
+
+def test_election_invalid_kdf(metadir):
+    edit(metadir, 'election.yaml', 'end_datetime', 'kdf_opslimit: 1\nend_datetime')
+    with pytest.raises(Exception) as e:
+        Election('name_the_app')
+    assert 'kdf opslimit must be an integer between' in str(e.value)
 
 
 @mock.patch('elekto.models.meta.F.abort')
@@ -153,9 +190,9 @@ def test_candidate_not_a_file(abort, election, metadir):
     abort.assert_called_once_with(404)
 
 
-def test_candidate(election):
-    election.election['show_candidate_fields'] = ['Language']
-    candidate = election.candidate('e6n')
+def test_candidate(metadir):
+    edit(metadir, 'election.yaml', 'show_candidate_fields:', 'show_candidate_fields: [Language]')
+    candidate = Election('name_the_app').candidate('e6n')
 
     assert candidate['name'] == 'e6n'
     assert candidate['ID'] == 'e6n'
@@ -165,7 +202,6 @@ def test_candidate(election):
 
 
 def test_candidate_show_no_fields(election):
-    election.election['show_candidate_fields'] = []
     candidate = election.candidate('e6n')
 
     assert candidate['name'] == 'e6n'
@@ -173,3 +209,365 @@ def test_candidate_show_no_fields(election):
     assert candidate['key'] == 'e6n'
     assert candidate['info'] == [{'Language': 'Leetspeak'}]
     assert candidate['fields'] == {}
+
+
+def test_election_keys(metadir):
+    assert Election.keys([
+        '2021/TOC/candidate-jberkus.md',
+        'name_the_app/election_desc.md',
+        'README.md',
+    ]) == {'2021---TOC', 'name_the_app'}
+
+
+def test_election_keys_removed_election(metadir):
+    assert Election.keys(['2019/election.yaml', '2019/voters.yaml']) == {'2019'}
+
+
+def test_election_cache_reparses_changed_election(election, metadir):
+    assert Election('name_the_app').election['name'] == 'Select The Name of the Application'
+
+    path = metadir / 'elections' / 'name_the_app' / 'election.yaml'
+    path.write_text(path.read_text('utf8').replace('Select The Name', 'Pick The Name'), 'utf8')
+
+    assert Election('name_the_app').election['name'] == 'Pick The Name of the Application'
+
+
+def test_election_invalidate(election):
+    assert election.key in Election.CACHE
+
+    Election.invalidate(['2021---GB'])
+    assert election.key in Election.CACHE
+
+    Election.invalidate(['name_the_app'])
+    assert election.key not in Election.CACHE
+
+
+def test_meta_changes(metarepo):
+    backend = Meta(APP.config['META'])
+    first = backend.head()
+    assert backend.changes(None) is None
+    assert backend.changes(first) == []
+
+    (metarepo / 'elections' / 'name_the_app' / 'candidate-e6n.md').remove()
+    git(metarepo, 'commit', '-q', '-am', 'drop e6n')
+
+    assert backend.changes(first) == ['name_the_app/candidate-e6n.md']
+    assert backend.changes('0' * 40) is None
+
+
+def test_meta_sync_only_changed_elections(metarepo, client):
+    backend = Meta(APP.config['META'])
+    backend.sync(SESSION)
+    assert SESSION.query(sql.Election).count() == 3
+
+    os.rename(metarepo / 'elections' / '2021' / 'GB', metarepo / 'elections' / '2021' / 'Board')
+    git(metarepo, 'add', '-A')
+    git(metarepo, 'commit', '-q', '-m', 'rename GB')
+
+    with mock.patch('elekto.models.meta.Election.all') as all_mock:
+        log = backend.sync(SESSION)
+        assert not all_mock.called
+
+    assert log.renamed == [('2021---GB', '2021---Board')]
+    assert [e.key for e in SESSION.query(sql.Election).order_by(sql.Election.key)] == \
+           ['2021---Board', '2021---TOC', 'name_the_app']
+
+    syncs = SESSION.query(sql.Sync).all()
+    assert len(syncs) == 2
+    assert syncs[-1].commit == backend.head()
+
+
+def test_meta_sync_reports_invalid_files(metarepo, client):
+    backend = Meta(APP.config['META'])
+    backend.sync(SESSION)
+
+    edit(metarepo, 'election.yaml', 'start_datetime', 'start', key='2021---GB')
+    edit(metarepo, 'candidate-delectus.md', 'ID:', 'id:')
+    git(metarepo, 'commit', '-q', '-am', 'break GB and delectus')
+
+    log = backend.sync(SESSION)
+    assert ' x 2021---GB: election.yaml is missing start_datetime\n' in str(log)
+    assert ' x name_the_app: candidate-delectus.md : invalid candidate info, an ID is required\n' in str(log)
+
+    # the invalid election is kept as it was synced last
+    assert SESSION.query(sql.Election).filter_by(key='2021---GB').one().name
+    assert SESSION.query(sql.Election).filter_by(key='name_the_app').one().candidate_count == 4
+
+    # and is not dropped by a full sync either
+    SESSION.query(sql.Sync).delete()
+    assert not backend.sync(SESSION).removed
+    assert SESSION.query(sql.Election).count() == 3
+
+
+@pytest.fixture
+def atomic(metarepo, tmpdir_factory):
+    """Configure an atomic deployment cloning the temporary meta repository."""
+    config = APP.config['META']
+    remote, path = config['REMOTE'], config['PATH']
+    live = tmpdir_factory.mktemp('live') / 'meta'
+
+    config.update({'REMOTE': str(metarepo), 'PATH': str(live), 'BRANCH': 'main', 'ATOMIC': True})
+    yield live
+    config.update({'REMOTE': remote, 'PATH': path, 'ATOMIC': False})
+
+
+def test_meta_atomic_checkouts(atomic, metarepo):
+    backend = Meta(APP.config['META'])
+    backend.clone()
+
+    first = os.path.realpath(atomic)
+    assert os.path.islink(atomic)
+    assert first == os.path.join(backend.CHECKOUTS, backend.head())
+    assert Election('name_the_app').election['name'] == 'Select The Name of the Application'
+
+    # A reader resolved the meta before the flip keeps reading its checkout.
+    reader = Election('name_the_app')
+
+    path = metarepo / 'elections' / 'name_the_app' / 'election.yaml'
+    path.write_text(path.read_text('utf8').replace('Select The Name', 'Pick The Name'), 'utf8')
+    git(metarepo, 'commit', '-q', '-am', 'rename')
+
+    backend = Meta(APP.config['META'])
+    backend.pull()
+
+    second = os.path.realpath(atomic)
+    assert second != first
+    assert second == backend.META
+    assert Election('name_the_app').election['name'] == 'Pick The Name of the Application'
+    assert reader.get()['name'] == 'Select The Name of the Application'
+
+    git(metarepo, 'commit', '-q', '--allow-empty', '-m', 'empty')
+    Meta(APP.config['META']).pull()
+
+    # Only the current and the previous checkouts are kept.
+    assert not os.path.exists(first)
+    assert os.path.isdir(second)
+    assert len(os.listdir(Meta(APP.config['META']).CHECKOUTS)) == 2
+
+
+def test_meta_atomic_pull_unchanged(atomic):
+    backend = Meta(APP.config['META'])
+    backend.clone()
+    first = os.path.realpath(atomic)
+
+    Meta(APP.config['META']).pull()
+    assert os.path.realpath(atomic) == first
+
+
+def test_meta_atomic_from_plain_clone(atomic):
+    APP.config['META']['ATOMIC'] = False
+    Meta(APP.config['META']).clone()
+    assert os.path.isdir(atomic / '.git')
+
+    # console --sync pulls as the meta path exists
+    APP.config['META']['ATOMIC'] = True
+    backend = Meta(APP.config['META'])
+    backend.pull()
+
+    assert os.path.islink(atomic)
+    assert os.path.realpath(atomic) == os.path.join(backend.CHECKOUTS, backend.head())
+    assert os.path.isdir(str(atomic) + '.plain')
+    assert Election('name_the_app').election['name'] == 'Select The Name of the Application'
+
+
+@pytest.fixture
+def shallow(metarepo, tmpdir_factory):
+    """Configure a shallow deployment of a repository with history outside the election directory."""
+    (metarepo / 'docs').mkdir()
+    (metarepo / 'docs' / 'index.md').write_text('# Docs', 'utf8')
+    git(metarepo, 'add', 'docs')
+    git(metarepo, 'commit', '-q', '-m', 'docs')
+    git(metarepo, 'config', 'uploadpack.allowFilter', 'true')
+
+    config = APP.config['META']
+    remote, path = config['REMOTE'], config['PATH']
+    clone = tmpdir_factory.mktemp('shallow') / 'meta'
+
+    # --depth is ignored by git for plain local paths
+    config.update({'REMOTE': 'file://{}'.format(metarepo), 'PATH': str(clone), 'BRANCH': 'main', 'SHALLOW': True})
+    yield clone
+    config.update({'REMOTE': remote, 'PATH': path, 'SHALLOW': False, 'ATOMIC': False})
+
+
+def commits(path):
+    res = subprocess.run(['git', '-C', str(path), 'rev-list', '--count', 'HEAD'], capture_output=True, text=True)
+    return int(res.stdout)
+
+
+def test_meta_shallow_clone(shallow, metarepo, client):
+    backend = Meta(APP.config['META'])
+    backend.clone()
+
+    assert commits(shallow) == 1
+    assert os.path.isdir(shallow / 'elections' / 'name_the_app')
+    assert not os.path.exists(shallow / 'docs')
+    backend.sync(SESSION)
+    assert SESSION.query(sql.Election).count() == 3
+
+    path = metarepo / 'elections' / 'name_the_app' / 'election.yaml'
+    path.write_text(path.read_text('utf8').replace('Select The Name', 'Pick The Name'), 'utf8')
+    git(metarepo, 'commit', '-q', '-am', 'rename')
+
+    backend.pull()
+    assert commits(shallow) == 1
+    assert backend.head() == subprocess.run(['git', '-C', str(metarepo), 'rev-parse', 'HEAD'],
+                                            capture_output=True, text=True).stdout.strip()
+    # the previous tip is still known, the sync stays incremental
+    assert backend.changes(SESSION.query(sql.Sync).order_by(sql.Sync.id.desc()).first().commit) == ['name_the_app/election.yaml']
+    assert Election('name_the_app').election['name'] == 'Pick The Name of the Application'
+
+
+def test_meta_shallow_atomic_checkouts(shallow):
+    APP.config['META']['ATOMIC'] = True
+    backend = Meta(APP.config['META'])
+    backend.clone()
+
+    assert os.path.isdir(shallow / 'elections' / '2021' / 'GB')
+    assert not os.path.exists(shallow / 'docs')
+    assert Election('2021---GB').election['name']
+
+
+def test_listelecdirs(metadir):
+    path = str(metadir / 'elections')
+    assert sorted(Election.listelecdirs(path)) == ['2021---GB', '2021---TOC', 'name_the_app']
+
+
+def test_listelecdirs_prunes(metadir):
+    path = metadir / 'elections'
+    (path / 'name_the_app' / 'nested').mkdir()
+    (path / 'name_the_app' / 'nested' / 'election.yaml').write_text('name: nested', 'utf8')
+    (path / 'archive' / '2019').ensure(dir=True)
+    (path / 'archive' / '2019' / 'election.yaml').write_text('name: old', 'utf8')
+
+    # The walk stops at an election and skips the configured directories.
+    assert sorted(Election.listelecdirs(str(path), skip=['archive'])) == ['2021---GB', '2021---TOC', 'name_the_app']
+    assert '2021---GB' not in Election.listelecdirs(str(path), skip=['2021/GB'])
+    assert 'archive---2019' in Election.listelecdirs(str(path), skip=[])
+
+
+def test_listelecdirs_cached(metadir):
+    path = metadir / 'elections'
+    Election.listelecdirs(str(path), skip=[])
+
+    with mock.patch('elekto.models.storage.FileStore.entries') as entries:
+        assert sorted(Election.listelecdirs(str(path), skip=[])) == ['2021---GB', '2021---TOC', 'name_the_app']
+        entries.assert_not_called()
+
+    (path / '2022' / 'SC').ensure(dir=True)
+    (path / '2022' / 'SC' / 'election.yaml').write_text('name: sc', 'utf8')
+    assert '2022---SC' in Election.listelecdirs(str(path), skip=[])
+
+    (path / '2021' / 'GB' / 'election.yaml').remove()
+    assert '2021---GB' not in Election.listelecdirs(str(path), skip=[])
+
+
+def test_meta_records(metadir):
+    records = Meta(APP.config['META']).records(['name_the_app', '2021---GB'])
+    assert dict(records['name_the_app']['election'], status=mock.ANY) == Election('name_the_app').election
+    assert sorted(records['2021---GB']) == ['candidates', 'counts', 'election', 'errors', 'profiles', 'voters']
+    assert records['name_the_app']['counts'] == {'candidate_count': 5, 'voter_count': 5}
+
+
+def test_meta_sync_parallel(metarepo, client):
+    backend = Meta(APP.config['META'])
+    log = backend.sync(SESSION, workers=2)
+
+    assert ' + Select The Name of the Application added in the database.\n' in str(log)
+    assert sorted(e.key for e in SESSION.query(sql.Election)) == ['2021---GB', '2021---TOC', 'name_the_app']
+
+
+def test_meta_sync_stores_counts(metarepo, client):
+    Meta(APP.config['META']).sync(SESSION)
+
+    election = SESSION.query(sql.Election).filter_by(key='name_the_app').one()
+    assert (election.candidate_count, election.voter_count) == (5, 5)
+    assert election.start_datetime == Election('name_the_app').election['start_datetime']
+
+
+def test_election_eligible(metadir):
+    election = Election('name_the_app')
+    assert election.eligible('jberkus')
+    assert not election.eligible('someone')
+
+
+def test_meta_sync_eligibility(metarepo, client):
+    backend = Meta(APP.config['META'])
+    backend.sync(SESSION)
+
+    assert Election.eligible_for('jberkus') == ['2021---GB', '2021---TOC', 'name_the_app']
+    assert Election.eligible_for('someone') == []
+
+    # An incremental sync keeps the entries of the unchanged elections.
+    path = metarepo / 'elections' / 'name_the_app' / 'voters.yaml'
+    path.write_text(path.read_text('utf8').replace('- jberkus', '- someone'), 'utf8')
+    git(metarepo, 'commit', '-q', '-am', 'swap voter')
+    backend.sync(SESSION)
+
+    assert Election.eligible_for('jberkus') == ['2021---GB', '2021---TOC']
+    assert Election.eligible_for('someone') == ['name_the_app']
+
+
+def test_meta_sync_eligibility_of_invalid_election(metarepo, client):
+    backend = Meta(APP.config['META'])
+    backend.sync(SESSION)
+
+    # An election that fails to compile keeps its entries.
+    edit(metarepo, 'election.yaml', 'start_datetime', 'start')
+    git(metarepo, 'commit', '-q', '-am', 'break name_the_app')
+    backend.sync(SESSION)
+
+    assert Election.eligible_for('jberkus') == ['2021---GB', '2021---TOC', 'name_the_app']
+
+
+def test_meta_sync_keeps_voters_of_invalid_voters(metarepo, client, tmpdir_factory, monkeypatch):
+    monkeypatch.setitem(APP.config['META'], 'SNAPSHOT', str(tmpdir_factory.mktemp('snapshot') / 'meta.snapshot'))
+    backend = Meta(APP.config['META'])
+    backend.sync(SESSION)
+
+    # A typo in voters.yaml is reported, the previous voters are kept.
+    edit(metarepo, 'voters.yaml', 'eligible_voters:', 'eligible_voters: [')
+    git(metarepo, 'commit', '-q', '-am', 'break voters')
+    log = backend.sync(SESSION)
+
+    assert ' x name_the_app: voters.yaml : ' in str(log)
+    assert log.voters == {}
+    election = SESSION.query(sql.Election).filter_by(key='name_the_app').one()
+    assert election.voter_count == 5
+    assert SESSION.query(sql.EligibleVoter).filter_by(election_id=election.id).count() == 5
+    assert Election.eligible_for('jberkus') == ['2021---GB', '2021---TOC', 'name_the_app']
+    assert Election('name_the_app').eligible('jberkus')
+
+
+def test_meta_sync_eligibility_without_index(metarepo, client):
+    backend = Meta(APP.config['META'])
+    backend.sync(SESSION)
+
+    # A fresh checkout (ie: a restarted pod) synced incrementally rebuilds the index.
+    os.remove(backend.ELIGIBILITY)
+    backend.sync(SESSION)
+    assert Election.eligible_for('jberkus') == ['2021---GB', '2021---TOC', 'name_the_app']
+
+    os.remove(backend.ELIGIBILITY)
+    path = metarepo / 'elections' / 'name_the_app' / 'voters.yaml'
+    path.write_text(path.read_text('utf8').replace('- jberkus', '- someone'), 'utf8')
+    git(metarepo, 'commit', '-q', '-am', 'swap voter')
+    backend.sync(SESSION)
+
+    assert Election.eligible_for('jberkus') == ['2021---GB', '2021---TOC']
+    assert Election.eligible_for('someone') == ['name_the_app']
+
+
+def test_meta_sync_eligible_voters_of_changed_voters(metarepo, client):
+    backend = Meta(APP.config['META'])
+    log = backend.sync(SESSION)
+    assert ' ~ name_the_app: 5 eligible voters added, 0 removed.\n' in str(log)
+
+    path = metarepo / 'elections' / 'name_the_app' / 'election.yaml'
+    path.write_text(path.read_text('utf8').replace('Select The Name', 'Pick The Name'), 'utf8')
+    git(metarepo, 'commit', '-q', '-am', 'rename')
+    assert backend.sync(SESSION).voters == {}
+
+    path = metarepo / 'elections' / 'name_the_app' / 'voters.yaml'
+    path.write_text(path.read_text('utf8').replace('- jberkus', '- someone'), 'utf8')
+    git(metarepo, 'commit', '-q', '-am', 'swap voter')
+    assert backend.sync(SESSION).voters == {'name_the_app': (1, 1)}
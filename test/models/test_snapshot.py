@@ -0,0 +1,137 @@
+import os
+import shutil
+
+import pytest
+
+from elekto import APP
+from elekto.models.meta import Election, Meta
+from elekto.models.snapshot import Snapshot
+from elekto.models.voters import VoterIndex
+
+
+@pytest.fixture
+def snapshot_path(tmpdir):
+    path = str(tmpdir / 'meta.snapshot')
+    APP.config['META']['SNAPSHOT'] = path
+    yield path
+    APP.config['META']['SNAPSHOT'] = None
+
+
+def test_snapshot_write_read(snapshot_path):
+    Snapshot.write(snapshot_path, 'v1', {'a': {'x': 1}, 'b': {'y': [1, 2]}})
+
+    snapshot = Snapshot.open(snapshot_path)
+    assert snapshot.version == 'v1'
+    assert sorted(snapshot.keys()) == ['a', 'b']
+    assert 'a' in snapshot
+    assert snapshot.get('b') == {'y': [1, 2]}
+    assert snapshot.get('c') is None
+
+
+def test_snapshot_not_configured_or_missing(snapshot_path):
+    assert Snapshot.open(None) is None
+    assert Snapshot.open(snapshot_path) is None
+
+
+def test_snapshot_swapped(snapshot_path):
+    Snapshot.write(snapshot_path, 'v1', {'a': {'x': 1}})
+    first = Snapshot.open(snapshot_path)
+    assert Snapshot.open(snapshot_path) is first
+
+    Snapshot.write(snapshot_path, 'v2', {'a': {'x': 2}, 'b': first.raw('a')})
+    second = Snapshot.open(snapshot_path)
+    assert second is not first
+    assert second.version == 'v2'
+    assert second.get('a') == {'x': 2}
+    assert second.get('b') == {'x': 1}
+
+    # the old mapping stays readable
+    assert first.get('a') == {'x': 1}
+
+
+class Unpicklable:
+    def __reduce__(self):
+        raise TypeError('not picklable')
+
+
+def test_snapshot_failed_write(snapshot_path):
+    Snapshot.write(snapshot_path, 'v1', {'a': {'x': 1}})
+
+    with pytest.raises(TypeError):
+        Snapshot.write(snapshot_path, 'v2', {'a': Unpicklable()})
+
+    # the failed write is dropped, the old snapshot stays in place
+    assert os.listdir(os.path.dirname(snapshot_path)) == ['meta.snapshot']
+    assert Snapshot.open(snapshot_path).version == 'v1'
+
+
+def test_snapshot_invalid_file(snapshot_path):
+    with open(snapshot_path, 'wb') as f:
+        f.write(b'not a snapshot')
+
+    with pytest.raises(ValueError):
+        Snapshot.open(snapshot_path)
+
+
+def test_election_served_from_snapshot(metadir, snapshot_path):
+    Meta(APP.config['META']).snapshot('v1')
+    expected = Election('name_the_app', snapshot=False)
+    description = expected.candidate('e6n')['description']
+
+    # Workers must not need the meta files once the snapshot is written.
+    shutil.rmtree(metadir / 'elections')
+
+    election = Election('name_the_app')
+    assert election.election == expected.election
+    assert 'jberkus' in election.voters()['eligible_voters']
+    assert sorted(c['key'] for c in election.candidates()) == ['delectus', 'e6n', 'elekto', 'notcivs', 'ribemont']
+    assert election.candidate('e6n')['description'] == description
+    assert sorted(e['key'] for e in Election.all()) == ['2021---GB', '2021---TOC', 'name_the_app']
+
+
+def test_snapshot_keeps_unchanged_records(metadir, snapshot_path):
+    backend = Meta(APP.config['META'])
+    backend.snapshot('v1')
+    first = Snapshot.open(snapshot_path)
+
+    os.remove(metadir / 'elections' / 'name_the_app' / 'candidate-e6n.md')
+    backend.snapshot('v2', keys={'name_the_app'})
+    second = Snapshot.open(snapshot_path)
+
+    assert second.version == 'v2'
+    assert second.raw('2021---GB') == first.raw('2021---GB')
+    assert 'e6n' not in second.get('name_the_app')['profiles']
+
+
+def test_snapshot_compiled_in_parallel(metadir, snapshot_path):
+    backend = Meta(APP.config['META'])
+    keys = ['2021---GB', '2021---TOC', 'name_the_app']
+    serial = backend.records(keys)
+
+    records = backend.records(keys, workers=2)
+    assert sorted(records) == keys
+    for k in keys:
+        assert records[k]['election'] == serial[k]['election']
+        assert set(records[k]['voters']['eligible_voters']) == set(serial[k]['voters']['eligible_voters'])
+        assert records[k]['profiles'] == serial[k]['profiles']
+
+    backend.snapshot('v1', compiled=records)
+    assert Snapshot.open(snapshot_path).get('name_the_app')['profiles'] == serial['name_the_app']['profiles']
+
+
+def test_snapshot_voters_index(metadir, snapshot_path):
+    backend = Meta(APP.config['META'])
+    backend.snapshot('v1')
+
+    record = Snapshot.open(snapshot_path).get('name_the_app')
+    assert isinstance(record['voters']['eligible_voters'], VoterIndex)
+    assert os.path.isfile(os.path.join(backend.VOTERS, 'name_the_app.idx'))
+
+    election = Election('name_the_app')
+    assert election.eligible('jberkus')
+    assert not election.eligible('someone')
+
+    # The index of a removed election is dropped.
+    shutil.rmtree(metadir / 'elections' / 'name_the_app')
+    backend.snapshot('v2')
+    assert not os.path.exists(os.path.join(backend.VOTERS, 'name_the_app.idx'))
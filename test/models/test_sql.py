@@ -3,7 +3,7 @@ import sqlalchemy
 from config import DATABASE_URL
 from elekto.models.sql import migrate
 
-from sqlalchemy import INTEGER, VARCHAR, DATETIME, BLOB, CHAR, TEXT, BOOLEAN
+from sqlalchemy import INTEGER, VARCHAR, DATETIME, BLOB, CHAR, TEXT, BOOLEAN, JSON
 from sqlalchemy.sql.type_api import TypeEngine as SQLAlchemyType
 
 
@@ -20,7 +20,7 @@ def test_migrate():
     session = migrate(DATABASE_URL)
 
     schema_version = session.execute('select version from schema_version').scalar()
-    assert schema_version == 2
+    assert schema_version == 9
 
     schema = sqlalchemy.inspect(sqlalchemy.create_engine(DATABASE_URL))
     assert schema.has_table('election')
@@ -51,6 +51,19 @@ def test_migrate():
         assert election_schema[i]['primary_key'] == 0
         assert type(election_schema[i]['type']) == DATETIME
 
+    listing_columns = {5: ('organization', VARCHAR), 6: ('start_datetime', DATETIME), 7: ('end_datetime', DATETIME),
+                       8: ('exception_due', DATETIME), 9: ('officers', JSON), 10: ('candidate_count', INTEGER),
+                       11: ('voter_count', INTEGER)}
+    for i, (col_name, col_type) in listing_columns.items():
+        assert election_schema[i]['name'] == col_name
+        assert election_schema[i]['nullable'] == True
+        assert isinstance(election_schema[i]['type'], col_type)
+
+    indexes = {tuple(index['column_names']) for index in schema.get_indexes('election')}
+    assert {('organization',), ('start_datetime',), ('end_datetime',), ('exception_due',)} <= indexes
+    voter_indexes = {tuple(index['column_names']): index['unique'] for index in schema.get_indexes('voter')}
+    assert voter_indexes[('election_id', 'user_id')]
+
     # model: User
     user_schema = schema.get_columns('user')
     assert_pk(user_schema)
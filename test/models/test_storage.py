@@ -0,0 +1,147 @@
+import os
+import subprocess
+
+import pytest
+
+from elekto import APP, SESSION
+from elekto.models import sql
+from elekto.models.meta import Election, Meta
+from elekto.models.storage import FileStore, GitStore
+from ..conftest import git
+
+
+@pytest.fixture
+def bare(metarepo, tmpdir_factory):
+    """A bare clone of the temporary meta repository, read through the git store."""
+    path = tmpdir_factory.mktemp('bare') / 'meta.git'
+    subprocess.run(['git', 'clone', '-q', '--bare', str(metarepo), str(path)], check=True)
+
+    config = APP.config['META']
+    original = config['PATH']
+    config.update({'PATH': str(path), 'STORE': 'git', 'BRANCH': 'main'})
+    yield path
+    config.update({'PATH': original, 'STORE': 'fs', 'REVISION': None})
+
+
+@pytest.fixture
+def store(bare):
+    return GitStore(str(bare), str(bare), 'main')
+
+
+def test_git_store_read(store, bare, metarepo):
+    path = os.path.join(str(bare), 'elections', 'name_the_app', 'election.yaml')
+    with open(metarepo / 'elections' / 'name_the_app' / 'election.yaml') as f:
+        assert store.read(path) == f.read()
+
+    assert store.isfile(path)
+    assert not store.isdir(path)
+    assert store.read(os.path.join(str(bare), 'elections', 'missing.yaml')) is None
+    assert store.read(os.path.join(str(bare), '..', 'outside')) is None
+
+
+def test_git_store_tree(store, bare):
+    elections = os.path.join(str(bare), 'elections')
+    assert store.isdir(elections)
+    assert sorted(store.listdir(elections)) == ['2021', 'name_the_app']
+
+    with pytest.raises(FileNotFoundError):
+        store.listdir(os.path.join(elections, 'missing'))
+
+    walked = {os.path.relpath(root, elections): sorted(dirs) for root, dirs, files in store.walk(elections)}
+    assert walked['.'] == ['2021', 'name_the_app']
+    assert walked['2021'] == ['GB', 'TOC']
+
+
+def test_git_store_matches_file_store(store, bare, metarepo):
+    git_root = os.path.join(str(bare), 'elections', '2021', 'GB')
+    fs_root = os.path.join(str(metarepo), 'elections', '2021', 'GB')
+    assert sorted(store.listdir(git_root)) == sorted(FileStore().listdir(fs_root))
+
+
+def test_git_store_single_process(store, bare):
+    """All the reads of a worker go through one long-lived cat-file process."""
+    store.read(os.path.join(str(bare), 'elections', 'name_the_app', 'election.yaml'))
+    proc = GitStore.PROCESSES[(os.getpid(), str(bare))]
+
+    GitStore(str(bare), str(bare), 'main').listdir(os.path.join(str(bare), 'elections'))
+    assert GitStore.PROCESSES[(os.getpid(), str(bare))] is proc
+
+
+def test_git_store_pinned_revision(bare, metarepo):
+    first = GitStore(str(bare), str(bare), 'main').commit
+
+    path = metarepo / 'elections' / 'name_the_app' / 'election.yaml'
+    path.write_text(path.read_text('utf8').replace('Select The Name', 'Pick The Name'), 'utf8')
+    git(metarepo, 'commit', '-q', '-am', 'rename')
+    git(bare, 'fetch', '-q', 'origin', '+main:main')
+
+    assert Election('name_the_app').election['name'] == 'Pick The Name of the Application'
+
+    APP.config['META']['REVISION'] = first
+    assert Election('name_the_app').election['name'] == 'Select The Name of the Application'
+    assert Meta(APP.config['META']).head() == first
+
+
+def test_election_from_git_store(bare):
+    assert isinstance(Meta(APP.config['META']).storage, GitStore)
+    assert sorted(e['key'] for e in Election.all()) == ['2021---GB', '2021---TOC', 'name_the_app']
+
+    election = Election('2021---GB')
+    assert 'dims' in election.voters()['eligible_voters']
+    assert sorted(c['key'] for c in election.candidates()) == ['aaron', 'dims', 'paris']
+    assert election.candidate('dims')['fields'] == {'employer': 'VMware'}
+
+
+def test_git_store_first_clone(metarepo, tmpdir_factory):
+    """The store of a meta not cloned yet reads the clone."""
+    config = APP.config['META']
+    original = dict(config)
+    path = tmpdir_factory.mktemp('first') / 'meta'
+    config.update({'PATH': str(path), 'REMOTE': str(metarepo), 'STORE': 'git', 'BRANCH': 'main'})
+    try:
+        backend = Meta(config)
+        backend.clone()
+
+        head = subprocess.run(['git', '-C', str(metarepo), 'rev-parse', 'HEAD'],
+                              check=True, capture_output=True, text=True).stdout.strip()
+        assert backend.head() == head
+        assert backend.storage.gitdir == os.path.join(str(path), '.git')
+        assert Election('name_the_app').election['name'] == 'Select The Name of the Application'
+    finally:
+        config.clear()
+        config.update(original)
+
+
+def test_git_store_not_a_repository(tmpdir):
+    store = GitStore(None, str(tmpdir), 'main')
+    with pytest.raises(RuntimeError) as e:
+        store.commit
+    assert 'git cat-file --batch of {} failed'.format(tmpdir) in str(e.value)
+
+
+def test_git_store_atomic_sync(metarepo, tmpdir_factory, client):
+    """The store of an atomic deployment follows the checkouts of the syncs."""
+    config = APP.config['META']
+    original = dict(config)
+    path = tmpdir_factory.mktemp('atomic') / 'meta'
+    config.update({'PATH': str(path), 'REMOTE': str(metarepo), 'STORE': 'git', 'BRANCH': 'main', 'ATOMIC': True})
+    try:
+        backend = Meta(config)
+        backend.clone()
+        assert backend.storage.root == os.path.realpath(str(path))
+        backend.sync(SESSION)
+        assert SESSION.query(sql.Election).count() == 3
+
+        edited = metarepo / 'elections' / 'name_the_app' / 'election.yaml'
+        edited.write_text(edited.read_text('utf8').replace('Select The Name', 'Pick The Name'), 'utf8')
+        git(metarepo, 'commit', '-q', '-am', 'rename')
+
+        backend.pull()
+        log = backend.sync(SESSION)
+        assert not log.removed
+        assert SESSION.query(sql.Election).count() == 3
+        assert SESSION.query(sql.Election).filter_by(key='name_the_app').one().name == \
+            'Pick The Name of the Application'
+    finally:
+        config.clear()
+        config.update(original)
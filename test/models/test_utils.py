@@ -1,4 +1,5 @@
 import os
+from datetime import date, datetime
 from unittest import mock
 
 import pytest
@@ -9,9 +10,9 @@ from elekto.models.utils import (
     parse_yaml_from_string,
     extract_candidate_info,
     extract_candidate_description,
-    sync, parse_md,
+    sync, parse_md, listing, to_datetime, sync_eligible_voters,
 )
-from elekto.models.sql import Election, migrate
+from elekto.models.sql import Ballot, Election, EligibleVoter, migrate
 from elekto.models import meta
 
 
@@ -156,22 +157,64 @@ def test_sync(metadir):
     assert election_keys == ['2021---GB', '2021---TOC', 'name_the_website']
 
 
-@mock.patch('sqlalchemy.orm.scoping.scoped_session.query')
-def test_sync_deletion_exception(query_mock, metadir):
-    query_mock.side_effect = Exception
+def test_sync_diff(metadir):
+    session = migrate(DATABASE_URL)
+    session.query(Election).delete()
+    session.add(Election(key='stale', name='Stale'))
+    session.commit()
+
+    diff = sync(session, meta.Election.all())
+    assert diff.added == {
+        '2021---GB': 'Select our 2021 General Board Rep',
+        '2021---TOC': '2021 Steering Committee Election',
+        'name_the_app': 'Select The Name of the Application',
+    }
+    assert diff.removed == ['stale']
+    assert ' - Deleted stale from the database.\n' in str(diff)
+
+    # Nothing to apply the second time, unchanged elections are not written.
+    assert not sync(session, meta.Election.all())
+
+    elections = [dict(e, organization='CNCF') if e['key'] == '2021---GB' else e for e in meta.Election.all()]
+    diff = sync(session, elections)
+    assert (diff.added, diff.updated, diff.removed) == ({}, ['2021---GB'], [])
+    session.close()
+
 
+def test_sync_renamed_keeps_votes(metadir):
     session = migrate(DATABASE_URL)
-    logs = sync(session, meta.Election.all())
-    assert ' x Error while querying to the database.\n' in logs
+    session.query(Election).delete()
+    session.commit()
+    sync(session, meta.Election.all())
+
+    election = session.query(Election).filter_by(key='name_the_app').one()
+    session.add(Ballot(election=election, voter='v', rank=1, candidate='e6n'))
+    session.commit()
+
+    os.rename(metadir / 'elections' / 'name_the_app', metadir / 'elections' / 'name_the_website')
+    meta.Election.invalidate()
+    diff = sync(session, meta.Election.all())
 
+    assert diff.renamed == [('name_the_app', 'name_the_website')]
+    assert (diff.added, diff.removed) == ({}, [])
+    renamed = session.query(Election).filter_by(key='name_the_website').one()
+    assert renamed.id == election.id
+    assert len(renamed.ballots) == 1
+    session.close()
 
-@mock.patch('sqlalchemy.orm.scoping.scoped_session.add')
-def test_sync_add_exception(add_mock, metadir):
-    add_mock.side_effect = Exception
+
+@mock.patch('elekto.models.utils.sync_eligible_voters')
+def test_sync_rolls_back_on_error(sync_mock, metadir):
+    sync_mock.side_effect = RuntimeError
 
     session = migrate(DATABASE_URL)
-    logs = sync(session, meta.Election.all())
-    assert ' x while adding {} in the database, application ran in to error.\n' in logs
+    session.query(Election).delete()
+    session.commit()
+
+    with pytest.raises(RuntimeError):
+        sync(session, meta.Election.all(), voters={'name_the_app': ['jberkus']})
+    assert session.query(Election).count() == 0
+    session.close()
 
 
 def test_parse_md(metadir):
@@ -188,3 +231,116 @@ def test_parse_md_file_error(metadir):
 def test_parse_md_generic_error(open_mock):
     open_mock.side_effect = Exception
     assert parse_md('') == 'Markdown format not Correct'
+
+
+def test_sync_only_changed_keys(metadir):
+    """Elections outside the changed keys must be left untouched."""
+    session = migrate(DATABASE_URL)
+    session.query(Election).delete()
+    session.add(Election(key='stale', name='Stale'))
+    session.commit()
+
+    sync(session, [meta.Election('name_the_app').get()], keys={'name_the_app', '2019'})
+
+    election_keys = [
+        raw[0]
+        for raw in session.query().with_entities(Election.key).all()
+    ]
+    assert sorted(election_keys) == ['name_the_app', 'stale']
+
+
+def test_sync_stores_listing_fields(metadir):
+    session = migrate(DATABASE_URL)
+    session.query(Election).delete()
+    session.commit()
+
+    election = dict(meta.Election('2021---GB').get(), candidate_count=3, voter_count=7)
+    sync(session, [election])
+
+    stored = session.query(Election).filter_by(key='2021---GB').one()
+    assert stored.organization == 'Kubernetes'
+    assert stored.start_datetime == datetime(2023, 8, 1, 0, 0, 1)
+    assert stored.end_datetime == datetime(2023, 8, 22, 23, 59)
+    assert stored.exception_due == datetime(2023, 8, 13, 10, 0)
+    assert stored.officers == ['kalkayan', 'jberkus', 'mrbobbytables']
+    assert (stored.candidate_count, stored.voter_count) == (3, 7)
+
+    # Updated in place by the next sync.
+    sync(session, [dict(election, organization='CNCF', candidate_count=2)])
+    stored = session.query(Election).filter_by(key='2021---GB').one()
+    assert (stored.organization, stored.candidate_count) == ('CNCF', 2)
+
+
+def test_to_datetime():
+    assert to_datetime(datetime(2021, 1, 2, 3)) == datetime(2021, 1, 2, 3)
+    assert to_datetime(date(2021, 1, 2)) == datetime(2021, 1, 2)
+    assert to_datetime('soon') is None
+
+
+def test_listing(metadir):
+    session = migrate(DATABASE_URL)
+    session.query(Election).delete()
+    for i in range(5):
+        session.add(Election(key='e{}'.format(i), name='E{}'.format(i),
+                             start_datetime=datetime(2020 + i, 1, 1), end_datetime=datetime(2020 + i, 2, 1)))
+    session.commit()
+
+    elections, page, pages = listing(session, per_page=2)
+    assert [e['key'] for e in elections] == ['e4', 'e3']
+    assert (page, pages) == (1, 3)
+
+    elections, page, pages = listing(session, page=9, per_page=2)
+    assert [e['key'] for e in elections] == ['e0']
+    assert page == 3
+
+    with mock.patch('elekto.models.sql.datetime') as datetime_mock:
+        datetime_mock.now.return_value = datetime(2022, 1, 15)
+        assert [e['key'] for e in listing(session, status='running')[0]] == ['e2']
+        assert [e['key'] for e in listing(session, status='upcoming')[0]] == ['e4', 'e3']
+        assert [e['key'] for e in listing(session, status='completed')[0]] == ['e1', 'e0']
+    assert listing(session, status='unknown')[0] == []
+
+
+def eligible(session, key):
+    election = session.query(Election).filter_by(key=key).one()
+    return sorted(u for (u,) in session.query(EligibleVoter.username).filter_by(election_id=election.id))
+
+
+def test_sync_eligible_voters(metadir):
+    session = migrate(DATABASE_URL)
+    session.query(EligibleVoter).delete()
+    session.query(Election).delete()
+    session.commit()
+
+    election = meta.Election('name_the_app').get()
+    log = sync(session, [election], voters={'name_the_app': ['jberkus', 'kalkayan', 'dims']})
+    assert ' ~ name_the_app: 3 eligible voters added, 0 removed.\n' in str(log)
+    assert eligible(session, 'name_the_app') == ['dims', 'jberkus', 'kalkayan']
+
+    # Only the difference is applied, the untouched rows are kept.
+    kept = session.query(EligibleVoter).filter_by(username='jberkus').one().id
+    log = sync(session, [election], voters={'name_the_app': ['jberkus', 'kalkayan', 'nikhita']})
+    assert ' ~ name_the_app: 1 eligible voters added, 1 removed.\n' in str(log)
+    assert eligible(session, 'name_the_app') == ['jberkus', 'kalkayan', 'nikhita']
+    assert session.query(EligibleVoter).filter_by(username='jberkus').one().id == kept
+
+    # Elections without changed voters are left alone.
+    log = sync(session, [election])
+    assert 'eligible voters' not in str(log)
+    assert eligible(session, 'name_the_app') == ['jberkus', 'kalkayan', 'nikhita']
+    session.close()
+
+
+def test_sync_eligible_voters_large(metadir):
+    session = migrate(DATABASE_URL)
+    session.query(EligibleVoter).delete()
+    session.query(Election).delete()
+    session.add(Election(key='large', name='Large'))
+    session.commit()
+    election = session.query(Election).filter_by(key='large').one()
+
+    assert sync_eligible_voters(session, election.id, ['user-{}'.format(i) for i in range(3000)]) == (3000, 0)
+    assert sync_eligible_voters(session, election.id, ['user-{}'.format(i) for i in range(1000)]) == (0, 2000)
+    assert session.query(EligibleVoter).filter_by(election_id=election.id).count() == 1000
+    session.rollback()
+    session.close()
@@ -0,0 +1,75 @@
+import io
+import pickle
+
+import pytest
+
+from elekto.models.voters import VoterIndex
+
+
+VOTERS = """
+# leading comment
+eligible_voters:
+  - kalkayan
+  - jberkus
+  - 'élan'
+  - 1234
+  - jberkus
+exception_voters:
+  - someone
+nested:
+  eligible_voters:
+    - intruder
+"""
+
+
+def test_voters_parse():
+    assert list(VoterIndex.parse(io.StringIO(VOTERS))) == ['kalkayan', 'jberkus', 'élan', '1234', 'jberkus']
+    assert list(VoterIndex.parse(io.StringIO('eligible_voters:\n'))) == []
+    assert list(VoterIndex.parse(io.StringIO('other: [a, b]\n'))) == []
+
+
+def test_voters_index(tmpdir):
+    index = VoterIndex.write(str(tmpdir / 'voters.idx'), VoterIndex.parse(io.StringIO(VOTERS)))
+
+    assert len(index) == 4
+    assert list(index) == sorted(['1234', 'jberkus', 'kalkayan', 'élan'], key=lambda u: u.encode('utf-8'))
+    for username in ('kalkayan', 'jberkus', 'élan', '1234'):
+        assert username in index
+    for username in ('someone', 'intruder', 'jberku', 'kalkayann', '', None):
+        assert username not in index
+
+
+def test_voters_index_large(tmpdir):
+    usernames = ['user-{}'.format(i) for i in range(20000)]
+    index = VoterIndex.write(str(tmpdir / 'voters.idx'), usernames)
+
+    assert len(index) == 20000
+    assert all(u in index for u in usernames[::997])
+    assert 'user-20000' not in index
+
+
+def test_voters_index_empty(tmpdir):
+    index = VoterIndex.write(str(tmpdir / 'voters.idx'), [])
+    assert len(index) == 0
+    assert 'kalkayan' not in index
+
+
+def test_voters_index_pickled_as_reference(tmpdir):
+    path = str(tmpdir / 'voters.idx')
+    index = VoterIndex.write(path, ['kalkayan'])
+
+    data = pickle.dumps(index)
+    assert b'kalkayan' not in data
+    assert pickle.loads(data) is index
+
+    # Replaced by a sync, mapped again.
+    VoterIndex.write(path, ['jberkus'])
+    assert 'jberkus' in pickle.loads(data)
+
+
+def test_voters_index_missing_or_invalid(tmpdir):
+    assert VoterIndex.open(str(tmpdir / 'missing.idx')) is None
+
+    (tmpdir / 'invalid.idx').write_binary(b'not an index')
+    with pytest.raises(ValueError):
+        VoterIndex.open(str(tmpdir / 'invalid.idx'))
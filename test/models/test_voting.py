@@ -0,0 +1,78 @@
+from datetime import datetime
+
+from elekto import SESSION
+from elekto.models.sql import Ballot, EligibleVoter
+from elekto.models.voting import has_voted, cast_ballots, ballot_of, revoke_ballots, voted_count, eligible_count, last_voted_at, not_voted
+from test.factories import ElectionFactory, VoterFactory, UserFactory
+
+
+def test_has_voted(client):
+    election = ElectionFactory.create(key='name_the_app')
+    other = ElectionFactory.create(key='2021---GB')
+    voter = UserFactory.create(username='kalkayan')
+    user = UserFactory.create(username='jberkus')
+    VoterFactory.create(election=election, user=voter)
+    VoterFactory.create(election=other, user=user)
+    SESSION.commit()
+
+    assert has_voted(SESSION, voter, election)
+    assert not has_voted(SESSION, user, election)
+    assert not has_voted(SESSION, voter, None)
+
+
+def test_revoke_ballots(client):
+    election = ElectionFactory.create(key='name_the_app')
+    other = ElectionFactory.create(key='2021---GB')
+    user = UserFactory.create(username='kalkayan')
+    voter = VoterFactory.create(election=election, user=user)
+    VoterFactory.create(election=other, user=user)
+    SESSION.commit()
+    cast_ballots(SESSION, election, 'v-1', {'e6n': 1, 'elekto': 2})
+    cast_ballots(SESSION, election, 'v-2', {'e6n': 2})
+    cast_ballots(SESSION, other, 'v-1', {'e6n': 1})
+    SESSION.commit()
+
+    assert revoke_ballots(SESSION, election, voter, 'v-1') == 2
+    SESSION.commit()
+
+    assert not has_voted(SESSION, user, election)
+    assert has_voted(SESSION, user, other)
+    assert sorted((b.election_id, b.voter) for b in SESSION.query(Ballot)) == sorted(
+        [(election.id, 'v-2'), (other.id, 'v-1')])
+
+def test_counts(client):
+    election = ElectionFactory.create(key='name_the_app')
+    assert (voted_count(SESSION, election), last_voted_at(SESSION, election)) == (0, None)
+
+    for username in ('kalkayan', 'jberkus', 'dims'):
+        SESSION.add(EligibleVoter(election_id=election.id, username=username))
+    for i, username in enumerate(('kalkayan', 'someone')):
+        VoterFactory.create(election=election, user=UserFactory.create(username=username),
+                            created_at=datetime(2023, 8, 2 + i))
+    SESSION.commit()
+
+    assert voted_count(SESSION, election) == 2
+    assert eligible_count(SESSION, election) == 3
+    assert last_voted_at(SESSION, election) == datetime(2023, 8, 3)
+    assert not_voted(SESSION, election) == ['dims', 'jberkus']
+
+
+def test_cast_ballots(client):
+    election = ElectionFactory.create(key='name_the_app')
+    SESSION.commit()
+
+    assert cast_ballots(SESSION, election, 'v-1', {'e6n': 1, 'elekto': 2, 'delectus': 100000000}) == 2
+    # a ballot of no opinion only keeps one row, the voter is counted
+    assert cast_ballots(SESSION, election, 'v-2', {'e6n': 100000000, 'elekto': 100000000}) == 1
+    SESSION.commit()
+
+    ballots = SESSION.query(Ballot).filter_by(election_id=election.id).order_by(Ballot.rank)
+    assert [(b.voter, b.candidate, b.rank) for b in ballots] == [
+        ('v-1', 'e6n', 1), ('v-1', 'elekto', 2), ('v-2', 'e6n', 100000000)]
+    assert len({b.id for b in ballots}) == 3
+
+    assert ballot_of(SESSION, election, 'v-1', ['delectus', 'e6n', 'elekto']) == [
+        {'candidate': 'e6n', 'rank': 1}, {'candidate': 'elekto', 'rank': 2},
+        {'candidate': 'delectus', 'rank': 'No opinion'}]
+    assert ballot_of(SESSION, election, 'v-2', ['e6n', 'elekto']) == [
+        {'candidate': 'e6n', 'rank': 'No opinion'}, {'candidate': 'elekto', 'rank': 'No opinion'}]
@@ -0,0 +1,72 @@
+import pytest
+
+from elekto.models.meta import Election
+from elekto.models.watcher import MetaWatcher
+
+
+@pytest.fixture
+def watcher(metadir):
+    watcher = MetaWatcher(interval=0.01, debounce=0.5)
+    watcher.files = watcher.scan()
+    Election.WATCHED = True
+    yield watcher
+    Election.WATCHED = False
+    Election.invalidate()
+
+
+def rename(metadir, old, new):
+    path = metadir / 'elections' / 'name_the_app' / 'election.yaml'
+    path.write_text(path.read_text('utf8').replace(old, new), 'utf8')
+
+
+def test_watcher_enabled():
+    assert MetaWatcher.enabled({'WATCH': True, 'DEPLOYMENT': 'local', 'STORE': 'fs'})
+    assert not MetaWatcher.enabled({'WATCH': False, 'DEPLOYMENT': 'local', 'STORE': 'fs'})
+    assert not MetaWatcher.enabled({'WATCH': True, 'DEPLOYMENT': 'sidecar', 'STORE': 'fs'})
+    assert not MetaWatcher.enabled({'WATCH': True, 'DEPLOYMENT': 'local', 'STORE': 'git'})
+
+
+def test_watcher_scan(watcher):
+    assert 'name_the_app/election.yaml' in watcher.files
+    assert '2021/GB/voters.yaml' in watcher.files
+
+
+def test_watcher_invalidates_changed_elections(watcher, metadir):
+    assert Election('name_the_app').election['name'] == 'Select The Name of the Application'
+    assert Election('2021---GB').election
+    rename(metadir, 'Select The Name', 'Pick The Name')
+
+    # The changes are not picked up until the directory is quiet.
+    assert watcher.poll(now=100.0) is None
+    assert Election('name_the_app').election['name'] == 'Select The Name of the Application'
+
+    rename(metadir, 'Pick The Name', 'Choose The Name')
+    assert watcher.poll(now=100.3) is None
+
+    assert watcher.poll(now=100.9) == {'name_the_app'}
+    assert Election('name_the_app').election['name'] == 'Choose The Name of the Application'
+    assert '2021---GB' in Election.CACHE
+    assert watcher.poll(now=102.0) is None
+
+
+def test_watcher_removed_candidate(watcher, metadir):
+    election = Election('name_the_app')
+    assert 'e6n' in [c['key'] for c in election.candidates()]
+
+    (metadir / 'elections' / 'name_the_app' / 'candidate-e6n.md').remove()
+    watcher.poll(now=100.0)
+    assert watcher.poll(now=101.0) == {'name_the_app'}
+
+
+def test_watcher_thread(metadir):
+    watcher = MetaWatcher(interval=0.01, debounce=0.0)
+    watcher.start()
+    assert Election.WATCHED
+    thread = watcher.thread
+
+    watcher.start()
+    assert watcher.thread is thread
+
+    watcher.stop()
+    assert not Election.WATCHED
+    assert watcher.thread is None
@@ -0,0 +1,95 @@
+import threading
+import time
+from unittest import mock
+
+import pytest
+
+from elekto import APP
+from elekto.models.worker import SyncWorker
+
+
+@pytest.fixture
+def worker(tmpdir):
+    APP.config['META']['PATH'] = str(tmpdir / 'meta')
+    return SyncWorker()
+
+
+@mock.patch('elekto.models.worker.os.path.exists')
+@mock.patch('elekto.models.worker.meta.Meta.clone')
+@mock.patch('elekto.models.worker.meta.Meta.sync')
+def test_worker_metadir_does_not_exist(sync_mock, clone_mock, path_exists_mock, worker):
+    path_exists_mock.return_value = False
+
+    worker.sync()
+    clone_mock.assert_called_once()
+    sync_mock.assert_called_once()
+
+
+@mock.patch('elekto.models.worker.os.path.exists')
+@mock.patch('elekto.models.worker.os.path.isdir')
+@mock.patch('elekto.models.worker.meta.Meta.clone')
+@mock.patch('elekto.models.worker.meta.Meta.sync')
+def test_worker_metadir_is_not_a_dir(sync_mock, clone_mock, path_isdir_mock, path_exists_mock, worker):
+    path_exists_mock.return_value = True
+    path_isdir_mock.return_value = False
+
+    worker.sync()
+    clone_mock.assert_called_once()
+    sync_mock.assert_called_once()
+
+
+@mock.patch('elekto.models.worker.os.path.exists')
+@mock.patch('elekto.models.worker.os.path.isdir')
+@mock.patch('elekto.models.worker.meta.Meta.pull')
+@mock.patch('elekto.models.worker.meta.Meta.sync')
+def test_worker_metadir_updates(sync_mock, pull_mock, path_isdir_mock, path_exists_mock, worker):
+    path_exists_mock.return_value = True
+    path_isdir_mock.return_value = True
+
+    worker.sync()
+    pull_mock.assert_called_once()
+    sync_mock.assert_called_once()
+
+
+def test_worker_coalesces_requests(worker):
+    """Requests made while a sync is running must be served by a single follow up sync."""
+    running = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def sync():
+        calls.append(time.time())
+        running.set()
+        release.wait(5)
+
+    with mock.patch.object(worker, 'sync', side_effect=sync):
+        worker.enqueue()
+        assert running.wait(5)
+        thread = worker.thread
+
+        for _ in range(5):
+            worker.enqueue()
+
+        release.set()
+        thread.join(5)
+
+    assert len(calls) == 2
+    assert worker.thread is None
+
+
+def test_worker_skips_covered_requests(worker):
+    """A sync started after the request, by any process, already covers it."""
+    with open(SyncWorker.lockfile(), 'w') as lock:
+        lock.write(str(time.time() + 60))
+
+    with mock.patch.object(worker, 'sync') as sync_mock:
+        worker.work(time.time())
+        assert not sync_mock.called
+
+
+def test_worker_sync_failure(worker):
+    with mock.patch.object(worker, 'sync', side_effect=Exception):
+        worker.work(time.time())
+
+    with open(SyncWorker.lockfile()) as lock:
+        assert lock.read() == ''